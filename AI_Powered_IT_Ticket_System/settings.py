@@ -81,6 +81,16 @@ DATABASES = {
     }
 }
 
+# Shared cache, e.g. redis://localhost:6379/1; without it each process uses its own local memory cache
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -181,8 +191,29 @@ EMAIL_ACCOUNTS = {
     }
 }
 
+# Mailboxes watched for new tickets, as account:folder pairs. Accounts other than
+# system/support read <ACCOUNT>_EMAIL_HOST_USER and <ACCOUNT>_EMAIL_HOST_PASSWORD
+EMAIL_MONITORED_MAILBOXES = [m.strip() for m in os.getenv('EMAIL_MONITORED_MAILBOXES', 'support:INBOX').split(',') if m.strip()]
+for _mailbox in EMAIL_MONITORED_MAILBOXES:
+    _account = _mailbox.split(':')[0]
+    EMAIL_ACCOUNTS.setdefault(_account, {
+        "EMAIL_HOST_USER": os.getenv(f'{_account.upper()}_EMAIL_HOST_USER'),
+        "EMAIL_HOST_PASSWORD": os.getenv(f'{_account.upper()}_EMAIL_HOST_PASSWORD'),
+    })
+
 EMAIL_IMAP_HOST = os.getenv('EMAIL_IMAP_HOST')
 EMAIL_IMAP_PORT = os.getenv('EMAIL_IMAP_PORT')
+EMAIL_IMAP_SSL = os.getenv('EMAIL_IMAP_SSL', 'True') == 'True'  # False for a local IMAP stand-in
+EMAIL_IMAP_IDLE = os.getenv('EMAIL_IMAP_IDLE', 'True') == 'True'  # push new mail with IMAP IDLE when the server supports it
+EMAIL_IMAP_IDLE_RENEW_SECONDS = int(os.getenv('EMAIL_IMAP_IDLE_RENEW_SECONDS', 540))  # re-issue IDLE before servers/NATs drop it
+EMAIL_POLL_INTERVAL = int(os.getenv('EMAIL_POLL_INTERVAL', 60))  # seconds between polls without IDLE
+EMAIL_FETCH_BATCH_SIZE = int(os.getenv('EMAIL_FETCH_BATCH_SIZE', 100))  # messages per IMAP FETCH/STORE round-trip
+EMAIL_PIPELINE_QUEUE_SIZE = int(os.getenv('EMAIL_PIPELINE_QUEUE_SIZE', 2))  # fetched batches buffered per mailbox before parsing
+EMAIL_PIPELINE_QUEUE_BYTES = int(os.getenv('EMAIL_PIPELINE_QUEUE_BYTES', 32 * 1024 * 1024))  # raw message bytes buffered per mailbox before parsing, 0 disables
+EMAIL_TRIAGE_BATCH_SIZE = int(os.getenv('EMAIL_TRIAGE_BATCH_SIZE', 64))  # emails per triage model call
+EMAIL_INGEST_MAX_ATTEMPTS = int(os.getenv('EMAIL_INGEST_MAX_ATTEMPTS', 3))  # failed sweeps before an email that keeps failing is dead-lettered
+EMAIL_MONITOR_STATUS_SECONDS = int(os.getenv('EMAIL_MONITOR_STATUS_SECONDS', 60))  # how often mail_monitor logs and publishes mailbox health
+EMAIL_BEAT_MONITORING = os.getenv('EMAIL_BEAT_MONITORING', 'False') == 'True'  # sweep mailboxes from Celery Beat instead of running mail_monitor
 
 # Site Configuration
 DEFAULT_SITE_SCHEME=os.getenv('DEFAULT_SITE_SCHEME','http')
@@ -193,6 +224,55 @@ SERVICENOW_INSTANCE = os.getenv('SERVICENOW_INSTANCE')
 SERVICENOW_USERNAME = os.getenv('SERVICENOW_USERNAME')
 SERVICENOW_PASSWORD = os.getenv('SERVICENOW_PASSWORD')
 SERVICENOW_SYSID = os.getenv('SERVICENOW_SYSID')
+SERVICENOW_BASE_URL = os.getenv('SERVICENOW_BASE_URL') or f"https://{SERVICENOW_INSTANCE}.service-now.com"
+SERVICENOW_POOL_SIZE = int(os.getenv('SERVICENOW_POOL_SIZE', 10))  # keep-alive connections per process
+SERVICENOW_CONNECT_TIMEOUT = float(os.getenv('SERVICENOW_CONNECT_TIMEOUT', 5))
+SERVICENOW_READ_TIMEOUT = float(os.getenv('SERVICENOW_READ_TIMEOUT', 30))
+SERVICENOW_MAX_RETRIES = int(os.getenv('SERVICENOW_MAX_RETRIES', 3))  # retries on 429/5xx and connection errors
+SERVICENOW_BACKOFF_BASE = float(os.getenv('SERVICENOW_BACKOFF_BASE', 0.5))
+SERVICENOW_BACKOFF_MAX = float(os.getenv('SERVICENOW_BACKOFF_MAX', 30))
+SERVICENOW_BREAKER_THRESHOLD = int(os.getenv('SERVICENOW_BREAKER_THRESHOLD', 5))  # consecutive failures before the circuit opens
+SERVICENOW_BREAKER_RESET_SECONDS = float(os.getenv('SERVICENOW_BREAKER_RESET_SECONDS', 60))
+SERVICENOW_SYNC_CHUNK_SIZE = int(os.getenv('SERVICENOW_SYNC_CHUNK_SIZE', 100))  # sys_ids per bulk status read
+SERVICENOW_SYNC_PAGE_SIZE = int(os.getenv('SERVICENOW_SYNC_PAGE_SIZE', 1000))  # rows per page for incremental sync
+SERVICENOW_SYNC_OVERLAP_SECONDS = int(os.getenv('SERVICENOW_SYNC_OVERLAP_SECONDS', 120))  # re-read window for clock skew
+SERVICENOW_BULK_CONCURRENCY = int(os.getenv('SERVICENOW_BULK_CONCURRENCY', 20))  # requests in flight for servicenow_drain
+SERVICENOW_BULK_RATE = float(os.getenv('SERVICENOW_BULK_RATE', 20))  # requests per second for servicenow_drain
+SERVICENOW_RATE_LIMIT_REDIS_URL = os.getenv('SERVICENOW_RATE_LIMIT_REDIS_URL', os.getenv('CELERY_BROKER_URL'))  # shared token buckets; unset or non-Redis disables limiting
+SERVICENOW_RATE_LIMIT = float(os.getenv('SERVICENOW_RATE_LIMIT', 20))  # requests per second per endpoint across all workers, 0 disables
+SERVICENOW_RATE_LIMIT_BURST = os.getenv('SERVICENOW_RATE_LIMIT_BURST')  # defaults to the rate
+SERVICENOW_RATE_LIMITS = os.getenv('SERVICENOW_RATE_LIMITS', '')  # per endpoint overrides, e.g. "incident=10:20,sys_user_group=2"
+SERVICENOW_RATE_LIMIT_MAX_WAIT = float(os.getenv('SERVICENOW_RATE_LIMIT_MAX_WAIT', 60))  # seconds before a call gives up on a token
+SERVICENOW_RETRY_BASE_SECONDS = int(os.getenv('SERVICENOW_RETRY_BASE_SECONDS', 60))  # backoff after the first failed attempt, doubled per attempt
+SERVICENOW_RETRY_MAX_SECONDS = int(os.getenv('SERVICENOW_RETRY_MAX_SECONDS', 3600))
+SERVICENOW_MAX_SYNC_ATTEMPTS = int(os.getenv('SERVICENOW_MAX_SYNC_ATTEMPTS', 8))  # then the ticket is dead-lettered
+SERVICENOW_LEASE_SECONDS = int(os.getenv('SERVICENOW_LEASE_SECONDS', 900))  # how long a queued/in-flight creation holds a ticket
+SERVICENOW_PENDING_GRACE_SECONDS = int(os.getenv('SERVICENOW_PENDING_GRACE_SECONDS', 120))  # new pending tickets are left to the outbox relay this long before the retry sweep takes them
+SERVICENOW_RETRY_BATCH_SIZE = int(os.getenv('SERVICENOW_RETRY_BATCH_SIZE', 500))  # tickets enqueued per retry sweep
+SERVICENOW_CREATE_MODE = os.getenv('SERVICENOW_CREATE_MODE', 'single')  # 'batch' creates queued incidents through the Batch API
+SERVICENOW_BATCH_SIZE = int(os.getenv('SERVICENOW_BATCH_SIZE', 50))  # incidents per Batch API request
+SERVICENOW_GROUP_CACHE_CHECK_SECONDS = int(os.getenv('SERVICENOW_GROUP_CACHE_CHECK_SECONDS', 5))  # how often processes check the cached assignment groups are current
+SERVICENOW_GROUP_CACHE_MAX_AGE = int(os.getenv('SERVICENOW_GROUP_CACHE_MAX_AGE', 300))  # reload regardless, for caches that are not shared between processes
+
+# AI Configuration
+AI_MODEL_DIR = Path(os.getenv('AI_MODEL_DIR', BASE_DIR / 'static' / 'data'))  # triage_ai.json manifest and versioned artifacts
+AI_MODEL_RELOAD_INTERVAL = float(os.getenv('AI_MODEL_RELOAD_INTERVAL', 30))  # seconds between manifest checks
+AI_EMBEDDING_BACKEND = os.getenv('AI_EMBEDDING_BACKEND', 'torch')  # 'torch' or 'onnx'
+AI_ONNX_MODEL_DIR = Path(os.getenv('AI_ONNX_MODEL_DIR', BASE_DIR / 'static' / 'data' / 'onnx'))
+AI_ONNX_MODEL_FILE = os.getenv('AI_ONNX_MODEL_FILE', 'onnx/model.onnx')
+AI_EMBEDDING_BATCH_SIZE = int(os.getenv('AI_EMBEDDING_BATCH_SIZE', 64))
+AI_EMBEDDING_CACHE_SIZE = int(os.getenv('AI_EMBEDDING_CACHE_SIZE', 2048))  # in-process LRU entries, 0 disables
+AI_EMBEDDING_CACHE_DIR = os.getenv('AI_EMBEDDING_CACHE_DIR')  # shared on-disk tier, unset disables
+AI_FEATURE_STORE_DIR = Path(os.getenv('AI_FEATURE_STORE_DIR', BASE_DIR / 'static' / 'data' / 'features'))
+AI_INFERENCE_SERVER = os.getenv('AI_INFERENCE_SERVER')  # host:port of ai_inference_server, unset runs in-process
+AI_INFERENCE_TIMEOUT = float(os.getenv('AI_INFERENCE_TIMEOUT', 5))  # connect timeout, added on top of the server's batch budget when waiting for a reply
+AI_INFERENCE_REQUEST_TIMEOUT = float(os.getenv('AI_INFERENCE_REQUEST_TIMEOUT', 30))  # seconds a request may wait on the server, shared by server and clients
+AI_INFERENCE_PER_TEXT_TIMEOUT = float(os.getenv('AI_INFERENCE_PER_TEXT_TIMEOUT', 0.05))  # extra seconds per text in a request
+
+# Ticket Configuration
+TICKET_ASYNC_TRIAGE = os.getenv('TICKET_ASYNC_TRIAGE', 'False') == 'True'  # classify web tickets in a Celery task
+TICKET_OUTBOX_BATCH_SIZE = int(os.getenv('TICKET_OUTBOX_BATCH_SIZE', 500))  # outbox rows published per relay pass
+TICKET_TRIAGE_TIMEOUT_SECONDS = int(os.getenv('TICKET_TRIAGE_TIMEOUT_SECONDS', 300))  # re-send a triage task that has not finished after this long
 
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
@@ -208,16 +288,21 @@ CELERY_BEAT_SCHEDULE = {
         "task": "servicenow.utils.task.sync_servicenow_ticket_statuses",
         "schedule": crontab(minute="*/10"),  # every 10 minutes
     },
-    "retry-servicenow-ticket-creation-every-10-min": {
+    "retry-servicenow-ticket-creation-every-01-min": {
         "task": "servicenow.utils.task.servicenow_ticket_retry",
-        "schedule": crontab(minute="*/10"),  # every 10 minutes
+        "schedule": crontab(minute="*"),  # every minute, only tickets whose backoff has elapsed
+    },
+    "relay-ticket-outbox-every-05-sec": {
+        "task": "tickets.utils.outbox.relay_ticket_outbox_task",
+        "schedule": 5.0,  # every 5 seconds
     },
     "check-email-replay-status-every-05-min": {
         "task": "tickets.utils.task.send_email_replay_with_ticket",
         "schedule": crontab(minute="*/5"),  # every 5 minutes
     },
-    "monitor-email-every-01-min": {
+}
+if EMAIL_BEAT_MONITORING:
+    CELERY_BEAT_SCHEDULE["monitor-email-every-01-min"] = {
         "task": "tickets.utils.emailmonitortask.email_monitoring",
         "schedule": crontab(minute="*/1"),  # every 1 minutes
-    },
-}
\ No newline at end of file
+    }
\ No newline at end of file
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sentence_transformers import SentenceTransformer
+from sklearn.metrics import accuracy_score
+from ai.utils.nlppreprocess import clean_texts
+from ai.utils.embeddings import EMBEDDING_MODEL_NAME
+from ai.views import load_category_model, load_priority_model
+
+QUANTIZATION_CONFIGS = ["arm64", "avx2", "avx512", "avx512_vnni"]
+
+
+class Command(BaseCommand):
+    help = 'Export the embedding model to ONNX, optionally int8 quantized, and check accuracy parity'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=str(settings.AI_ONNX_MODEL_DIR),
+                            help="Directory to save the ONNX model to")
+        parser.add_argument("--quantize", choices=QUANTIZATION_CONFIGS,
+                            help="Also export a dynamically int8 quantized model for this CPU target")
+        parser.add_argument("--check", action="store_true",
+                            help="Compare category/priority accuracy against the PyTorch encoder")
+        parser.add_argument("--tolerance", type=float, default=0.01,
+                            help="Maximum allowed accuracy drop for the parity check")
+        parser.add_argument("--sample", type=int, default=None,
+                            help="Only use the first N training rows for the parity check")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+
+        self.stdout.write("Exporting ONNX model...")
+        try:
+            model = SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+        except ImportError as e:
+            raise CommandError(
+                f"ONNX export needs optimum and onnxruntime: pip install 'optimum[onnxruntime]' ({e})"
+            )
+        model.save_pretrained(output)
+        model_file = "onnx/model.onnx"
+        self.stdout.write(self.style.SUCCESS(f"ONNX model saved to: {output}"))
+
+        if options["quantize"]:
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+
+            self.stdout.write(f"Quantizing to int8 ({options['quantize']})...")
+            export_dynamic_quantized_onnx_model(model, options["quantize"], output)
+            model_file = f"onnx/model_qint8_{options['quantize']}.onnx"
+            self.stdout.write(self.style.SUCCESS(f"Quantized model saved as: {model_file}"))
+
+        if options["check"]:
+            self.check_parity(output, model_file, options["tolerance"], options["sample"])
+
+        self.stdout.write(
+            f"Set AI_EMBEDDING_BACKEND='onnx', AI_ONNX_MODEL_DIR='{output}' "
+            f"and AI_ONNX_MODEL_FILE='{model_file}' to serve it."
+        )
+
+    def check_parity(self, output, model_file, tolerance, sample):
+        self.stdout.write("Loading dataset...")
+        df = pd.read_csv(settings.BASE_DIR / "static" / "data" / "ai_training_data.csv")
+        if sample:
+            df = df.head(sample)
+        texts = clean_texts(df["description"].tolist())
+
+        self.stdout.write("Encoding with PyTorch and ONNX...")
+        batch_size = settings.AI_EMBEDDING_BATCH_SIZE
+        torch_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        onnx_model = SentenceTransformer(output, backend="onnx", model_kwargs={"file_name": model_file})
+        X_torch = torch_model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        X_onnx = onnx_model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        similarity = float(np.mean(np.sum(X_torch * X_onnx, axis=1)))
+        self.stdout.write(f"Mean cosine similarity: {similarity:.4f}")
+
+        failed = False
+        for name, model, labels in [
+            ("Category", load_category_model(), df["category"]),
+            ("Priority", load_priority_model(), df["priority"]),
+        ]:
+            torch_acc = accuracy_score(labels, model.predict(X_torch))
+            onnx_acc = accuracy_score(labels, model.predict(X_onnx))
+            line = f"{name} accuracy: torch={torch_acc:.4f} onnx={onnx_acc:.4f} drop={torch_acc - onnx_acc:.4f}"
+            if torch_acc - onnx_acc > tolerance:
+                failed = True
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if failed:
+            raise CommandError(f"ONNX accuracy dropped by more than {tolerance}")
@@ -0,0 +1,58 @@
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ai.views import load_category_model, load_priority_model, local_triage_batch
+from ai.utils.embeddings import load_embedding_model
+from ai.utils.inferenceserver import InferenceServer, MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run the local AI inference server with dynamic micro-batching'
+
+    def add_arguments(self, parser):
+        default_address = getattr(settings, "AI_INFERENCE_SERVER", None) or "127.0.0.1:8765"
+        host, _, port = default_address.rpartition(":")
+        parser.add_argument("--host", default=host or "127.0.0.1")
+        parser.add_argument("--port", type=int, default=int(port))
+        parser.add_argument("--max-batch", type=int, default=getattr(settings, "AI_EMBEDDING_BATCH_SIZE", 64),
+                            help="Maximum number of texts per micro-batch")
+        parser.add_argument("--window-ms", type=float, default=10,
+                            help="How long to wait for a micro-batch to fill up")
+        parser.add_argument("--request-timeout", type=float,
+                            default=getattr(settings, "AI_INFERENCE_REQUEST_TIMEOUT", 30),
+                            help="Seconds a request may wait for its batch, before the per-text allowance")
+        parser.add_argument("--per-text-timeout", type=float,
+                            default=getattr(settings, "AI_INFERENCE_PER_TEXT_TIMEOUT", 0.05),
+                            help="Extra seconds allowed per text in a request")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Loading models...")
+        load_embedding_model()
+        load_category_model()
+        load_priority_model()
+
+        batcher = MicroBatcher(
+            local_triage_batch,
+            max_batch=options["max_batch"],
+            window_ms=options["window_ms"],
+        )
+        batcher.start()
+
+        address = (options["host"], options["port"])
+        with InferenceServer(
+            address,
+            batcher,
+            request_timeout=options["request_timeout"],
+            per_text_timeout=options["per_text_timeout"],
+        ) as server:
+            self.stdout.write(self.style.SUCCESS(
+                f"Inference server listening on {address[0]}:{address[1]} "
+                f"(max batch {options['max_batch']}, window {options['window_ms']}ms)"
+            ))
+            logger.info("Inference server started on %s:%s", *address)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping inference server...")
@@ -0,0 +1,97 @@
+import hashlib
+import joblib
+import numpy as np
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.multiclass import OneVsRestClassifier
+from ai.utils.featurestore import TRAIN_DATA_FILE, load_training_features
+from ai.utils.embeddings import embedding_model_id
+from ai.utils.modelregistry import artifact_name, prune_artifacts, write_manifest
+import warnings
+warnings.filterwarnings('ignore')
+
+
+class Command(BaseCommand):
+    help = 'Train the category and priority models on one embedding matrix and save them as one artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-dir", default=str(settings.AI_MODEL_DIR),
+                            help="Directory holding the versioned artifacts and the manifest")
+        parser.add_argument("--keep", type=int, default=3, help="Number of artifact versions to keep")
+
+    def handle(self, *args, **options):
+        df, X = load_training_features(log=self.stdout.write)
+        y_category = df["category"].to_numpy()
+        y_priority = df["priority"].to_numpy()
+
+        self.stdout.write("Stratified split...")
+        train_idx, test_idx = train_test_split(
+            np.arange(len(df)), test_size=0.2, random_state=42, stratify=y_priority
+        )
+
+        self.stdout.write("Training category model...")
+        category_clf = LogisticRegression(max_iter=1000)
+        category_clf.fit(X[train_idx], y_category[train_idx])
+
+        self.stdout.write("Training priority model...")
+        priority_clf = OneVsRestClassifier(
+            LogisticRegression(
+                max_iter=1000,
+                class_weight='balanced',
+                random_state=42,
+                solver='liblinear',
+            )
+        )
+        priority_clf.fit(X[train_idx], y_priority[train_idx])
+
+        self.stdout.write("Evaluating...")
+        metrics = {}
+        for name, clf, y in [
+            ("category", category_clf, y_category),
+            ("priority", priority_clf, y_priority),
+        ]:
+            preds = clf.predict(X[test_idx])
+            metrics[name] = {
+                "accuracy": accuracy_score(y[test_idx], preds),
+                "report": classification_report(y[test_idx], preds, output_dict=True, zero_division=0),
+            }
+            self.stdout.write(self.style.SUCCESS(f'{name.title()} Model Accuracy: {metrics[name]["accuracy"]:.4f}'))
+
+        trained_at = timezone.now()
+        with open(TRAIN_DATA_FILE, "rb") as f:
+            data_sha256 = hashlib.sha256(f.read()).hexdigest()
+
+        artifact = {
+            "version": trained_at.strftime("%Y%m%d%H%M%S"),
+            "category_model": category_clf,
+            "priority_model": priority_clf,
+            "labels": {
+                "category": [str(label) for label in category_clf.classes_],
+                "priority": [str(label) for label in priority_clf.classes_],
+            },
+            "metadata": {
+                "trained_at": trained_at.isoformat(),
+                "embedding_model": embedding_model_id(),
+                "data_file": str(TRAIN_DATA_FILE),
+                "data_sha256": data_sha256,
+                "rows": len(df),
+                "train_rows": len(train_idx),
+                "test_rows": len(test_idx),
+            },
+            "metrics": metrics,
+        }
+
+        self.stdout.write("Saving model...")
+        # save the versioned artifact first, then flip the manifest so workers hot-reload it
+        model_dir = Path(options["model_dir"])
+        model_dir.mkdir(parents=True, exist_ok=True)
+        artifact_file = artifact_name(artifact["version"])
+        joblib.dump(artifact, model_dir / artifact_file)
+        write_manifest(model_dir, artifact_file, artifact["version"])
+        prune_artifacts(model_dir, options["keep"])
+        self.stdout.write(self.style.SUCCESS(f'Triage model {artifact["version"]} saved to: {model_dir / artifact_file}'))
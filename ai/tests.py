@@ -1,3 +1,118 @@
-from django.test import TestCase
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from ai.utils import featurestore
+from ai.utils.embeddingcache import DiskEmbeddingCache
+from ai.utils.nlppreprocess import clean_text
 
-# Create your tests here.
+DIM = 4
+
+
+def vector(seed):
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+class DiskEmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_round_trip_across_instances(self):
+        writer = DiskEmbeddingCache(self.directory, DIM)
+        writer.put("a", vector(1))
+        writer.put("b", vector(2))
+
+        reader = DiskEmbeddingCache(self.directory, DIM)
+        self.assertEqual(len(reader), 2)
+        np.testing.assert_array_equal(reader.get("a"), vector(1))
+        np.testing.assert_array_equal(reader.get("b"), vector(2))
+        self.assertIsNone(reader.get("c"))
+
+    def test_sees_rows_written_after_opening(self):
+        reader = DiskEmbeddingCache(self.directory, DIM)
+        self.assertIsNone(reader.get("a"))
+        DiskEmbeddingCache(self.directory, DIM).put("a", vector(1))
+        np.testing.assert_array_equal(reader.get("a"), vector(1))
+
+    def test_interrupted_write_does_not_shift_later_rows(self):
+        cache = DiskEmbeddingCache(self.directory, DIM)
+        cache.put("a", vector(1))
+        # a writer died after appending half a row and part of its index line
+        with open(cache.data_path, "ab") as f:
+            f.write(vector(9).tobytes()[:DIM * 2])
+        with open(cache.index_path, "ab") as f:
+            f.write(b"torn")
+
+        cache = DiskEmbeddingCache(self.directory, DIM)
+        cache.put("b", vector(2))
+        self.assertEqual(os.path.getsize(cache.data_path), 2 * DIM * 4)
+        reader = DiskEmbeddingCache(self.directory, DIM)
+        np.testing.assert_array_equal(reader.get("a"), vector(1))
+        np.testing.assert_array_equal(reader.get("b"), vector(2))
+
+    def test_respects_max_rows(self):
+        cache = DiskEmbeddingCache(self.directory, DIM, max_rows=1)
+        cache.put("a", vector(1))
+        cache.put("b", vector(2))
+        self.assertIsNone(cache.get("b"))
+
+
+class FakeEncoder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.vstack([vector(len(text)) for text in texts])
+
+
+class FeatureStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(AI_FEATURE_STORE_DIR=Path(directory.name), AI_EMBEDDING_BACKEND="torch")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.encoder = FakeEncoder()
+        patcher = mock.patch("ai.utils.featurestore.load_embedding_model", return_value=self.encoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_new_rows_are_encoded(self):
+        first = featurestore.encode_corpus(["vpn down", "printer jam", "vpn down"], log=lambda message: None)
+        self.assertEqual(self.encoder.encoded, ["vpn down", "printer jam"])
+        np.testing.assert_array_equal(first[0], first[2])
+
+        self.encoder.encoded.clear()
+        second = featurestore.encode_corpus(["printer jam", "disk full"], log=lambda message: None)
+        self.assertEqual(self.encoder.encoded, ["disk full"])
+        np.testing.assert_array_equal(second[0], first[1])
+
+    def test_store_round_trip(self):
+        _, path = featurestore._store_path("model")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        featurestore._save_atomic(path, np.vstack([vector(1), vector(2)]), np.array(["a", "b"]))
+        stored = featurestore._load_store(path)
+        self.assertEqual(list(stored), ["a", "b"])
+        np.testing.assert_array_equal(stored["b"], vector(2))
+
+    def test_mismatched_store_is_rebuilt(self):
+        _, path = featurestore._store_path("model")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        featurestore._save_atomic(path, np.vstack([vector(1), vector(2)]), np.array(["a"]))
+        with self.assertLogs("ai.utils.featurestore", "WARNING"):
+            self.assertEqual(featurestore._load_store(path), {})
+
+
+@mock.patch("ai.utils.nlppreprocess.lemmatize", lambda word: word)
+@mock.patch("ai.utils.nlppreprocess.get_stop_words", return_value=frozenset({"i", "not", "me"}))
+class CleanTextTests(SimpleTestCase):
+    def test_splits_contractions_like_word_tokenize(self, stop_words):
+        self.assertEqual(clean_text("I cannot log in, gonna retry. Lemme know!"), "can log in gon na retry lem know")
+
+    def test_strips_urls_markup_and_punctuation(self, stop_words):
+        self.assertEqual(clean_text("See <b>https://example.com/x</b> VPN-error #42"), "see vpnerror")
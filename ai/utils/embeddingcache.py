@@ -0,0 +1,228 @@
+"""Content-addressed cache for sentence embeddings.
+
+Entries are keyed by a hash of the model id and the normalised text. Lookups go
+through a bounded in-process LRU tier first and then, when a cache directory is
+configured, through a persistent tier shared by web and Celery workers.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+# Collapse whitespace and case; the MiniLM tokenizer is uncased so this does not change the embedding
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def embedding_cache_key(text: str, model_id: str) -> str:
+    normalized = normalize_text(text)
+    return hashlib.sha256(f"{model_id}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class LRUEmbeddingCache:
+    """
+    Bounded in-process tier. The least recently used entry is evicted first.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, key, embedding):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskEmbeddingCache:
+    """
+    Persistent tier: a memory-mapped float32 matrix plus an offset index.
+
+    embeddings.f32 holds one row per entry and embeddings.idx holds one
+    "key row" line per entry. Writers append the row before its index line under
+    a file lock, so readers in other processes never see an entry that points
+    past the end of the matrix. A write interrupted between the two leaves an
+    unreferenced row (or a partial one, truncated by the next writer) rather
+    than shifting the rows of later keys.
+    """
+
+    def __init__(self, directory, dim, max_rows=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.max_rows = max_rows
+        self.data_path = self.directory / "embeddings.f32"
+        self.index_path = self.directory / "embeddings.idx"
+        self._file_lock = FileLock(str(self.directory / "embeddings.lock"))
+        self._lock = threading.Lock()
+        self._offsets = {}
+        self._index_pos = 0
+        self._matrix = None
+        self._row_bytes = dim * np.dtype(np.float32).itemsize
+
+    def _refresh(self):
+        # pick up rows appended by other processes since the last read
+        if not self.index_path.exists():
+            return
+        if self.index_path.stat().st_size == self._index_pos:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_pos)
+            chunk = f.read()
+        # ignore a trailing partial line, it is re-read once complete
+        complete = chunk[: chunk.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            parts = line.split()
+            if len(parts) != 2 or not parts[1].isdigit():
+                # torn by a crashed writer, or written by an older version without offsets
+                continue
+            self._offsets.setdefault(parts[0].decode("ascii"), int(parts[1]))
+        self._index_pos += len(complete)
+        self._matrix = None
+
+    def _rows(self):
+        if self._matrix is None:
+            rows = os.path.getsize(self.data_path) // self._row_bytes if self.data_path.exists() else 0
+            if rows == 0:
+                return None
+            self._matrix = np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def get(self, key):
+        with self._lock:
+            self._refresh()
+            row = self._offsets.get(key)
+            if row is None:
+                return None
+            matrix = self._rows()
+            if matrix is None or row >= matrix.shape[0]:
+                return None
+            return np.array(matrix[row])
+
+    def put(self, key, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if embedding.shape != (self.dim,):
+            return
+        with self._lock, self._file_lock:
+            self._refresh()
+            if key in self._offsets:
+                return
+            if self.max_rows is not None and len(self._offsets) >= self.max_rows:
+                return
+            self._repair()
+            size = os.path.getsize(self.data_path) if self.data_path.exists() else 0
+            row = size // self._row_bytes
+            with open(self.data_path, "ab") as f:
+                f.write(embedding.tobytes())
+            with open(self.index_path, "ab") as f:
+                f.write(f"{key} {row}\n".encode("ascii"))
+            self._refresh()
+
+    def _repair(self):
+        # undo the tail of a write that crashed halfway; callers hold the file lock
+        if self.data_path.exists():
+            size = os.path.getsize(self.data_path)
+            if size % self._row_bytes:
+                os.truncate(self.data_path, size - size % self._row_bytes)
+                self._matrix = None
+        if self.index_path.exists() and self.index_path.stat().st_size:
+            with open(self.index_path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.seek(0)
+                    content = f.read()
+                    f.truncate(content.rfind(b"\n") + 1)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._offsets)
+
+
+class EmbeddingCache:
+    """
+    Two-tier lookup with hit/miss counters.
+    """
+
+    def __init__(self, model_id, maxsize, directory=None, dim=None, max_disk_rows=None):
+        self.model_id = model_id
+        self.memory = LRUEmbeddingCache(maxsize)
+        self.disk = DiskEmbeddingCache(directory, dim, max_disk_rows) if directory else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        return embedding_cache_key(text, self.model_id)
+
+    def get(self, text):
+        key = self.key(text)
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            self._count("hits")
+            return embedding
+
+        if self.disk is not None:
+            try:
+                embedding = self.disk.get(key)
+            except Exception:
+                logger.exception("Embedding disk cache read failed")
+                embedding = None
+            if embedding is not None:
+                embedding.setflags(write=False)
+                self.memory.put(key, embedding)
+                self._count("disk_hits")
+                return embedding
+
+        self._count("misses")
+        return None
+
+    def put(self, text, embedding):
+        key = self.key(text)
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        self.memory.put(key, embedding)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, embedding)
+            except Exception:
+                logger.exception("Embedding disk cache write failed")
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+        }
@@ -1,15 +1,96 @@
-from sentence_transformers import SentenceTransformer
+from django.conf import settings
 import numpy as np
+from ai.utils.embeddingcache import EmbeddingCache
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
 
 # Load once (singleton)
 _model = None
+_cache = None
+
+def embedding_model_id() -> str:
+    """
+    Identifies the configured encoder, so cached vectors from different backends never mix.
+    """
+    if getattr(settings, "AI_EMBEDDING_BACKEND", "torch") == "onnx":
+        return f"{EMBEDDING_MODEL_NAME}:onnx:{settings.AI_ONNX_MODEL_FILE}"
+    return EMBEDDING_MODEL_NAME
+
+def load_onnx_embedding_model(model_file=None):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(
+        str(settings.AI_ONNX_MODEL_DIR),
+        backend="onnx",
+        model_kwargs={"file_name": model_file or settings.AI_ONNX_MODEL_FILE},
+    )
 
 def load_embedding_model():
     global _model
     if _model is None:
-        _model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        # imported here so importing this module does not pull in torch
+        from sentence_transformers import SentenceTransformer
+
+        if getattr(settings, "AI_EMBEDDING_BACKEND", "torch") == "onnx":
+            _model = load_onnx_embedding_model()
+        else:
+            _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
     return _model
 
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(
+            model_id=embedding_model_id(),
+            maxsize=getattr(settings, "AI_EMBEDDING_CACHE_SIZE", 2048),
+            directory=getattr(settings, "AI_EMBEDDING_CACHE_DIR", None),
+            dim=EMBEDDING_DIM,
+            max_disk_rows=getattr(settings, "AI_EMBEDDING_CACHE_DISK_MAX_ROWS", None),
+        )
+    return _cache
+
 def get_embedding(text: str) -> np.ndarray:
-    model = load_embedding_model()
-    return model.encode(text, normalize_embeddings=True)
\ No newline at end of file
+    cache = get_embedding_cache()
+    embedding = cache.get(text)
+    if embedding is None:
+        model = load_embedding_model()
+        embedding = model.encode(text, normalize_embeddings=True)
+        cache.put(text, embedding)
+    return embedding
+
+def get_embeddings(texts, batch_size=None) -> np.ndarray:
+    """
+    Encode a list of texts in batched forward passes.
+    Cached texts are served from the embedding cache and only misses are encoded.
+    Returns a (len(texts), dim) matrix in input order.
+    """
+    texts = list(texts)
+    if batch_size is None:
+        batch_size = getattr(settings, "AI_EMBEDDING_BATCH_SIZE", 64)
+
+    cache = get_embedding_cache()
+    embeddings = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    missing = {}
+    for i, text in enumerate(texts):
+        embedding = cache.get(text)
+        if embedding is None:
+            missing.setdefault(text, []).append(i)
+        else:
+            embeddings[i] = embedding
+
+    if missing:
+        model = load_embedding_model()
+        encoded = model.encode(
+            list(missing),
+            batch_size=batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+        for (text, rows), embedding in zip(missing.items(), encoded):
+            embeddings[rows] = embedding
+            cache.put(text, embedding)
+    return embeddings
+
+def embedding_cache_stats() -> dict:
+    return get_embedding_cache().stats()
@@ -0,0 +1,114 @@
+"""Precomputed embeddings for the training corpus.
+
+Rows are keyed by a hash of their cleaned text and stored per encoder as one .npz
+file holding the matrix and its row keys, so a retrain only encodes new or changed rows.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from django.conf import settings
+from ai.utils.nlppreprocess import clean_texts
+from ai.utils.embeddings import embedding_model_id, load_embedding_model
+
+logger = logging.getLogger(__name__)
+
+TRAIN_DATA_FILE = settings.BASE_DIR / "static" / "data" / "ai_training_data.csv"
+
+
+def row_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _store_path(model_id):
+    directory = Path(getattr(settings, "AI_FEATURE_STORE_DIR", settings.BASE_DIR / "static" / "data" / "features"))
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_id)
+    return directory, directory / f"{name}.npz"
+
+
+def _save_atomic(path, matrix, keys):
+    # matrix and keys go in one file and one rename, so they can never come from different runs
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, matrix=matrix, keys=keys)
+    os.replace(tmp_path, path)
+
+
+def _load_store(path):
+    if not path.exists():
+        return {}
+    try:
+        with np.load(path) as store:
+            matrix, keys = store["matrix"], store["keys"]
+    except Exception as e:
+        logger.warning(f"Feature store {path} is unreadable, re-encoding: {e}")
+        return {}
+    if matrix.ndim != 2 or matrix.shape[0] != keys.shape[0]:
+        logger.warning(f"Feature store {path} has {matrix.shape[0]} rows for {keys.shape[0]} keys, re-encoding")
+        return {}
+    return {key: matrix[i] for i, key in enumerate(keys.tolist())}
+
+
+def encode_corpus(texts, batch_size=None, log=None) -> np.ndarray:
+    """
+    Returns a (len(texts), dim) embedding matrix for the corpus.
+    Only rows missing from the store are encoded, in large batches.
+    """
+    texts = list(texts)
+    log = log or logger.info
+    model_id = embedding_model_id()
+    directory, store_path = _store_path(model_id)
+    stored = _load_store(store_path)
+
+    keys = [row_key(text) for text in texts]
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in stored and key not in missing:
+            missing[key] = text
+    cached = sum(1 for key in keys if key in stored)
+    log(f"Feature store: {cached} rows cached, {len(missing)} unique rows to encode")
+
+    if missing:
+        if batch_size is None:
+            batch_size = max(getattr(settings, "AI_EMBEDDING_BATCH_SIZE", 64), 256)
+        encoded = load_embedding_model().encode(
+            list(missing.values()),
+            batch_size=batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+        stored.update(zip(missing.keys(), encoded))
+
+    X = np.vstack([stored[key] for key in keys]).astype(np.float32) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    if missing:
+        # keep only the rows of the current corpus so the store does not grow without bound
+        unique_keys = list(dict.fromkeys(keys))
+        directory.mkdir(parents=True, exist_ok=True)
+        _save_atomic(
+            store_path,
+            np.vstack([stored[key] for key in unique_keys]).astype(np.float32),
+            np.array(unique_keys),
+        )
+        log(f"Feature store saved to: {store_path}")
+    return X
+
+
+def load_training_features(log=None):
+    """
+    Loads the training CSV, cleans the descriptions and returns (df, X).
+    """
+    log = log or logger.info
+    log("Loading dataset...")
+    df = pd.read_csv(TRAIN_DATA_FILE)
+
+    log("Cleaning text...")
+    df["clean_text"] = clean_texts(df["description"].tolist())
+
+    log("Generating embeddings...")
+    X = encode_corpus(df["clean_text"].tolist(), log=log)
+    return df, X
@@ -0,0 +1,79 @@
+"""Thin client for the local inference server (see ai_inference_server)."""
+
+import json
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceServerUnavailable(Exception):
+    pass
+
+
+class InferenceClient:
+    """
+    Keeps one connection per thread and reconnects on failure. After a failed
+    call the server is treated as unavailable for retry_after seconds, so callers
+    fall back to in-process inference without paying the timeout on every request.
+
+    timeout bounds connecting. Waiting for a reply is bounded by the server's own
+    budget for the batch (request_timeout plus per_text_timeout per text) plus
+    timeout, so a slow batch gets the server's error reply instead of a client
+    timeout, and large batches get proportionally longer.
+    """
+
+    def __init__(self, address, timeout=5, retry_after=30, request_timeout=30, per_text_timeout=0.05):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.request_timeout = request_timeout
+        self.per_text_timeout = per_text_timeout
+        self._local = threading.local()
+        self._unavailable_until = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+        return conn
+
+    def reply_timeout(self, count):
+        return self.request_timeout + self.per_text_timeout * count + self.timeout
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def triage_batch(self, texts):
+        if time.monotonic() < self._unavailable_until:
+            raise InferenceServerUnavailable(f"Inference server {self.address} marked unavailable")
+
+        try:
+            texts = list(texts)
+            sock, reader = self._connection()
+            sock.settimeout(self.reply_timeout(len(texts)))
+            sock.sendall(json.dumps({"texts": texts}).encode("utf-8") + b"\n")
+            line = reader.readline()
+            if not line:
+                raise ConnectionError("Inference server closed the connection")
+            response = json.loads(line)
+        except (OSError, ValueError) as e:
+            self._close()
+            self._unavailable_until = time.monotonic() + self.retry_after
+            raise InferenceServerUnavailable(str(e)) from e
+
+        if "error" in response:
+            raise InferenceServerUnavailable(response["error"])
+        return response["results"]
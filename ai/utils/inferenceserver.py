@@ -0,0 +1,120 @@
+"""Local inference service holding a single copy of the triage models.
+
+Clients send newline-delimited JSON requests ({"texts": [...]}) over TCP and get
+back {"results": [...]} or {"error": "..."}. Requests arriving within a short
+window are merged into one micro-batch so concurrent callers share encoder
+forward passes.
+"""
+
+import json
+import logging
+import queue
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests and runs them through triage_fn in batches of at
+    most max_batch texts, waiting at most window_ms for a batch to fill up.
+    """
+
+    def __init__(self, triage_fn, max_batch=64, window_ms=10):
+        self.triage_fn = triage_fn
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="triage-batcher", daemon=True)
+        self.batches = 0
+        self.texts = 0
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, texts, timeout=None):
+        request = _PendingRequest(texts)
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for triage batch")
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                results = self.triage_fn(texts)
+            except Exception as e:
+                logger.exception("Triage batch of %d texts failed", len(texts))
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            logger.debug("Triaged micro-batch: %d requests, %d texts", len(batch), len(texts))
+            offset = 0
+            for request in batch:
+                request.results = results[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+                request.done.set()
+
+
+class _TriageRequestHandler(socketserver.StreamRequestHandler):
+    # one persistent connection per client thread, one JSON document per line
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                texts = [str(text) for text in request["texts"]]
+                results = self.server.batcher.submit(texts, timeout=self.server.batch_timeout(len(texts)))
+                response = {"results": results}
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class InferenceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, batcher, request_timeout=30, per_text_timeout=0.05):
+        super().__init__(address, _TriageRequestHandler)
+        self.batcher = batcher
+        self.request_timeout = request_timeout
+        self.per_text_timeout = per_text_timeout
+
+    def batch_timeout(self, count):
+        # a request is encoded as one batch, so its budget grows with its size
+        return self.request_timeout + self.per_text_timeout * count
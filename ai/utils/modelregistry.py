@@ -0,0 +1,128 @@
+"""Versioned triage model artifacts with a manifest pointer and background hot-reload.
+
+ai_train writes each artifact as triage_ai-<version>.pkl and then atomically
+replaces triage_ai.json, whose "current" key names the artifact to serve.
+Workers stat the manifest at most once per check interval; when its mtime
+changes the new artifact is loaded on a background thread and swapped in with a
+single reference assignment, so in-flight predictions keep the models they started with.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import joblib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "triage_ai.json"
+ARTIFACT_PREFIX = "triage_ai-"
+
+
+def artifact_name(version):
+    return f"{ARTIFACT_PREFIX}{version}.pkl"
+
+
+def write_manifest(model_dir, artifact_file, version):
+    model_dir = Path(model_dir)
+    manifest_path = model_dir / MANIFEST_NAME
+    tmp_path = model_dir / f"{MANIFEST_NAME}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"current": artifact_file, "version": version}, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def read_manifest(model_dir):
+    manifest_path = Path(model_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def prune_artifacts(model_dir, keep):
+    """
+    Deletes all but the newest `keep` versioned artifacts, never the current one.
+    """
+    manifest = read_manifest(model_dir) or {}
+    artifacts = sorted(Path(model_dir).glob(f"{ARTIFACT_PREFIX}*.pkl"), reverse=True)
+    for path in artifacts[keep:]:
+        if path.name != manifest.get("current"):
+            path.unlink(missing_ok=True)
+
+
+class ModelRegistry:
+    """
+    Holds the currently served artifact. legacy_loader is used when no manifest
+    exists; its models are loaded once and only replaced when a manifest appears.
+    """
+
+    def __init__(self, model_dir, legacy_loader=None, check_interval=30):
+        self.model_dir = Path(model_dir)
+        self.legacy_loader = legacy_loader
+        self.check_interval = check_interval
+        self._current = None
+        self._manifest_mtime = None
+        self._next_check = 0
+        self._load_lock = threading.Lock()
+        self._reloading = False
+
+    def _manifest_stat(self):
+        try:
+            return (self.model_dir / MANIFEST_NAME).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self, mtime):
+        manifest = read_manifest(self.model_dir)
+        if manifest is None:
+            if self.legacy_loader is None:
+                raise FileNotFoundError(f"No model manifest in {self.model_dir}")
+            artifact = self.legacy_loader()
+        else:
+            artifact = joblib.load(self.model_dir / manifest["current"])
+        self._current = artifact
+        self._manifest_mtime = mtime
+        logger.info(f"Loaded triage model version {artifact.get('version', 'legacy')}")
+        return artifact
+
+    def _reload_in_background(self, mtime):
+        try:
+            self._load(mtime)
+        except Exception:
+            # keep serving the previous models, retry on the next check
+            logger.exception("Triage model reload failed")
+        finally:
+            self._reloading = False
+
+    def get(self):
+        current = self._current
+        if current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._next_check = time.monotonic() + self.check_interval
+                    return self._load(self._manifest_stat())
+                return self._current
+
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            mtime = self._manifest_stat()
+            if mtime is not None and mtime != self._manifest_mtime:
+                with self._load_lock:
+                    if not self._reloading:
+                        self._reloading = True
+                        threading.Thread(
+                            target=self._reload_in_background,
+                            args=(mtime,),
+                            name="triage-model-reload",
+                            daemon=True,
+                        ).start()
+        return current
+
+    @property
+    def version(self):
+        current = self._current
+        return current.get("version") if current else None
@@ -1,27 +1,66 @@
 import re
-import string
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+import threading
+from functools import lru_cache
 
-# Download required NLTK data with correct paths
+# NLTK data needed by the pipeline; checked lazily on first use instead of at import
 required_downloads = {
-    'punkt': 'tokenizers/punkt',
-    'punkt_tab': 'tokenizers/punkt_tab', 
     'stopwords': 'corpora/stopwords',
     'wordnet': 'corpora/wordnet'
 }
 
-for name, path in required_downloads.items():
-    try:
-        nltk.data.find(path)
-    except LookupError:
-        print(f"Downloading {name}...")
-        nltk.download(name)
+_nltk_lock = threading.Lock()
+_nltk_ready = False
 
-# Initialize tools
-lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words("english"))
+URL_HTML_RE = re.compile(r"http\S+|www\S+|<.*?>")
+NON_ALPHA_RE = re.compile(r"[^a-z\s]")  # keep only alphabets
+
+# contractions nltk.word_tokenize splits even without punctuation (its
+# MacIntyre contraction rules; the others need an apostrophe, which is stripped)
+SPLIT_CONTRACTIONS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+
+
+def ensure_nltk_data():
+    global _nltk_ready
+    if _nltk_ready:
+        return
+    with _nltk_lock:
+        if _nltk_ready:
+            return
+        import nltk
+        for name, path in required_downloads.items():
+            try:
+                nltk.data.find(path)
+            except LookupError:
+                print(f"Downloading {name}...")
+                nltk.download(name)
+        _nltk_ready = True
+
+
+@lru_cache(maxsize=1)
+def get_stop_words():
+    ensure_nltk_data()
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words("english"))
+
+
+@lru_cache(maxsize=1)
+def get_lemmatizer():
+    ensure_nltk_data()
+    from nltk.stem import WordNetLemmatizer
+    return WordNetLemmatizer()
+
+
+# Vocabulary is small and repetitive, so each word is lemmatized once per process
+@lru_cache(maxsize=100_000)
+def lemmatize(word):
+    return get_lemmatizer().lemmatize(word)
 
 
 def clean_text(text):
@@ -30,19 +69,36 @@ def clean_text(text):
     Removes special characters, converts to lowercase,
     removes stopwords, and lemmatizes words.
     """
-    
+    stop_words = get_stop_words()
+
     # Lowercase
     text = text.lower()
-    
+
     # Remove URLs, HTML tags, and special characters
-    text = re.sub(r"http\S+|www\S+|<.*?>", "", text)
-    text = re.sub(r"[^a-z\s]", "", text)  # keep only alphabets
-    
-    # Tokenize
-    words = nltk.word_tokenize(text)
-    
+    text = URL_HTML_RE.sub("", text)
+    text = NON_ALPHA_RE.sub("", text)
+
+    # Tokenize: only letters and whitespace are left, so splitting on whitespace
+    # and splitting the contractions above gives the same tokens as
+    # nltk.word_tokenize without the punkt models
+    words = []
+    for word in text.split():
+        words.extend(SPLIT_CONTRACTIONS.get(word, (word,)))
+
     # Remove stopwords & lemmatize
-    words = [lemmatizer.lemmatize(w) for w in words if w not in stop_words]
-    
+    words = [lemmatize(w) for w in words if w not in stop_words]
+
     # Join back into a single string
     return " ".join(words)
+
+
+def clean_texts(texts):
+    """
+    Batch version of clean_text. Duplicate texts are only cleaned once.
+    """
+    texts = list(texts)
+    cleaned = {}
+    for text in texts:
+        if text not in cleaned:
+            cleaned[text] = clean_text(text)
+    return [cleaned[text] for text in texts]
@@ -1,20 +1,46 @@
+import logging
 import joblib
+import numpy as np
 from pathlib import Path
-from ai.utils.embeddings import get_embedding
+from ai.utils.embeddings import get_embedding, get_embeddings
+from ai.utils.inferenceclient import InferenceClient, InferenceServerUnavailable
+from ai.utils.modelregistry import ModelRegistry
 from django.conf import settings
 
-AI_MODEL_PATH  = settings.BASE_DIR / "static" / "data"
-CATEGORY_MODEL = AI_MODEL_PATH / "category_ai.pkl"
-PRIORITY_MODEL = AI_MODEL_PATH / "priority_ai.pkl"
+logger = logging.getLogger(__name__)
 
-category_model = None
-priority_model = None
+AI_MODEL_PATH  = settings.AI_MODEL_DIR
+LEGACY_MODEL_PATH = settings.BASE_DIR / "static" / "data"
+CATEGORY_MODEL = LEGACY_MODEL_PATH / "category_ai.pkl"
+PRIORITY_MODEL = LEGACY_MODEL_PATH / "priority_ai.pkl"
+
+inference_client = None
+
+def load_legacy_models():
+    """
+    Loads the separately pickled models used before versioned artifacts existed.
+    """
+    return {
+        "version": None,
+        "category_model": joblib.load(CATEGORY_MODEL),
+        "priority_model": joblib.load(PRIORITY_MODEL),
+    }
+
+model_registry = ModelRegistry(
+    AI_MODEL_PATH,
+    legacy_loader=load_legacy_models,
+    check_interval=getattr(settings, "AI_MODEL_RELOAD_INTERVAL", 30),
+)
+
+def load_models() -> dict:
+    """
+    Returns the currently served artifact. Take one snapshot per prediction so both
+    heads always come from the same model version.
+    """
+    return model_registry.get()
 
 def load_category_model():
-    global category_model
-    if category_model is None:
-        category_model = joblib.load(CATEGORY_MODEL)
-    return category_model
+    return load_models()["category_model"]
 
 def predict_category(text: str) -> str:
     model = load_category_model()
@@ -29,10 +55,7 @@ def predict_category_confidence(text: str):
     return float(probs[idx])
 
 def load_priority_model():
-    global priority_model
-    if priority_model is None:
-        priority_model = joblib.load(PRIORITY_MODEL)
-    return priority_model
+    return load_models()["priority_model"]
 
 def predict_priority(text: str) -> str:
     model = load_priority_model()
@@ -45,3 +68,80 @@ def predict_priority_confidence(text: str):
     probs = model.predict_proba([embedding])[0]
     idx = probs.argmax()
     return float(probs[idx])
+
+def _predict_with_confidence(model, embeddings):
+    probs = model.predict_proba(embeddings)
+    idx = probs.argmax(axis=1)
+    labels = model.classes_[idx]
+    confidences = probs[np.arange(len(idx)), idx]
+    return [str(label) for label in labels], [float(c) for c in confidences]
+
+def _triage_embeddings(embeddings) -> list[dict]:
+    models = load_models()
+    categories, category_confidences = _predict_with_confidence(models["category_model"], embeddings)
+    priorities, priority_confidences = _predict_with_confidence(models["priority_model"], embeddings)
+    return [
+        {
+            "category": category,
+            "category_confidence": category_confidence,
+            "priority": priority,
+            "priority_confidence": priority_confidence,
+        }
+        for category, category_confidence, priority, priority_confidence in zip(
+            categories, category_confidences, priorities, priority_confidences
+        )
+    ]
+
+def get_inference_client():
+    global inference_client
+    address = getattr(settings, "AI_INFERENCE_SERVER", None)
+    if not address:
+        return None
+    if inference_client is None:
+        inference_client = InferenceClient(
+            address,
+            timeout=getattr(settings, "AI_INFERENCE_TIMEOUT", 5),
+            request_timeout=getattr(settings, "AI_INFERENCE_REQUEST_TIMEOUT", 30),
+            per_text_timeout=getattr(settings, "AI_INFERENCE_PER_TEXT_TIMEOUT", 0.05),
+        )
+    return inference_client
+
+def triage(text: str) -> dict:
+    """
+    Predict category and priority for a ticket text.
+    The text is encoded once and the embedding is shared by both models.
+    """
+    client = get_inference_client()
+    if client is not None:
+        return triage_batch([text])[0]
+    embedding = get_embedding(text)
+    return _triage_embeddings(np.asarray([embedding]))[0]
+
+def triage_batch(texts, batch_size=None) -> list[dict]:
+    """
+    Predict category and priority for many ticket texts at once.
+    Uses the inference server when AI_INFERENCE_SERVER is set and falls back to
+    in-process inference if it cannot be reached.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    client = get_inference_client()
+    if client is not None:
+        try:
+            return client.triage_batch(texts)
+        except InferenceServerUnavailable as e:
+            logger.warning(f"Inference server unavailable, triaging in-process: {e}")
+    return local_triage_batch(texts, batch_size=batch_size)
+
+def local_triage_batch(texts, batch_size=None) -> list[dict]:
+    """
+    In-process batch triage.
+    Runs one batched encode and one predict_proba per model over the whole matrix,
+    returning one result per text in input order.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    embeddings = get_embeddings(texts, batch_size=batch_size)
+    return _triage_embeddings(embeddings)
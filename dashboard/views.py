@@ -48,7 +48,7 @@ def admin_dashboard(request):
         ).count()
         snow_synced = Ticket.objects.filter(ticket_creation_status="created").count()
 
-        failed_tickets = Ticket.objects.filter(ticket_creation_status="failed").count()
+        failed_tickets = Ticket.objects.filter(ticket_creation_status__in=["failed", "dead_letter"]).count()
 
         pending_tickets = Ticket.objects.filter(ticket_creation_status="pending").count()
 
@@ -1,8 +1,13 @@
 from django.contrib import admin
-from servicenow.models import AssignmentGroup
+from servicenow.models import AssignmentGroup, SyncWatermark
 # from tickets.models import Ticket
 
 @admin.register(AssignmentGroup)
 class AssignmentGroupAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'servicenow_group_id')
     search_fields = ('name', 'category')
+
+
+@admin.register(SyncWatermark)
+class SyncWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_updated_on', 'updated_at')
@@ -0,0 +1,54 @@
+import asyncio
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from servicenow.utils.bulkengine import ServiceNowBulkEngine, drain_servicenow_queue
+from servicenow.utils.task import apply_servicenow_states, open_servicenow_tickets
+
+
+class Command(BaseCommand):
+    help = 'Create ServiceNow incidents for pending/failed tickets concurrently (asyncio engine)'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Maximum number of tickets to drain")
+        parser.add_argument("--batch-size", type=int, default=500, help="Tickets loaded and saved per batch")
+        parser.add_argument("--concurrency", type=int, default=None, help="Requests in flight at once")
+        parser.add_argument("--rate", type=float, default=None, help="Maximum requests per second")
+        parser.add_argument("--status", action="append", choices=["pending", "failed"],
+                            help="Ticket creation status to drain (repeatable, default pending and failed)")
+        parser.add_argument("--batch-api", action="store_true",
+                            help="Send SERVICENOW_BATCH_SIZE incidents per Batch API request instead of one POST each")
+        parser.add_argument("--sync-statuses", action="store_true",
+                            help="Also refresh the state of every open ServiceNow ticket")
+
+    def handle(self, *args, **options):
+        engine = ServiceNowBulkEngine(concurrency=options["concurrency"], rate=options["rate"])
+        self.stdout.write(
+            f"Draining to {engine.base_url} with concurrency={engine.concurrency}, rate={engine.rate}/s"
+        )
+
+        started = time.monotonic()
+        totals = drain_servicenow_queue(
+            statuses=options["status"] or ("pending", "failed"),
+            limit=options["limit"],
+            batch_size=options["batch_size"],
+            engine=engine,
+            log=self.stdout.write,
+            batch_api=options["batch_api"],
+        )
+        elapsed = time.monotonic() - started
+        drained = totals["created"] + totals["failed"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['created']} created, {totals['failed']} failed in {elapsed:.2f}s "
+            f"({drained / elapsed if elapsed else 0:.1f} tickets/s)"
+        ))
+
+        if options["sync_statuses"]:
+            tickets = list(open_servicenow_tickets())
+            self.stdout.write(f"Fetching states for {len(tickets)} open tickets...")
+            states = asyncio.run(engine.fetch_states(
+                [t.servicenow_sys_id for t in tickets],
+                chunk_size=getattr(settings, "SERVICENOW_SYNC_CHUNK_SIZE", 100),
+            ))
+            updated = apply_servicenow_states(tickets, states)
+            self.stdout.write(self.style.SUCCESS(f"Updated {updated} ticket statuses"))
@@ -0,0 +1,168 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tickets.models import Ticket
+from servicenow.models import SyncWatermark
+from servicenow.utils.client import servicenow_client_for
+from servicenow.utils.retry import LOADTEST_REQUEST_TYPE, RETRYABLE_STATUSES
+from servicenow.utils.simulator import ServiceNowSimulator
+from servicenow.utils.task import STATUS_SYNC_WATERMARK, process_ticket_task, sync_servicenow_ticket_statuses
+
+LOADTEST_PREFIX = "[loadtest]"
+
+
+def latency_summary(samples):
+    """
+    p50/p95/p99/max of a list of seconds, in milliseconds.
+    """
+    if not samples:
+        return "no samples"
+    if len(samples) == 1:
+        p50 = p95 = p99 = samples[0]
+    else:
+        cuts = statistics.quantiles(samples, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return (
+        f"p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms "
+        f"p99={p99 * 1000:.1f}ms max={max(samples) * 1000:.1f}ms"
+    )
+
+
+class Command(BaseCommand):
+    help = 'Drive process_ticket_task and sync_servicenow_ticket_statuses at a target rate and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickets", type=int, default=500, help="Number of test tickets to create")
+        parser.add_argument("--rate", type=float, default=50, help="Tickets submitted per second (open loop)")
+        parser.add_argument("--workers", type=int, default=16, help="Concurrent workers, like Celery concurrency")
+        parser.add_argument("--sync-runs", type=int, default=3,
+                            help="Status sync runs after creation: the first is full, the rest incremental")
+        parser.add_argument("--sync-interval", type=float, default=2, help="Seconds between status sync runs")
+        parser.add_argument("--keep", action="store_true",
+                            help="Keep the test tickets afterwards (uncreated ones are dead-lettered)")
+        parser.add_argument("--base-url", default=None,
+                            help="Use an already running simulator (servicenow_simulator) instead of starting one")
+        parser.add_argument("--against-real-instance", action="store_true",
+                            help="Create incidents on SERVICENOW_BASE_URL instead of an in-process simulator")
+        parser.add_argument("--latency-ms", type=float, default=50)
+        parser.add_argument("--jitter-ms", type=float, default=20)
+        parser.add_argument("--error-rate", type=float, default=0.0)
+        parser.add_argument("--throttle-rate", type=float, default=0.0)
+        parser.add_argument("--churn", type=float, default=0.2)
+
+    def handle(self, *args, **options):
+        simulator = None
+        if options["against_real_instance"]:
+            # incidents created there stay behind when the test tickets are deleted
+            self.stdout.write(self.style.WARNING(
+                f"Load testing against the real instance {settings.SERVICENOW_BASE_URL}"
+            ))
+            client = nullcontext()
+        elif options["base_url"]:
+            client = servicenow_client_for(options["base_url"])
+            self.stdout.write(f"Load testing against {options['base_url']}")
+        else:
+            simulator = ServiceNowSimulator(
+                ("127.0.0.1", 0),
+                latency_ms=options["latency_ms"],
+                jitter_ms=options["jitter_ms"],
+                error_rate=options["error_rate"],
+                throttle_rate=options["throttle_rate"],
+                churn=options["churn"],
+            ).start()
+            client = servicenow_client_for(simulator.base_url)
+            self.stdout.write(f"Load testing against the simulator at {simulator.base_url}")
+
+        # the sync runs move the watermark; put the real one back afterwards
+        watermark = SyncWatermark.objects.filter(name=STATUS_SYNC_WATERMARK).first()
+        saved_mark = watermark.last_updated_on if watermark else None
+
+        tickets = Ticket.objects.bulk_create([
+            Ticket(
+                title=f"{LOADTEST_PREFIX} ticket {i}",
+                description="Generated by servicenow_loadtest",
+                category="application",
+                priority=random.choice(["critical", "high", "medium", "low"]),
+                ticket_creation_status="pending",
+                # keeps the retry sweep and servicenow_drain off these tickets
+                request_type=LOADTEST_REQUEST_TYPE,
+            )
+            for i in range(options["tickets"])
+        ])
+        ticket_ids = [t.id for t in tickets]
+        try:
+            with client:
+                self._create_incidents(ticket_ids, options)
+                self._sync_statuses(options)
+        finally:
+            if options["keep"]:
+                # nothing should ever try to create these again
+                Ticket.objects.filter(id__in=ticket_ids, ticket_creation_status__in=RETRYABLE_STATUSES).update(
+                    ticket_creation_status="dead_letter",
+                    next_attempt_at=None,
+                    lease_token=None,
+                    lease_expires_at=None,
+                    error_message="Load test ticket, not retried",
+                )
+            else:
+                Ticket.objects.filter(id__in=ticket_ids).delete()
+            if watermark:
+                SyncWatermark.objects.filter(id=watermark.id).update(last_updated_on=saved_mark)
+            else:
+                SyncWatermark.objects.filter(name=STATUS_SYNC_WATERMARK).delete()
+            if simulator:
+                simulator.shutdown()
+                simulator.server_close()
+                self.stdout.write(f"Simulator: {simulator.stats()}")
+
+    def _create_incidents(self, ticket_ids, options):
+        rate = options["rate"]
+
+        def run(ticket_id, scheduled):
+            try:
+                process_ticket_task(ticket_id)
+                ok = True
+            except Exception:
+                ok = False
+            # measured from the scheduled start, so time spent waiting for a free worker counts
+            return time.monotonic() - scheduled, ok
+
+        self.stdout.write(f"Creating {len(ticket_ids)} incidents at {rate}/s with {options['workers']} workers...")
+        started = time.monotonic()
+        futures = []
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for i, ticket_id in enumerate(ticket_ids):
+                scheduled = started + i / rate
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(run, ticket_id, scheduled))
+            results = [f.result() for f in futures]
+        elapsed = time.monotonic() - started
+
+        latencies = [latency for latency, _ in results]
+        created = sum(1 for _, ok in results if ok)
+        self.stdout.write(self.style.SUCCESS(
+            f"process_ticket_task: {created} created, {len(results) - created} failed in {elapsed:.2f}s "
+            f"({len(results) / elapsed:.1f} tickets/s)"
+        ))
+        self.stdout.write(f"  latency {latency_summary(latencies)}")
+
+    def _sync_statuses(self, options):
+        durations = []
+        for run in range(options["sync_runs"]):
+            if run:
+                time.sleep(options["sync_interval"])
+            started = time.monotonic()
+            sync_servicenow_ticket_statuses(full=(run == 0))
+            durations.append(time.monotonic() - started)
+            self.stdout.write(
+                f"sync_servicenow_ticket_statuses ({'full' if run == 0 else 'incremental'}): "
+                f"{durations[-1] * 1000:.1f}ms"
+            )
+        if durations:
+            self.stdout.write(f"  latency {latency_summary(durations)}")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from servicenow.utils.simulator import ServiceNowSimulator
+
+
+class Command(BaseCommand):
+    help = 'Run a local in-memory ServiceNow stand-in (incident, sys_user_group, Batch API) for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8080)
+        parser.add_argument("--latency-ms", type=float, default=50, help="Fixed latency added to every request")
+        parser.add_argument("--jitter-ms", type=float, default=20, help="Random extra latency, uniform 0..jitter")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+        parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+        parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+        parser.add_argument("--churn", type=float, default=0.0,
+                            help="Fraction of open incidents moved to their next state every second")
+
+    def handle(self, *args, **options):
+        server = ServiceNowSimulator(
+            (options["host"], options["port"]),
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            error_rate=options["error_rate"],
+            throttle_rate=options["throttle_rate"],
+            retry_after=options["retry_after"],
+            churn=options["churn"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"ServiceNow simulator listening on {server.base_url} "
+            f"(set SERVICENOW_BASE_URL={server.base_url})"
+        ))
+        server.start_churn()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Simulator stats: {server.stats()}")
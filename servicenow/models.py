@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 class AssignmentGroup(models.Model):
     """
@@ -32,4 +34,24 @@ class AssignmentGroup(models.Model):
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
-        return f"{self.name}" 
\ No newline at end of file
+        return f"{self.name}"
+
+
+@receiver(post_save, sender=AssignmentGroup)
+@receiver(post_delete, sender=AssignmentGroup)
+def invalidate_assignment_groups(sender, **kwargs):
+    from servicenow.utils.groupresolver import invalidate_group_resolver
+    # after commit, or a reader could cache the old rows under the new version
+    transaction.on_commit(invalidate_group_resolver)
+
+
+class SyncWatermark(models.Model):
+    """
+    High-water mark of the last seen sys_updated_on for incremental ServiceNow syncs.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_updated_on = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.last_updated_on}"
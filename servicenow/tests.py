@@ -1,3 +1,231 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from tickets.models import Ticket
+from servicenow.models import SyncWatermark
+from servicenow.utils.bulkengine import ServiceNowBulkEngine, drain_servicenow_queue
+from servicenow.utils.task import STATUS_SYNC_WATERMARK, sync_servicenow_ticket_statuses
+from servicenow.utils.client import CircuitBreaker
+from servicenow.utils.retry import acquire_ticket_lease, claim_due_tickets, claim_tickets
+from servicenow.utils.servicenow import parse_batch_response
+from servicenow.utils.simulator import ServiceNowSimulator, SimulatorHandler
 
-# Create your tests here.
+
+def serviced(index, status_code, body):
+    return {"id": str(index), "status_code": status_code, "body": base64.b64encode(body.encode()).decode()}
+
+
+class ParseBatchResponseTests(TestCase):
+    def test_outcomes_follow_payload_order(self):
+        data = {"serviced_requests": [
+            serviced(1, 400, '{"error": "bad caller"}'),
+            serviced(0, 201, json.dumps({"result": {"sys_id": "abc", "number": "INC0001"}})),
+        ]}
+        outcomes = parse_batch_response(data, 2)
+        self.assertEqual(outcomes[0], ({"sys_id": "abc", "number": "INC0001"}, None))
+        self.assertIsNone(outcomes[1][0])
+        self.assertTrue(outcomes[1][1].startswith("HTTP 400"))
+
+    def test_unserviced_and_unreadable_requests_fail(self):
+        outcomes = parse_batch_response({"serviced_requests": [serviced(0, 201, "not json")]}, 2)
+        self.assertTrue(outcomes[0][1].startswith("Unreadable batch response body"))
+        self.assertEqual(outcomes[1], (None, "Not serviced by the ServiceNow batch request"))
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("servicenow.utils.client.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def open_circuit(self):
+        for _ in range(2):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.open_circuit()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.open_circuit()
+        self.now += 60
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens(self):
+        self.open_circuit()
+        self.now += 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_release_frees_trial_without_counting_it(self):
+        self.open_circuit()
+        self.now += 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+
+
+@override_settings(SERVICENOW_LEASE_SECONDS=900, SERVICENOW_PENDING_GRACE_SECONDS=120)
+class TicketLeaseTests(TestCase):
+    def create_ticket(self, **fields):
+        fields.setdefault("ticket_creation_status", "pending")
+        return Ticket.objects.create(title="VPN down", description="d", category="network", priority="high", **fields)
+
+    def test_claim_skips_leased_tickets(self):
+        first, second = self.create_ticket(), self.create_ticket()
+        claimed, token = claim_tickets([first.id])
+        self.assertEqual(claimed, [first.id])
+
+        claimed, other = claim_tickets([first.id, second.id])
+        self.assertEqual(claimed, [second.id])
+        self.assertNotEqual(token, other)
+
+    def test_expired_lease_can_be_claimed(self):
+        ticket = self.create_ticket(lease_token="old", lease_expires_at=timezone.now() - timedelta(seconds=1))
+        claimed, token = claim_tickets([ticket.id])
+        self.assertEqual(claimed, [ticket.id])
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.lease_token, token)
+        self.assertGreater(ticket.lease_expires_at, timezone.now())
+
+    def test_holder_renews_its_lease(self):
+        ticket = self.create_ticket()
+        token = acquire_ticket_lease(ticket.id)
+        self.assertIsNone(acquire_ticket_lease(ticket.id))
+        self.assertEqual(acquire_ticket_lease(ticket.id, token), token)
+
+    def test_created_tickets_are_not_leased(self):
+        ticket = self.create_ticket(ticket_creation_status="created")
+        self.assertEqual(claim_tickets([ticket.id])[0], [])
+
+    def test_sweep_leaves_fresh_pending_tickets_to_the_relay(self):
+        fresh = self.create_ticket()
+        old = self.create_ticket()
+        Ticket.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(seconds=300))
+        due = self.create_ticket(ticket_creation_status="failed", next_attempt_at=timezone.now())
+        self.create_ticket(ticket_creation_status="failed", next_attempt_at=timezone.now() + timedelta(hours=1))
+
+        claimed, _ = claim_due_tickets()
+        self.assertCountEqual(claimed, [old.id, due.id])
+        self.assertNotIn(fresh.id, claimed)
+
+    def test_sweep_skips_load_test_tickets(self):
+        self.create_ticket(ticket_creation_status="failed", next_attempt_at=timezone.now(), request_type="loadtest")
+        self.assertEqual(claim_due_tickets(), ([], None))
+
+
+class StatusSyncWatermarkTests(TestCase):
+    def setUp(self):
+        Ticket.objects.create(
+            title="VPN down", description="d", category="network", priority="high",
+            servicenow_sys_id="abc", servicenow_ticket_status="queued",
+        )
+
+    def sync(self, failed_chunks):
+        with mock.patch(
+            "servicenow.utils.task.fetch_servicenow_ticket_statuses",
+            return_value=({"abc": "2"}, failed_chunks),
+        ):
+            sync_servicenow_ticket_statuses.run()
+        return SyncWatermark.objects.get(name=STATUS_SYNC_WATERMARK).last_updated_on
+
+    def test_complete_full_sync_sets_the_watermark(self):
+        self.assertIsNotNone(self.sync(failed_chunks=0))
+
+    def test_incomplete_full_sync_leaves_the_watermark_unset(self):
+        self.assertIsNone(self.sync(failed_chunks=1))
+        # the fetched chunks are still applied
+        self.assertEqual(Ticket.objects.get().servicenow_ticket_status, "In-Progress")
+
+
+@override_settings(SERVICENOW_RATE_LIMIT_REDIS_URL="", SERVICENOW_BACKOFF_MAX=30)
+class BulkEngineTests(TestCase):
+    def setUp(self):
+        self.simulator = ServiceNowSimulator(("127.0.0.1", 0), latency_ms=50).start()
+        self.addCleanup(self.simulator.server_close)
+        self.addCleanup(self.simulator.shutdown)
+        self.engine = ServiceNowBulkEngine(
+            base_url=self.simulator.base_url, auth=("", ""), concurrency=4, rate=1000, max_retries=3,
+        )
+
+    def fault_rolls(self, faults):
+        """The first `faults` requests roll an injected fault, the rest succeed."""
+        rolls = iter([0.0] * faults)
+        fake_random = mock.Mock()
+        fake_random.random.side_effect = lambda: next(rolls, 0.99)
+        fake_random.uniform.return_value = 0
+        patcher = mock.patch("servicenow.utils.simulator.random", fake_random)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, count):
+        payloads = [{"short_description": f"VPN down {n}"} for n in range(count)]
+        return asyncio.run(self.engine.create_incidents(payloads))
+
+    def test_in_flight_requests_stay_under_the_concurrency_cap(self):
+        lock, in_flight, peak = threading.Lock(), [0], [0]
+        inject = SimulatorHandler._inject
+
+        def counting_inject(handler):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            try:
+                return inject(handler)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        with mock.patch.object(SimulatorHandler, "_inject", counting_inject):
+            outcomes = self.create(20)
+        self.assertTrue(all(error is None for _, error in outcomes))
+        self.assertEqual(peak[0], 4)
+
+    def test_throttled_requests_wait_for_retry_after(self):
+        self.simulator.throttle_rate = 0.5
+        self.fault_rolls(3)
+        started = time.monotonic()
+        outcomes = self.create(5)
+
+        self.assertGreaterEqual(time.monotonic() - started, self.simulator.retry_after)
+        self.assertTrue(all(error is None for _, error in outcomes))
+        self.assertEqual(self.simulator.stats()["throttled"], 3)
+        self.assertEqual(self.simulator.stats()["incidents"], 5)
+
+    def test_drain_records_partial_failures(self):
+        self.simulator.error_rate = 0.5
+        self.fault_rolls(2)
+        for n in range(6):
+            Ticket.objects.create(title=f"VPN down {n}", description="d", category="network", priority="high")
+
+        totals = drain_servicenow_queue(engine=self.engine, log=lambda message: None)
+        self.assertEqual(totals, {"created": 4, "failed": 2})
+        # a 500 on incident creation is not retried, it may have been processed
+        self.assertEqual(self.simulator.stats()["requests"], 6)
+        failed = Ticket.objects.filter(ticket_creation_status="failed")
+        self.assertEqual(failed.count(), 2)
+        self.assertTrue(all(ticket.error_message.startswith("HTTP 500") for ticket in failed))
+        self.assertEqual(Ticket.objects.exclude(servicenow_sys_id=None).count(), 4)
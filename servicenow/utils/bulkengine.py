@@ -0,0 +1,263 @@
+"""Asyncio engine for high fan-out ServiceNow work (backlog drains and bulk status reads).
+
+Requests run over one httpx.AsyncClient with at most `concurrency` in flight and
+a local token bucket capping this run's request rate; every request also takes a
+token from the shared Redis limiter so a drain cannot starve the Celery workers.
+The engine only does HTTP; the callers load and save tickets with the ORM outside
+the event loop.
+"""
+
+import asyncio
+import logging
+import random
+import time
+import httpx
+from django.conf import settings
+from tickets.models import Ticket
+from servicenow.utils.client import RETRY_STATUSES, SAFE_RETRY_STATUSES, retry_after_seconds
+from servicenow.utils.ratelimit import endpoint_for_path, get_rate_limiter
+from servicenow.utils.retry import LOADTEST_REQUEST_TYPE, claim_tickets
+from servicenow.utils.servicenow import (
+    BATCH_PATH,
+    INCIDENT_PATH,
+    apply_creation_outcomes,
+    build_batch_request,
+    build_incident_payload,
+    parse_batch_response,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTokenBucket:
+    """
+    Allows `rate` requests per second with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ServiceNowBulkEngine:
+    def __init__(
+        self,
+        base_url=None,
+        auth=None,
+        concurrency=None,
+        rate=None,
+        burst=None,
+        timeout=None,
+        max_retries=None,
+        shared_limiter=None,
+    ):
+        self.base_url = (base_url or settings.SERVICENOW_BASE_URL).rstrip("/")
+        self.auth = auth or (settings.SERVICENOW_USERNAME, settings.SERVICENOW_PASSWORD)
+        self.concurrency = concurrency or getattr(settings, "SERVICENOW_BULK_CONCURRENCY", 20)
+        self.rate = rate or getattr(settings, "SERVICENOW_BULK_RATE", 20)
+        self.burst = burst
+        self.timeout = timeout or getattr(settings, "SERVICENOW_READ_TIMEOUT", 30)
+        self.max_retries = getattr(settings, "SERVICENOW_MAX_RETRIES", 3) if max_retries is None else max_retries
+        self.backoff_base = getattr(settings, "SERVICENOW_BACKOFF_BASE", 0.5)
+        self.backoff_max = getattr(settings, "SERVICENOW_BACKOFF_MAX", 30)
+        self.shared_limiter = shared_limiter or get_rate_limiter()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _request(self, client, limiter, semaphore, method, path, idempotent, **kwargs):
+        retry_statuses = RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES
+        endpoint = endpoint_for_path(path)
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            if self.shared_limiter:
+                await self.shared_limiter.acquire_async(endpoint)
+            async with semaphore:
+                try:
+                    response = await client.request(method, path, **kwargs)
+                except httpx.TransportError as e:
+                    retryable = idempotent or isinstance(e, httpx.ConnectError)
+                    if attempt >= self.max_retries or not retryable:
+                        raise
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+
+            if response.status_code in retry_statuses and attempt < self.max_retries:
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                await asyncio.sleep(min(delay, self.backoff_max))
+                continue
+            return response
+        return response
+
+    def _client(self):
+        limits = httpx.Limits(
+            max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            # a local mock server needs no credentials
+            auth=self.auth if all(self.auth) else None,
+            headers={"Accept": "application/json"},
+            timeout=self.timeout,
+            limits=limits,
+        )
+
+    async def create_incidents(self, payloads):
+        """
+        POST every payload to the incident table.
+        Returns one (result dict, None) or (None, error message) per payload, in order.
+        """
+        limiter = AsyncTokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def create(client, payload):
+            try:
+                response = await self._request(
+                    client, limiter, semaphore, "POST", INCIDENT_PATH, idempotent=False, json=payload
+                )
+                response.raise_for_status()
+                return response.json().get("result", {}), None
+            except httpx.HTTPStatusError as e:
+                return None, f"HTTP {e.response.status_code}: {e.response.text[:500]}"
+            except Exception as e:
+                return None, str(e) or e.__class__.__name__
+
+        async with self._client() as client:
+            return await asyncio.gather(*(create(client, payload) for payload in payloads))
+
+    async def create_incidents_batch(self, payloads, batch_size=None):
+        """
+        Same as create_incidents, but batch_size incidents per Batch API request,
+        with the batch requests sent concurrently.
+        """
+        batch_size = batch_size or getattr(settings, "SERVICENOW_BATCH_SIZE", 50)
+        limiter = AsyncTokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def create_batch(client, chunk):
+            try:
+                response = await self._request(
+                    client, limiter, semaphore, "POST", BATCH_PATH, idempotent=False,
+                    json=build_batch_request(chunk),
+                )
+                response.raise_for_status()
+                return parse_batch_response(response.json(), len(chunk))
+            except httpx.HTTPStatusError as e:
+                error = f"HTTP {e.response.status_code}: {e.response.text[:500]}"
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            return [(None, error)] * len(chunk)
+
+        async with self._client() as client:
+            chunks = await asyncio.gather(*(
+                create_batch(client, payloads[start:start + batch_size])
+                for start in range(0, len(payloads), batch_size)
+            ))
+        return [outcome for chunk in chunks for outcome in chunk]
+
+    async def fetch_states(self, sys_ids, chunk_size=None):
+        """
+        Read incident states for many sys_ids concurrently. Returns {sys_id: state};
+        chunks that fail are logged and left out.
+        """
+        chunk_size = chunk_size or getattr(settings, "SERVICENOW_SYNC_CHUNK_SIZE", 100)
+        limiter = AsyncTokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        sys_ids = list(dict.fromkeys(sys_ids))
+        states = {}
+
+        async def fetch(client, chunk):
+            offset = 0
+            try:
+                while True:
+                    response = await self._request(
+                        client, limiter, semaphore, "GET", INCIDENT_PATH, idempotent=True,
+                        params={
+                            "sysparm_query": "sys_idIN" + ",".join(chunk),
+                            "sysparm_fields": "sys_id,state",
+                            "sysparm_limit": chunk_size,
+                            "sysparm_offset": offset,
+                            "sysparm_exclude_reference_link": "true",
+                        },
+                    )
+                    response.raise_for_status()
+                    results = response.json().get("result", [])
+                    for row in results:
+                        states[row["sys_id"]] = row.get("state")
+                    offset += len(results)
+                    if not results or offset >= len(chunk):
+                        break
+            except Exception:
+                logger.exception(f"Failed to fetch ServiceNow statuses for {len(chunk)} sys_ids")
+
+        async with self._client() as client:
+            await asyncio.gather(*(
+                fetch(client, sys_ids[start:start + chunk_size])
+                for start in range(0, len(sys_ids), chunk_size)
+            ))
+        return states
+
+
+def drain_servicenow_queue(
+    statuses=("pending", "failed"), limit=None, batch_size=500, engine=None, log=None, batch_api=False
+):
+    """
+    Create ServiceNow incidents for every ticket in `statuses`, batch_size tickets at a time,
+    ignoring retry backoff. Tickets leased by a Celery worker are skipped. With batch_api
+    the incidents go through the Batch API instead of one POST each. Results are
+    written back with one bulk_update per outcome per batch.
+    Returns {"created": n, "failed": n}.
+    """
+    engine = engine or ServiceNowBulkEngine()
+    log = log or logger.info
+    totals = {"created": 0, "failed": 0}
+
+    queryset = (
+        Ticket.objects.filter(ticket_creation_status__in=statuses)
+        .exclude(request_type=LOADTEST_REQUEST_TYPE)
+        .order_by("id")
+    )
+    last_id = 0
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        # page by id so tickets that fail again in this run are not picked up twice
+        candidate_ids = list(queryset.filter(id__gt=last_id).values_list("id", flat=True)[:size])
+        if not candidate_ids:
+            break
+        last_id = candidate_ids[-1]
+        claimed_ids, _ = claim_tickets(candidate_ids)
+        tickets = list(Ticket.objects.filter(id__in=claimed_ids).order_by("id"))
+        if remaining is not None:
+            remaining -= len(tickets)
+        if not tickets:
+            continue
+
+        started = time.monotonic()
+        payloads = [build_incident_payload(t) for t in tickets]
+        create = engine.create_incidents_batch if batch_api else engine.create_incidents
+        created, failed = apply_creation_outcomes(tickets, asyncio.run(create(payloads)))
+
+        totals["created"] += len(created)
+        totals["failed"] += len(failed)
+        log(
+            f"Drained {len(tickets)} tickets in {time.monotonic() - started:.2f}s: "
+            f"{len(created)} created, {len(failed)} failed"
+        )
+    return totals
@@ -0,0 +1,305 @@
+"""Shared ServiceNow HTTP client: pooled keep-alive session, retries with backoff and a circuit breaker."""
+
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from servicenow.utils.ratelimit import endpoint_for_path, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# non-idempotent requests (incident creation) are only retried when ServiceNow did not process them
+SAFE_RETRY_STATUSES = {429, 503}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    reset_timeout seconds, then lets a single trial call through (half-open).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                logger.info("ServiceNow circuit half-open, sending trial request")
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("ServiceNow circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.error(
+                        f"ServiceNow circuit opened after {self._failures} consecutive failures"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """
+        Undo allow() for a call that was never sent, without counting it.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in": (
+                    max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+                    if state == self.OPEN else 0.0
+                ),
+            }
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ServiceNowClient:
+    def __init__(
+        self,
+        base_url,
+        auth,
+        pool_size=10,
+        connect_timeout=5,
+        read_timeout=30,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=30,
+        breaker=None,
+        limiter=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update({"Accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt):
+        # full jitter: uniform between 0 and the capped exponential delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """
+        Send a request with retries on connection errors, 429 and 5xx.
+        Retry-After is honoured when ServiceNow sends it. Raises CircuitOpenError
+        without touching the network or the rate budget while the circuit is
+        open. Every attempt, retries included, then takes a token from the
+        shared rate limiter.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD", "PUT", "DELETE")
+        retry_statuses = RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES
+
+        endpoint = endpoint_for_path(path)
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"ServiceNow circuit is open, not calling {method} {path}")
+        if self.limiter:
+            try:
+                self.limiter.acquire(endpoint)
+            except requests.exceptions.RequestException:
+                # nothing reached ServiceNow; free the half-open trial slot if this call held it
+                self.breaker.release()
+                raise
+
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            if attempt and self.limiter:
+                try:
+                    self.limiter.acquire(endpoint)
+                except requests.exceptions.RequestException:
+                    self.breaker.record_failure()
+                    raise
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # a connect timeout means nothing was sent, so even a POST can be retried
+                retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+                if attempt >= self.max_retries or not retryable:
+                    self.breaker.record_failure()
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"ServiceNow {method} {path} connection failed, retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            except requests.exceptions.RequestException:
+                # ChunkedEncodingError, InvalidURL, TooManyRedirects...: not retried, but
+                # still a result, or a half-open breaker would wait for its trial forever
+                self.breaker.record_failure()
+                raise
+            except Exception:
+                # not a ServiceNow failure (e.g. bad arguments); just free the trial slot
+                self.breaker.release()
+                raise
+
+            if response.status_code in retry_statuses and attempt < self.max_retries:
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                delay = min(delay, self.backoff_max)
+                logger.warning(
+                    f"ServiceNow {method} {path} returned {response.status_code}, retrying in {delay:.2f}s"
+                )
+                time.sleep(delay)
+                continue
+            break
+
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def status(self):
+        return self.breaker.snapshot()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def build_servicenow_client(base_url=None) -> ServiceNowClient:
+    """
+    A client configured from settings, for SERVICENOW_BASE_URL unless base_url is given.
+    """
+    return ServiceNowClient(
+        base_url=base_url or settings.SERVICENOW_BASE_URL,
+        auth=(settings.SERVICENOW_USERNAME, settings.SERVICENOW_PASSWORD),
+        pool_size=getattr(settings, "SERVICENOW_POOL_SIZE", 10),
+        connect_timeout=getattr(settings, "SERVICENOW_CONNECT_TIMEOUT", 5),
+        read_timeout=getattr(settings, "SERVICENOW_READ_TIMEOUT", 30),
+        max_retries=getattr(settings, "SERVICENOW_MAX_RETRIES", 3),
+        backoff_base=getattr(settings, "SERVICENOW_BACKOFF_BASE", 0.5),
+        backoff_max=getattr(settings, "SERVICENOW_BACKOFF_MAX", 30),
+        breaker=CircuitBreaker(
+            failure_threshold=getattr(settings, "SERVICENOW_BREAKER_THRESHOLD", 5),
+            reset_timeout=getattr(settings, "SERVICENOW_BREAKER_RESET_SECONDS", 60),
+        ),
+        limiter=get_rate_limiter(),
+    )
+
+
+def get_servicenow_client() -> ServiceNowClient:
+    """
+    Per-process client, rebuilt after a fork so workers never share sockets.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = build_servicenow_client()
+            _client_pid = os.getpid()
+        return _client
+
+
+@contextmanager
+def servicenow_client_for(base_url):
+    """
+    Send this process's ServiceNow calls to base_url (e.g. a simulator) inside
+    the block, leaving settings untouched. The previous client is restored after.
+    """
+    global _client, _client_pid
+    client = build_servicenow_client(base_url)
+    with _client_lock:
+        previous = (_client, _client_pid)
+        _client, _client_pid = client, os.getpid()
+    try:
+        yield client
+    finally:
+        with _client_lock:
+            _client, _client_pid = previous
+        client.session.close()
+
+
+def reset_servicenow_client():
+    """
+    Drop the cached client so the next call picks up changed settings (e.g. SERVICENOW_BASE_URL).
+    """
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def servicenow_client_status() -> dict:
+    client = get_servicenow_client()
+    status = client.status()
+    status["rate_limits"] = client.limiter.stats() if client.limiter else {}
+    return status
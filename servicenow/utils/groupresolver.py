@@ -0,0 +1,125 @@
+"""Process-local category -> assignment group lookup.
+
+The table has one row per category and almost never changes, so every process
+loads it once instead of querying it for each ticket. Saving or deleting a group
+clears the copy in the process that did it (post_save/post_delete) and bumps a
+version key in the cache backend; other processes compare that key at most every
+SERVICENOW_GROUP_CACHE_CHECK_SECONDS and reload when it moved. The version key
+only reaches other processes with a shared cache (CACHE_URL), so every copy is
+also reloaded after SERVICENOW_GROUP_CACHE_MAX_AGE seconds.
+"""
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from servicenow.models import AssignmentGroup
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "servicenow:assignment_groups:version"
+
+ResolvedGroup = namedtuple("ResolvedGroup", ["id", "servicenow_group_id"])
+
+
+def shared_group_version():
+    try:
+        return cache.get(VERSION_KEY, 0)
+    except Exception:
+        logger.warning("Cache backend unavailable, assignment groups reload on the check interval")
+        return None
+
+
+def bump_shared_group_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # incr only works on existing keys
+        cache.set(VERSION_KEY, 1, None)
+    except Exception:
+        logger.warning("Cache backend unavailable, other processes keep their assignment groups until it returns")
+
+
+class AssignmentGroupResolver:
+    def __init__(self, check_interval=5, max_age=300):
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._by_category = None
+        self._by_id = None
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+
+    def _load(self):
+        groups = list(AssignmentGroup.objects.values_list("id", "category", "servicenow_group_id").order_by("id"))
+        by_category = {}
+        for group_id, category, servicenow_group_id in groups:
+            # keep the first row per category, like .filter(category=...).first()
+            by_category.setdefault(category.lower(), ResolvedGroup(group_id, servicenow_group_id))
+        self._by_category = by_category
+        self._by_id = {group_id: servicenow_group_id for group_id, _, servicenow_group_id in groups}
+        self._loaded_at = time.monotonic()
+        logger.debug(f"Loaded {len(groups)} assignment groups")
+
+    def _current(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._by_category is None or now - self._checked_at >= self.check_interval:
+                version = shared_group_version()
+                # None means the cache is down: reload every interval to stay close to current
+                if (
+                    self._by_category is None
+                    or version is None
+                    or version != self._version
+                    or now - self._loaded_at >= self.max_age
+                ):
+                    self._load()
+                    self._version = version
+                self._checked_at = now
+            return self._by_category, self._by_id
+
+    def resolve(self, category):
+        """
+        ResolvedGroup(id, servicenow_group_id) for a category, or None.
+        """
+        if not category:
+            return None
+        by_category, _ = self._current()
+        return by_category.get(category.strip().lower())
+
+    def servicenow_group_id(self, group_id):
+        if group_id is None:
+            return None
+        _, by_id = self._current()
+        return by_id.get(group_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._by_category = None
+            self._by_id = None
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_group_resolver() -> AssignmentGroupResolver:
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = AssignmentGroupResolver(
+                check_interval=getattr(settings, "SERVICENOW_GROUP_CACHE_CHECK_SECONDS", 5),
+                max_age=getattr(settings, "SERVICENOW_GROUP_CACHE_MAX_AGE", 300),
+            )
+        return _resolver
+
+
+def invalidate_group_resolver():
+    """
+    Drop this process's copy and tell the other processes to reload theirs.
+    """
+    get_group_resolver().invalidate()
+    bump_shared_group_version()
@@ -0,0 +1,206 @@
+"""Token-bucket rate limiter for outbound ServiceNow calls, shared by every worker through Redis.
+
+Each endpoint (the Table API table name, e.g. "incident") has its own bucket. The
+refill and take run as one Lua script on the Redis clock, so all Celery workers and
+web processes draw from the same budget no matter how many there are.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+import redis
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local endpoint = ARGV[3]
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    redis.call('HINCRBY', KEYS[2], endpoint .. ':acquired', 1)
+else
+    wait = (1 - tokens) / rate
+    redis.call('HINCRBY', KEYS[2], endpoint .. ':throttled', 1)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+ENDPOINT_RE = re.compile(r"/api/now/(?:v\d+/)?(?:(?:table|import)/([^/?]+)|(batch))")
+
+KEY_PREFIX = "servicenow:ratelimit"
+
+
+class RateLimitTimeout(requests.exceptions.RequestException):
+    pass
+
+
+def endpoint_for_path(path):
+    """
+    Bucket name for a request path: the table name for Table/Import Set API calls,
+    "batch" for the Batch API, else "default".
+    """
+    match = ENDPOINT_RE.search(path)
+    return (match.group(1) or match.group(2)) if match else "default"
+
+
+def parse_rate_limits(value):
+    """
+    Parse "incident=10:20,sys_user_group=2" into {"incident": (10.0, 20.0), "sys_user_group": (2.0, 2.0)}.
+    The number after the colon is the burst size; it defaults to the rate.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        endpoint, _, spec = item.partition("=")
+        rate, _, burst = spec.partition(":")
+        limits[endpoint.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class ServiceNowRateLimiter:
+    def __init__(self, redis_url, default_rate=20, default_burst=None, limits=None, max_wait=60):
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+        self.default = (float(default_rate), float(default_burst or default_rate))
+        self.limits = limits or {}
+        self.max_wait = max_wait
+        self._script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self._last_error_log = 0.0
+
+    def limit_for(self, endpoint):
+        return self.limits.get(endpoint, self.default)
+
+    def reserve(self, endpoint):
+        """
+        Take one token for `endpoint` if available. Returns 0.0 when taken, otherwise the
+        seconds until the next token. If Redis is unreachable the call is let through.
+        """
+        rate, burst = self.limit_for(endpoint)
+        if rate <= 0:
+            return 0.0
+        try:
+            return float(self._script(
+                keys=[f"{KEY_PREFIX}:{endpoint}", f"{KEY_PREFIX}:stats"],
+                args=[rate, burst, endpoint],
+            ))
+        except redis.exceptions.RedisError as e:
+            # fail open: the client's 429 handling still protects the instance
+            now = time.monotonic()
+            if now - self._last_error_log > 60:
+                self._last_error_log = now
+                logger.warning(f"ServiceNow rate limiter unavailable, not throttling: {e}")
+            return 0.0
+
+    def _check_deadline(self, endpoint, started, wait):
+        if time.monotonic() - started + wait > self.max_wait:
+            self._record(endpoint, time.monotonic() - started, timed_out=True)
+            raise RateLimitTimeout(
+                f"Waited over {self.max_wait}s for a ServiceNow {endpoint} rate limit token"
+            )
+
+    def acquire(self, endpoint):
+        """
+        Block until a token for `endpoint` is available. Raises RateLimitTimeout after max_wait seconds.
+        """
+        started = time.monotonic()
+        waited = 0.0
+        while (wait := self.reserve(endpoint)) > 0:
+            self._check_deadline(endpoint, started, wait)
+            time.sleep(wait)
+            waited = time.monotonic() - started
+        self._record(endpoint, waited)
+        return waited
+
+    async def acquire_async(self, endpoint):
+        """
+        acquire() for the asyncio bulk engine; the Redis call runs in a thread so the loop keeps going.
+        """
+        started = time.monotonic()
+        waited = 0.0
+        while (wait := await asyncio.to_thread(self.reserve, endpoint)) > 0:
+            self._check_deadline(endpoint, started, wait)
+            await asyncio.sleep(wait)
+            waited = time.monotonic() - started
+        await asyncio.to_thread(self._record, endpoint, waited)
+        return waited
+
+    def _record(self, endpoint, waited, timed_out=False):
+        with self._stats_lock:
+            stats = self._stats.setdefault(
+                endpoint, {"acquired": 0, "waited": 0, "timed_out": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            )
+            if timed_out:
+                stats["timed_out"] += 1
+            else:
+                stats["acquired"] += 1
+            if waited > 0:
+                stats["waited"] += 1
+                stats["wait_seconds"] += waited
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        if waited > 0:
+            try:
+                self.redis.hincrbyfloat(f"{KEY_PREFIX}:stats", f"{endpoint}:wait_seconds", waited)
+            except redis.exceptions.RedisError:
+                pass
+
+    def stats(self):
+        """
+        Wait-time metrics: "process" is this worker only, "shared" is summed over all workers in Redis.
+        """
+        with self._stats_lock:
+            process = {endpoint: dict(values) for endpoint, values in self._stats.items()}
+        shared = {}
+        try:
+            raw = self.redis.hgetall(f"{KEY_PREFIX}:stats")
+        except redis.exceptions.RedisError:
+            raw = {}
+        for field, value in raw.items():
+            endpoint, _, name = field.decode().rpartition(":")
+            shared.setdefault(endpoint, {})[name] = float(value)
+        return {"process": process, "shared": shared}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Process-wide limiter, or None when SERVICENOW_RATE_LIMIT_REDIS_URL is not a Redis URL
+    (e.g. the broker is RabbitMQ) and calls should go through unthrottled.
+    """
+    global _limiter
+    redis_url = getattr(settings, "SERVICENOW_RATE_LIMIT_REDIS_URL", None)
+    if not redis_url or not redis_url.startswith(("redis://", "rediss://", "unix://")):
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = ServiceNowRateLimiter(
+                redis_url,
+                default_rate=getattr(settings, "SERVICENOW_RATE_LIMIT", 20),
+                default_burst=getattr(settings, "SERVICENOW_RATE_LIMIT_BURST", None),
+                limits=parse_rate_limits(getattr(settings, "SERVICENOW_RATE_LIMITS", "")),
+                max_wait=getattr(settings, "SERVICENOW_RATE_LIMIT_MAX_WAIT", 60),
+            )
+        return _limiter
+
+
+def rate_limiter_stats() -> dict:
+    limiter = get_rate_limiter()
+    return limiter.stats() if limiter else {}
@@ -0,0 +1,122 @@
+"""Retry scheduling for ServiceNow incident creation: exponential backoff, per-ticket leases and dead-lettering."""
+
+import logging
+import random
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from tickets.models import Ticket
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = ("pending", "failed")
+
+# synthetic tickets of servicenow_loadtest, never created by the background sweeps
+LOADTEST_REQUEST_TYPE = "loadtest"
+
+FAILED_UPDATE_FIELDS = [
+    "ticket_creation_status",
+    "sync_attempts",
+    "last_sync_attempt",
+    "next_attempt_at",
+    "error_message",
+    "lease_token",
+    "lease_expires_at",
+]
+
+
+def retry_delay(attempts) -> timedelta:
+    """
+    Exponential backoff with jitter: base * 2^(attempts - 1) capped at the max,
+    then a random point in the upper half so failed tickets do not retry in lockstep.
+    """
+    base = getattr(settings, "SERVICENOW_RETRY_BASE_SECONDS", 60)
+    cap = getattr(settings, "SERVICENOW_RETRY_MAX_SECONDS", 3600)
+    delay = min(cap, base * (2 ** max(0, attempts - 1)))
+    return timedelta(seconds=delay / 2 + random.uniform(0, delay / 2))
+
+
+def lease_expiry(now=None):
+    return (now or timezone.now()) + timedelta(seconds=getattr(settings, "SERVICENOW_LEASE_SECONDS", 900))
+
+
+def lease_is_free(now):
+    return Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+
+
+def acquire_ticket_lease(ticket_id, token=None):
+    """
+    Take (or renew, when `token` is the current holder's) the creation lease on a ticket
+    that still needs an incident. Returns the lease token, or None if another worker
+    holds it or the ticket no longer needs creating.
+    """
+    now = timezone.now()
+    available = lease_is_free(now)
+    if token:
+        available |= Q(lease_token=token)
+    token = token or uuid.uuid4().hex
+    claimed = Ticket.objects.filter(
+        available, id=ticket_id, ticket_creation_status__in=RETRYABLE_STATUSES
+    ).update(lease_token=token, lease_expires_at=lease_expiry(now))
+    return token if claimed else None
+
+
+def claim_tickets(ticket_ids):
+    """
+    Lease every ticket in ticket_ids that is free with one UPDATE.
+    Returns (claimed ids, lease token).
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    Ticket.objects.filter(
+        lease_is_free(now), id__in=ticket_ids, ticket_creation_status__in=RETRYABLE_STATUSES
+    ).update(lease_token=token, lease_expires_at=lease_expiry(now))
+    claimed = list(Ticket.objects.filter(id__in=ticket_ids, lease_token=token).values_list("id", flat=True))
+    return claimed, token
+
+
+def claim_due_tickets(limit=500):
+    """
+    Lease up to `limit` pending/failed tickets whose next attempt is due, oldest first.
+    New pending tickets are left to the outbox relay for SERVICENOW_PENDING_GRACE_SECONDS,
+    and load-test tickets are never picked up.
+    """
+    now = timezone.now()
+    grace = now - timedelta(seconds=getattr(settings, "SERVICENOW_PENDING_GRACE_SECONDS", 120))
+    due_ids = list(
+        Ticket.objects.filter(
+            lease_is_free(now),
+            Q(next_attempt_at__lte=now) | Q(next_attempt_at__isnull=True, created_at__lte=grace),
+            ticket_creation_status__in=RETRYABLE_STATUSES,
+        )
+        .exclude(request_type=LOADTEST_REQUEST_TYPE)
+        .order_by(F("next_attempt_at").asc(nulls_first=True), "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not due_ids:
+        return [], None
+    return claim_tickets(due_ids)
+
+
+def mark_ticket_failed(ticket, error):
+    """
+    Record a failed creation attempt and release the lease (not saved). The ticket is
+    scheduled for another attempt with backoff, or dead-lettered after the max attempts.
+    """
+    now = timezone.now()
+    ticket.sync_attempts += 1
+    ticket.last_sync_attempt = now
+    ticket.error_message = str(error) or error.__class__.__name__
+    ticket.lease_token = None
+    ticket.lease_expires_at = None
+
+    max_attempts = getattr(settings, "SERVICENOW_MAX_SYNC_ATTEMPTS", 8)
+    if ticket.sync_attempts >= max_attempts:
+        ticket.ticket_creation_status = "dead_letter"
+        ticket.next_attempt_at = None
+        logger.error(f"Ticket {ticket.id} dead-lettered after {ticket.sync_attempts} ServiceNow attempts")
+    else:
+        ticket.ticket_creation_status = "failed"
+        ticket.next_attempt_at = now + retry_delay(ticket.sync_attempts)
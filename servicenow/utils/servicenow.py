@@ -1,23 +1,56 @@
+import base64
+import json
 import logging
+import uuid
 import requests
+from datetime import datetime, timezone as dt_timezone
 from django.conf import settings 
+from django.db import transaction
 from django.utils import timezone
+from tickets.models import Ticket
+from servicenow.utils.client import get_servicenow_client
+from servicenow.utils.groupresolver import get_group_resolver
+from servicenow.utils.retry import FAILED_UPDATE_FIELDS, mark_ticket_failed
 
 logger = logging.getLogger(__name__)
 
-servicenow_instance = settings.SERVICENOW_INSTANCE
-servicenow_username = settings.SERVICENOW_USERNAME
-servicenow_password = settings.SERVICENOW_PASSWORD
 servicenow_sys_id = settings.SERVICENOW_SYSID
 
+INCIDENT_PATH = "/api/now/table/incident"
+BATCH_PATH = "/api/now/v1/batch"
+
+CREATED_UPDATE_FIELDS = [
+    "servicenow_ticket_number",
+    "servicenow_sys_id",
+    "ticket_creation_status",
+    "error_message",
+    "last_sync_attempt",
+    "next_attempt_at",
+    "lease_token",
+    "lease_expires_at",
+]
+
+
+def mark_ticket_created(ticket, result):
+    """
+    Copy the created incident's number and sys_id onto the ticket and release its lease (not saved).
+    """
+    ticket.servicenow_ticket_number = result.get("number")
+    ticket.servicenow_sys_id = result.get("sys_id")
+    ticket.ticket_creation_status = "created"
+    ticket.error_message = None
+    ticket.last_sync_attempt = timezone.now()
+    ticket.next_attempt_at = None
+    ticket.lease_token = None
+    ticket.lease_expires_at = None
 
-def create_servicenow_ticket(ticket):
 
-    url = f"https://{servicenow_instance}.service-now.com/api/now/table/incident"
-    assignment_group_sys_id =None
-    
-    if ticket.assigned_team:
-        assignment_group_sys_id = ticket.assigned_team.servicenow_group_id
+def build_incident_payload(ticket) -> dict:
+    """
+    Map a local ticket to the ServiceNow incident fields.
+    """
+    # resolved from the cached group table instead of loading ticket.assigned_team
+    assignment_group_sys_id = get_group_resolver().servicenow_group_id(ticket.assigned_team_id)
 
     if ticket.priority.lower() == "critical":
         impact = 1
@@ -32,8 +65,7 @@ def create_servicenow_ticket(ticket):
         impact = 2
         urgency =3
 
-    print(f"impact: {impact}, urgency: {urgency}")
-
+    logger.debug(f"impact: {impact}, urgency: {urgency}")
 
     payload = {
         "short_description": ticket.title,
@@ -45,7 +77,12 @@ def create_servicenow_ticket(ticket):
         "assignment_group": assignment_group_sys_id,
         "contact_type":"virtual_agent",
     }
+    return payload
+
+
+def create_servicenow_ticket(ticket):
 
+    payload = build_incident_payload(ticket)
 
     headers = {
         "Content-Type": "application/json",
@@ -57,11 +94,9 @@ def create_servicenow_ticket(ticket):
         logger.info(f"Attempting ServiceNow sync for ticket {ticket.id}")
 
 
-        response = requests.post(
-            url,
+        response = get_servicenow_client().post(
+            INCIDENT_PATH,
             json=payload,
-            auth=(servicenow_username, servicenow_password),
-            timeout=30,
             headers=headers,
         )
 
@@ -70,18 +105,8 @@ def create_servicenow_ticket(ticket):
 
         data = response.json()
 
-        ticket.servicenow_ticket_number = data.get("result", {}).get("number")
-        ticket.servicenow_sys_id = data.get("result", {}).get("sys_id")
-        ticket.ticket_creation_status = "created"
-        ticket.error_message = None
-        ticket.last_sync_attempt = timezone.now()
-        ticket.save(update_fields=[
-            "servicenow_ticket_number",
-            "servicenow_sys_id",
-            "ticket_creation_status",
-            "error_message",
-            "last_sync_attempt"
-        ])
+        mark_ticket_created(ticket, data.get("result", {}))
+        ticket.save(update_fields=CREATED_UPDATE_FIELDS)
 
 
         logger.info(
@@ -116,23 +141,112 @@ def create_servicenow_ticket(ticket):
         raise
 
 
-def fetch_servicenow_ticket_status(sys_id: str) -> str | None:
+BATCH_HEADERS = [
+    {"name": "Content-Type", "value": "application/json"},
+    {"name": "Accept", "value": "application/json"},
+]
+
+
+def build_batch_request(payloads) -> dict:
     """
-    Fetch latest ServiceNow incident state using sys_id
+    Wrap incident payloads in one Batch API request; each sub-request id is the payload's index.
     """
-    url = f"https://{servicenow_instance}.service-now.com/api/now/table/incident/{sys_id}"
-
-    headers = {
-        "Accept": "application/json"
+    return {
+        "batch_request_id": uuid.uuid4().hex,
+        "rest_requests": [
+            {
+                "id": str(index),
+                "method": "POST",
+                "url": INCIDENT_PATH,
+                "headers": BATCH_HEADERS,
+                "body": base64.b64encode(json.dumps(payload).encode()).decode(),
+            }
+            for index, payload in enumerate(payloads)
+        ],
     }
 
+
+def parse_batch_response(data, count) -> list:
+    """
+    Turn a Batch API response into one (result dict, None) or (None, error message)
+    per payload, in order. Sub-requests ServiceNow did not service count as failures.
+    """
+    outcomes = [(None, "Not serviced by the ServiceNow batch request")] * count
+    for item in data.get("serviced_requests", []):
+        index = int(item["id"])
+        status_code = item.get("status_code", 0)
+        body = base64.b64decode(item.get("body") or "").decode("utf-8", errors="replace")
+        if 200 <= status_code < 300:
+            try:
+                outcomes[index] = (json.loads(body).get("result", {}), None)
+            except ValueError:
+                outcomes[index] = (None, f"Unreadable batch response body: {body[:500]}")
+        else:
+            outcomes[index] = (None, f"HTTP {status_code}: {body[:500]}")
+    return outcomes
+
+
+def create_servicenow_incidents_batch(payloads) -> list:
+    """
+    Create many incidents with one Batch API call. Raises on transport or HTTP errors
+    of the batch request itself; per-incident failures are returned in the outcomes.
+    """
+    response = get_servicenow_client().post(BATCH_PATH, json=build_batch_request(payloads))
+    response.raise_for_status()
+    return parse_batch_response(response.json(), len(payloads))
+
+
+def apply_creation_outcomes(tickets, outcomes):
+    """
+    Mark each ticket created or failed from its outcome and save them with one
+    bulk_update per outcome. Returns (created, failed) ticket lists.
+    """
+    created, failed = [], []
+    for ticket, (result, error) in zip(tickets, outcomes):
+        if result:
+            mark_ticket_created(ticket, result)
+            created.append(ticket)
+        else:
+            mark_ticket_failed(ticket, error)
+            failed.append(ticket)
+
+    with transaction.atomic():
+        Ticket.objects.bulk_update(created, CREATED_UPDATE_FIELDS)
+        Ticket.objects.bulk_update(failed, FAILED_UPDATE_FIELDS)
+    return created, failed
+
+
+def create_servicenow_tickets(tickets, batch_size=None) -> dict:
+    """
+    Batch-mode counterpart of create_servicenow_ticket for leased tickets:
+    batch_size incidents per Batch API request. Returns {"created": n, "failed": n}.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "SERVICENOW_BATCH_SIZE", 50)
+
+    tickets = list(tickets)
+    totals = {"created": 0, "failed": 0}
+    for start in range(0, len(tickets), batch_size):
+        chunk = tickets[start:start + batch_size]
+        try:
+            outcomes = create_servicenow_incidents_batch([build_incident_payload(t) for t in chunk])
+        except Exception as e:
+            logger.exception(f"ServiceNow batch request for {len(chunk)} tickets failed")
+            outcomes = [(None, e)] * len(chunk)
+
+        created, failed = apply_creation_outcomes(chunk, outcomes)
+        totals["created"] += len(created)
+        totals["failed"] += len(failed)
+        logger.info(f"ServiceNow batch created {len(created)} incidents, {len(failed)} failed")
+    return totals
+
+
+def fetch_servicenow_ticket_status(sys_id: str) -> str | None:
+    """
+    Fetch latest ServiceNow incident state using sys_id
+    """
     try:
-        response = requests.get(
-            url,
-            auth=(servicenow_username, servicenow_password),
-            timeout=30,
-            headers=headers,
-        )
+        response = get_servicenow_client().get(f"{INCIDENT_PATH}/{sys_id}")
         response.raise_for_status()
 
         data = response.json()
@@ -140,4 +254,106 @@ def fetch_servicenow_ticket_status(sys_id: str) -> str | None:
 
     except Exception:
         logger.exception(f"Failed to fetch ServiceNow status for sys_id={sys_id}")
-        return None
\ No newline at end of file
+        return None
+
+
+def fetch_servicenow_ticket_statuses(sys_ids, chunk_size=None) -> tuple[dict[str, str], int]:
+    """
+    Fetch latest ServiceNow incident states for many sys_ids.
+    Uses sys_idIN encoded queries over one keep-alive session, one request per
+    chunk (plus extra pages if ServiceNow paginates), and returns
+    ({sys_id: state}, number of chunks that failed). Failed chunks are logged
+    and left out of the states.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, "SERVICENOW_SYNC_CHUNK_SIZE", 100)
+
+    client = get_servicenow_client()
+    sys_ids = list(dict.fromkeys(sys_ids))
+    states = {}
+    failed = 0
+    for start in range(0, len(sys_ids), chunk_size):
+        chunk = sys_ids[start:start + chunk_size]
+        offset = 0
+        try:
+            while True:
+                response = client.get(
+                    INCIDENT_PATH,
+                    params={
+                        "sysparm_query": "sys_idIN" + ",".join(chunk),
+                        "sysparm_fields": "sys_id,state",
+                        "sysparm_limit": chunk_size,
+                        "sysparm_offset": offset,
+                        "sysparm_exclude_reference_link": "true",
+                    },
+                )
+                response.raise_for_status()
+
+                results = response.json().get("result", [])
+                for row in results:
+                    states[row["sys_id"]] = row.get("state")
+
+                # a chunk can never match more rows than it has sys_ids
+                offset += len(results)
+                if not results or offset >= len(chunk):
+                    break
+
+        except Exception:
+            failed += 1
+            logger.exception(
+                f"Failed to fetch ServiceNow statuses for {len(chunk)} sys_ids "
+                f"(chunk starting at {start})"
+            )
+
+    return states, failed
+
+
+SERVICENOW_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_servicenow_datetime(value):
+    # Table API returns internal (UTC) values when sysparm_display_value is false
+    return datetime.strptime(value, SERVICENOW_DATETIME_FORMAT).replace(tzinfo=dt_timezone.utc)
+
+
+def fetch_servicenow_updated_incidents(since, page_size=None) -> list[dict]:
+    """
+    Fetch sys_id, state and sys_updated_on of every incident this app raised
+    (virtual_agent contact type, SERVICENOW_SYSID caller) updated at or after `since`,
+    oldest first. Raises on HTTP errors so the caller keeps its previous watermark.
+    """
+    if page_size is None:
+        page_size = getattr(settings, "SERVICENOW_SYNC_PAGE_SIZE", 1000)
+
+    client = get_servicenow_client()
+    since_utc = since.astimezone(dt_timezone.utc).strftime(SERVICENOW_DATETIME_FORMAT)
+    # only incidents this app created (see build_incident_payload), not every change on the instance
+    query = f"sys_updated_on>={since_utc}^contact_type=virtual_agent"
+    if servicenow_sys_id:
+        query += f"^caller_id={servicenow_sys_id}"
+    query += "^ORDERBYsys_updated_on"
+
+    rows = []
+    offset = 0
+    while True:
+        response = client.get(
+            INCIDENT_PATH,
+            params={
+                "sysparm_query": query,
+                "sysparm_fields": "sys_id,state,sys_updated_on",
+                "sysparm_limit": page_size,
+                "sysparm_offset": offset,
+                "sysparm_display_value": "false",
+                "sysparm_exclude_reference_link": "true",
+            },
+        )
+        response.raise_for_status()
+
+        results = response.json().get("result", [])
+        rows.extend(results)
+        if len(results) < page_size:
+            break
+        offset += len(results)
+
+    logger.debug(f"Fetched {len(rows)} ServiceNow incidents updated since {since_utc}")
+    return rows
@@ -0,0 +1,247 @@
+"""In-memory stand-in for the ServiceNow endpoints this project calls, for load tests.
+
+Covers the incident and sys_user_group tables of the Table API (create, get by
+sys_id, sys_idIN, sys_updated_on>= and field=value list queries with paging) and the Batch
+API. Latency, server errors and 429 throttling can be injected, and a churn
+rate moves incidents through their states so status syncs have work to do.
+"""
+
+import base64
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+TABLE_RE = re.compile(r"^/api/now/table/(incident|sys_user_group)(?:/([^/]+))?$")
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# New -> In Progress -> On Hold -> Resolved -> Closed
+STATE_FLOW = {"1": "2", "2": "3", "3": "6", "6": "7"}
+
+
+def servicenow_now():
+    return datetime.now(timezone.utc).strftime(DATETIME_FORMAT)
+
+
+class SimulatorState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {"incident": {}, "sys_user_group": {}}
+        self.incident_number = 0
+        self.requests = 0
+        self.injected_errors = 0
+        self.throttled = 0
+
+    def insert(self, table, fields):
+        with self.lock:
+            record = dict(fields)
+            record["sys_id"] = uuid.uuid4().hex
+            record["sys_updated_on"] = servicenow_now()
+            if table == "incident":
+                self.incident_number += 1
+                record["number"] = f"INC{self.incident_number:07d}"
+                record["state"] = "1"
+            self.tables[table][record["sys_id"]] = record
+            return dict(record)
+
+    def get(self, table, sys_id):
+        with self.lock:
+            record = self.tables[table].get(sys_id)
+            return dict(record) if record else None
+
+    def query(self, table, query, limit, offset):
+        with self.lock:
+            records = list(self.tables[table].values())
+        for term in filter(None, query.split("^")):
+            if term.startswith("sys_idIN"):
+                wanted = set(term[len("sys_idIN"):].split(","))
+                records = [r for r in records if r["sys_id"] in wanted]
+            elif term.startswith("sys_updated_on>="):
+                since = term[len("sys_updated_on>="):]
+                records = [r for r in records if r["sys_updated_on"] >= since]
+            elif term.startswith("ORDERBY"):
+                field = term[len("ORDERBY"):]
+                records.sort(key=lambda r: r.get(field) or "")
+            elif "=" in term:
+                # plain equality, e.g. name=... or caller_id=...
+                field, value = term.split("=", 1)
+                records = [r for r in records if str(r.get(field)) == value]
+        return [dict(r) for r in records[offset:offset + limit]]
+
+    def churn(self, fraction):
+        """Move a random fraction of open incidents to their next state."""
+        with self.lock:
+            open_incidents = [r for r in self.tables["incident"].values() if r["state"] in STATE_FLOW]
+            count = int(len(open_incidents) * fraction)
+            now = servicenow_now()
+            for record in random.sample(open_incidents, count):
+                record["state"] = STATE_FLOW[record["state"]]
+                record["sys_updated_on"] = now
+        return count
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _inject(self):
+        """Apply configured latency and faults. Returns True when a fault response was sent."""
+        server = self.server
+        with server.state.lock:
+            server.state.requests += 1
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        roll = random.random()
+        if roll < server.throttle_rate:
+            with server.state.lock:
+                server.state.throttled += 1
+            self._send(429, {"error": {"message": "Too many requests"}}, [("Retry-After", str(server.retry_after))])
+            return True
+        if roll < server.throttle_rate + server.error_rate:
+            with server.state.lock:
+                server.state.injected_errors += 1
+            self._send(500, {"error": {"message": "Injected server error"}})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = TABLE_RE.match(url.path)
+        if not match:
+            return self._send(404, {"error": {"message": "No such endpoint"}})
+        if self._inject():
+            return
+        table, sys_id = match.groups()
+        if sys_id:
+            record = self.server.state.get(table, sys_id)
+            if record is None:
+                return self._send(404, {"error": {"message": "No Record found"}})
+            return self._send(200, {"result": record})
+
+        params = parse_qs(url.query)
+        results = self.server.state.query(
+            table,
+            params.get("sysparm_query", [""])[0],
+            int(params.get("sysparm_limit", ["10000"])[0]),
+            int(params.get("sysparm_offset", ["0"])[0]),
+        )
+        fields = params.get("sysparm_fields", [""])[0]
+        if fields:
+            wanted = fields.split(",")
+            results = [{k: r.get(k) for k in wanted} for r in results]
+        self._send(200, {"result": results})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        if url.path == "/api/now/v1/batch":
+            if self._inject():
+                return
+            return self._send(200, self._batch(body))
+
+        match = TABLE_RE.match(url.path)
+        if not match or match.group(2):
+            return self._send(404, {"error": {"message": "No such endpoint"}})
+        if self._inject():
+            return
+        self._send(201, {"result": self.server.state.insert(match.group(1), body)})
+
+    def _batch(self, body):
+        serviced = []
+        for item in body.get("rest_requests", []):
+            match = TABLE_RE.match(urlparse(item.get("url", "")).path)
+            if item.get("method") != "POST" or not match or match.group(2):
+                status, result = 400, {"error": {"message": "Unsupported batch sub-request"}}
+            else:
+                payload = json.loads(base64.b64decode(item.get("body") or b"e30="))
+                status, result = 201, {"result": self.server.state.insert(match.group(1), payload)}
+            serviced.append({
+                "id": item.get("id"),
+                "status_code": status,
+                "body": base64.b64encode(json.dumps(result).encode()).decode(),
+            })
+        return {
+            "batch_request_id": body.get("batch_request_id"),
+            "serviced_requests": serviced,
+            "unserviced_requests": [],
+        }
+
+
+class ServiceNowSimulator(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency_ms=0,
+        jitter_ms=0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=1,
+        churn=0.0,
+    ):
+        super().__init__(address, SimulatorHandler)
+        self.state = SimulatorState()
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.churn_rate = churn
+        self._churn_thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _churn_loop(self):
+        while True:
+            time.sleep(1)
+            self.state.churn(self.churn_rate)
+
+    def start_churn(self):
+        if self.churn_rate and self._churn_thread is None:
+            self._churn_thread = threading.Thread(target=self._churn_loop, name="sn-sim-churn", daemon=True)
+            self._churn_thread.start()
+
+    def start(self):
+        """Serve from a background thread (for tests and the load-test harness)."""
+        self.start_churn()
+        threading.Thread(target=self.serve_forever, name="sn-simulator", daemon=True).start()
+        return self
+
+    def stats(self):
+        with self.state.lock:
+            return {
+                "requests": self.state.requests,
+                "throttled": self.state.throttled,
+                "injected_errors": self.state.injected_errors,
+                "incidents": len(self.state.tables["incident"]),
+                "groups": len(self.state.tables["sys_user_group"]),
+            }
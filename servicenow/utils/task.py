@@ -1,21 +1,51 @@
 import logging
+from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 from tickets.models import Ticket
+from servicenow.models import SyncWatermark
+from servicenow.utils.retry import (
+    FAILED_UPDATE_FIELDS,
+    acquire_ticket_lease,
+    claim_due_tickets,
+    claim_tickets,
+    mark_ticket_failed,
+)
 from servicenow.utils.servicenow import (
     create_servicenow_ticket,
-    fetch_servicenow_ticket_status,
+    create_servicenow_tickets,
+    fetch_servicenow_ticket_statuses,
+    fetch_servicenow_updated_incidents,
+    parse_servicenow_datetime,
 )
 from django.db.models import Q
 
 logger = logging.getLogger(__name__)
 
+SERVICENOW_STATE_CHOICES = {
+    "1": "New",
+    "2": "In-Progress",
+    "3": "On-Hold",
+    "6": "Resolved",
+    "7": "Closed",
+    "8": "Canceled",
+}
+
+STATUS_SYNC_WATERMARK = "incident_status"
+
 
 @shared_task(bind=True,)
-def process_ticket_task(self, ticket_id):
+def process_ticket_task(self, ticket_id, lease_token=None):
     """
     Celery task to sync ticket with ServiceNow.
+    Runs only while holding the ticket's lease, so duplicate deliveries of the
+    same ticket never create two incidents.
     """
+    if acquire_ticket_lease(ticket_id, lease_token) is None:
+        logger.info(f"Ticket {ticket_id} is leased by another worker or already created, skipping")
+        return
+
     ticket = Ticket.objects.get(id=ticket_id)
 
     try:
@@ -24,57 +54,144 @@ def process_ticket_task(self, ticket_id):
         create_servicenow_ticket(ticket)
 
     except Exception as e:
-        ticket.ticket_creation_status = "failed"
-        ticket.sync_attempts += 1
-        ticket.last_sync_attempt = timezone.now()
-        ticket.error_message = str(e)
-        ticket.save(
-            update_fields=[
-                "ticket_creation_status",
-                "sync_attempts",
-                "last_sync_attempt",
-                "error_message",
-            ]
-        )
+        mark_ticket_failed(ticket, e)
+        ticket.save(update_fields=FAILED_UPDATE_FIELDS)
 
         logger.exception(f"Celery failed for ticket {ticket.id}")
         raise
 
 
 @shared_task(bind=True,)
-def sync_servicenow_ticket_statuses(self):
+def process_ticket_batch_task(self, ticket_ids, lease_token):
     """
-    Periodically sync ServiceNow ticket status into local DB
+    Batch-mode counterpart of process_ticket_task: creates the incidents of
+    every ticket still held under lease_token through the Batch API.
     """
-    tickets = Ticket.objects.exclude(
+    tickets = list(Ticket.objects.filter(id__in=ticket_ids, lease_token=lease_token))
+    if len(tickets) < len(ticket_ids):
+        logger.info(f"{len(ticket_ids) - len(tickets)} tickets lost their lease, skipping them")
+    if tickets:
+        logger.info(f"Celery processing {len(tickets)} tickets in batch mode")
+        create_servicenow_tickets(tickets)
+
+
+def enqueue_ticket_creation(ticket_ids, lease_token=None):
+    """
+    Queue ServiceNow creation for many tickets: one process_ticket_task per ticket,
+    or, when SERVICENOW_CREATE_MODE is "batch", one process_ticket_batch_task per
+    SERVICENOW_BATCH_SIZE tickets. Tickets are leased first unless lease_token is given,
+    and tickets another worker or the retry sweep already holds are skipped.
+    """
+    if lease_token is None:
+        ticket_ids, lease_token = claim_tickets(ticket_ids)
+
+    if getattr(settings, "SERVICENOW_CREATE_MODE", "single") != "batch":
+        for ticket_id in ticket_ids:
+            process_ticket_task.delay(ticket_id, lease_token=lease_token)
+            logger.debug(f"Creating servicenow ticket #{ticket_id}")
+        return
+
+    batch_size = getattr(settings, "SERVICENOW_BATCH_SIZE", 50)
+    for start in range(0, len(ticket_ids), batch_size):
+        process_ticket_batch_task.delay(ticket_ids[start:start + batch_size], lease_token)
+
+
+# Apply {sys_id: state} to tickets, writing only the ones whose status changed
+def apply_servicenow_states(tickets, sn_states):
+    changed = []
+    for ticket in tickets:
+        sn_state = sn_states.get(ticket.servicenow_sys_id)
+        if not sn_state:
+            continue
+        status = SERVICENOW_STATE_CHOICES.get(sn_state.strip().lower())
+        if status is None:
+            logger.warning(
+                f"Unknown ServiceNow state {sn_state} for ticket - {ticket.servicenow_ticket_number}"
+            )
+            continue
+        if status != ticket.servicenow_ticket_status:
+            ticket.servicenow_ticket_status = status
+            changed.append(ticket)
+            logger.debug(
+                f"ServiceNow State: {ticket.servicenow_ticket_status} for ticket - {ticket.servicenow_ticket_number}"
+            )
+
+    Ticket.objects.bulk_update(changed, ["servicenow_ticket_status"], batch_size=500)
+    return len(changed)
+
+
+def open_servicenow_tickets():
+    return Ticket.objects.exclude(
         Q(servicenow_sys_id__isnull=True)
         | Q(servicenow_ticket_status__in=["Resolved", "Closed", "Canceled"])
+    ).only("id", "servicenow_sys_id", "servicenow_ticket_number", "servicenow_ticket_status")
+
+
+def full_status_sync():
+    """
+    Sync every open ticket. Returns (updated count, whether every chunk was read).
+    """
+    tickets = list(open_servicenow_tickets())
+    logger.info(f"Starting full ServiceNow status sync for {len(tickets)} tickets")
+    sn_states, failed_chunks = fetch_servicenow_ticket_statuses(
+        [ticket.servicenow_sys_id for ticket in tickets]
     )
+    return apply_servicenow_states(tickets, sn_states), failed_chunks == 0
+
+
+def incremental_status_sync(since):
+    """
+    Sync only incidents updated since the watermark. Returns (updated count, newest sys_updated_on).
+    """
+    rows = fetch_servicenow_updated_incidents(since)
+    logger.info(f"Starting incremental ServiceNow status sync, {len(rows)} incidents changed since {since}")
+    if not rows:
+        return 0, None
+
+    sn_states = {row["sys_id"]: row.get("state") for row in rows}
+    newest = max(parse_servicenow_datetime(row["sys_updated_on"]) for row in rows)
+
+    updated = 0
+    sys_ids = list(sn_states)
+    for start in range(0, len(sys_ids), 500):
+        tickets = open_servicenow_tickets().filter(servicenow_sys_id__in=sys_ids[start:start + 500])
+        updated += apply_servicenow_states(tickets, sn_states)
+    return updated, newest
+
 
-    logger.info(f"Starting ServiceNow status sync for {tickets.count()} tickets")
+@shared_task(bind=True,)
+def sync_servicenow_ticket_statuses(self, full=False):
+    """
+    Periodically sync ServiceNow ticket status into local DB.
+    After a first full sync only incidents updated since the stored sys_updated_on
+    watermark are read, re-reading an overlap window to tolerate clock skew.
+    """
+    watermark, _ = SyncWatermark.objects.get_or_create(name=STATUS_SYNC_WATERMARK)
+    started_at = timezone.now()
+    overlap = timedelta(seconds=getattr(settings, "SERVICENOW_SYNC_OVERLAP_SECONDS", 120))
 
     try:
-        for ticket in tickets:
-            sn_state = fetch_servicenow_ticket_status(ticket.servicenow_sys_id)
-            if not sn_state:
-                continue
-            sn_state_normalized = sn_state.strip().lower()
-
-            sn_state_choices = {
-                "1": "New",
-                "2": "In-Progress",
-                "3": "On-Hold",
-                "6": "Resolved",
-                "7": "Closed",
-                "8": "Canceled",
-            }
-            ticket.servicenow_ticket_status = sn_state_choices[str(sn_state_normalized)]
-            logger.debug(
-                f"ServiceNow State: {ticket.servicenow_ticket_status} for ticket - {ticket.servicenow_ticket_number}"
-            )
-            ticket.save()
+        if full or watermark.last_updated_on is None:
+            updated, complete = full_status_sync()
+            if complete:
+                # everything up to the start of this run has been read
+                new_mark = started_at - overlap
+            else:
+                # tickets in the failed chunks were not read; keep the old watermark
+                # (or none, so the next run is a full sync again)
+                logger.warning("Full ServiceNow status sync was incomplete, watermark not advanced")
+                new_mark = None
+        else:
+            updated, newest = incremental_status_sync(watermark.last_updated_on - overlap)
+            new_mark = newest
+
+        if new_mark is not None and (
+            watermark.last_updated_on is None or new_mark > watermark.last_updated_on
+        ):
+            watermark.last_updated_on = new_mark
+            watermark.save(update_fields=["last_updated_on", "updated_at"])
 
-        logger.info("ServiceNow status sync completed")
+        logger.info(f"ServiceNow status sync completed, {updated} tickets updated")
     except Exception as e:
         logger.exception(f"Status update failed: {e}")
         raise
@@ -82,14 +199,17 @@ def sync_servicenow_ticket_statuses(self):
 
 @shared_task
 def servicenow_ticket_retry():
-    tickets = Ticket.objects.filter(
-        ticket_creation_status__in=["pending","failed"]
+    """
+    Enqueue creation for pending/failed tickets whose backoff has elapsed.
+    Each ticket is leased before it is queued, so a ticket that is still
+    queued or in flight is not enqueued again.
+    """
+    ticket_ids, lease_token = claim_due_tickets(
+        limit=getattr(settings, "SERVICENOW_RETRY_BATCH_SIZE", 500)
     )
-    if tickets:
-        logger.info("Servicenow sheduled retry started...")
-        for ticket in tickets:
-            process_ticket_task.delay(ticket.id)
-            logger.debug(f"Creating servicenow ticket #{ticket.id}")
+    if ticket_ids:
+        logger.info(f"Servicenow sheduled retry started for {len(ticket_ids)} tickets...")
+        enqueue_ticket_creation(ticket_ids, lease_token=lease_token)
         logger.info("Servicenow sheduled retry completed")
     else:
-        logger.info("No pending or failed request to create the servicenow ticket")
\ No newline at end of file
+        logger.info("No pending or failed request due to create the servicenow ticket")
\ No newline at end of file
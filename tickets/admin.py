@@ -1,7 +1,7 @@
 from django.contrib import admin
-from .models import Ticket, EmailTicket
+from .models import Ticket, EmailTicket, RawEmail, DeadLetterEmail, TicketOutbox, MailboxWatermark
 
-"""Admin configuration for Ticket and EmailTicket models."""
+"""Admin configuration for Ticket, EmailTicket, RawEmail, DeadLetterEmail, TicketOutbox and MailboxWatermark models."""
 
 @admin.register(Ticket)
 class TicketAdmin(admin.ModelAdmin):
@@ -32,4 +32,29 @@ class TicketAdmin(admin.ModelAdmin):
 class EmailTicketAdmin(admin.ModelAdmin):
     list_display = ("uid", "sender", "subject", "received_at", "reply_sent", "ticket")
     search_fields = ("uid", "sender", "subject")
+    raw_id_fields = ("ticket", "raw_message")
+
+
+@admin.register(RawEmail)
+class RawEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "size", "created_at")
+    exclude = ("data",)
+
+
+@admin.register(DeadLetterEmail)
+class DeadLetterEmailAdmin(admin.ModelAdmin):
+    list_display = ("uid", "account_key", "folder", "stage", "created_at")
+    list_filter = ("stage", "account_key")
+    search_fields = ("uid", "error")
+    raw_id_fields = ("raw_message",)
+
+@admin.register(TicketOutbox)
+class TicketOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "ticket", "task", "created_at", "dispatched_at")
+    list_filter = ("task",)
     raw_id_fields = ("ticket",)
+
+
+@admin.register(MailboxWatermark)
+class MailboxWatermarkAdmin(admin.ModelAdmin):
+    list_display = ("account_key", "folder", "uidvalidity", "last_uid", "updated_at")
@@ -0,0 +1,43 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tickets.models import EmailTicket, RawEmail
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Move raw messages from the legacy EmailTicket.raw_email column to compressed RawEmail rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200, help="Email tickets moved per transaction")
+
+    def handle(self, *args, **options):
+        moved = 0
+        while True:
+            with transaction.atomic():
+                # rows leave the filter once moved, so each pass picks up the next ones
+                email_tickets = list(
+                    EmailTicket.objects.select_for_update()
+                    .filter(raw_message__isnull=True, raw_email__isnull=False)
+                    .exclude(raw_email="")
+                    .only("id", "raw_email")
+                    .order_by("id")[:options["batch_size"]]
+                )
+                if not email_tickets:
+                    break
+                raw_messages = RawEmail.objects.bulk_create([
+                    RawEmail.compress(email_ticket.raw_email.encode("utf8", errors="replace"))
+                    for email_ticket in email_tickets
+                ])
+                for email_ticket, raw_message in zip(email_tickets, raw_messages):
+                    email_ticket.raw_message = raw_message
+                    email_ticket.raw_email = None
+                EmailTicket.objects.bulk_update(email_tickets, ["raw_message", "raw_email"])
+            moved += len(email_tickets)
+            self.stdout.write(f"Moved {moved} raw emails...")
+
+        # empty strings carry nothing worth keeping
+        cleared = EmailTicket.objects.filter(raw_email="").update(raw_email=None)
+        logger.info(f"Raw email backfill moved {moved} messages, cleared {cleared} empty ones")
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} raw emails to RawEmail"))
@@ -1,93 +1,43 @@
 import logging
-import time
 from django.core.management.base import BaseCommand
-from imapclient import IMAPClient
-from django.conf import settings
-from email import message_from_bytes
-from email.utils import parseaddr
-from tickets.utils.extractmail import decode_header_value, get_email_body
-from tickets.views import email_ticket_create
-from django.contrib.auth import get_user_model
-from account.utils.emailuser import get_or_create_user_by_email
+from tickets.utils.mailmonitor import MailboxMonitor, monitored_mailboxes, parse_mailbox
 
 logger = logging.getLogger(__name__)
-User = get_user_model()
 
-POLL_INTERVAL = 60  # seconds
 
 class Command(BaseCommand):
-    help = "Monitor inbox, create tickets, and send reply emails"
+    help = "Monitor the configured mailboxes with IMAP IDLE (or polling), create tickets, and send reply emails"
 
-    account_key = "support"
-    accounts = getattr(settings, "EMAIL_ACCOUNTS", {})
-    config = accounts[account_key]
-    host = settings.EMAIL_IMAP_HOST
-    username = config["EMAIL_HOST_USER"]
-    password = config["EMAIL_HOST_PASSWORD"]
+    def add_arguments(self, parser):
+        parser.add_argument("--mailbox", action="append", default=None, metavar="ACCOUNT[:FOLDER]",
+                            help="Mailbox to watch; repeat for several (default EMAIL_MONITORED_MAILBOXES)")
+        parser.add_argument("--no-idle", action="store_true", help="Poll instead of using IMAP IDLE")
+        parser.add_argument("--poll-interval", type=int, default=None,
+                            help="Seconds between polls and before reconnecting (default EMAIL_POLL_INTERVAL)")
+        parser.add_argument("--status-interval", type=int, default=None,
+                            help="Seconds between health reports (default EMAIL_MONITOR_STATUS_SECONDS)")
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS("Starting mailbox monitor..."))
-
-        while True:
-            try:
-                with IMAPClient(self.host, ssl=True) as client:
-                    client.login(self.username, self.password)
-                    logger.info("Logged in to IMAP as %s", self.username)
-
-                    # main polling loop for this connection
-                    while True:
-                        client.select_folder("INBOX", readonly=False)
-
-                        uids = client.search(["UNSEEN"])
-                        logger.debug("Found %d unseen messages", len(uids))
-
-                        for uid in uids:
-                            data = client.fetch(uid, ["RFC822"])
-                            raw = data[uid][b"RFC822"]
-                            msg = message_from_bytes(raw)
-
-                            subject = decode_header_value(msg["Subject"])
-                            body = get_email_body(msg)
-                            sender = parseaddr(msg["From"])[1]
-
-                            self.stdout.write("\n" + "=" * 60)
-                            self.stdout.write(f"Processing email UID {uid}")
-                            self.stdout.write(f"From: {sender}")
-                            self.stdout.write(f"Subject: {subject}")
-
-                            user = User.objects.filter(email__iexact=sender).first()
-                            if not user:
-                                user, reset_url = get_or_create_user_by_email(
-                                    sender, True, self.account_key
-                                )
-
-                            ticket, email_ticket = email_ticket_create(
-                                email_uid=uid,
-                                sender=sender,
-                                subject=subject,
-                                body=body,
-                                raw_email=raw.decode("utf8", errors="replace"),
-                                user=User.objects.filter(email__iexact=sender).first(),
-                                account_key=self.account_key,
-                            )
-
-                            # Mark as seen
-                            client.add_flags(uid, [r"\Seen"])
-                            logger.info("Email UID %s marked as seen.", uid)
-                            self.stdout.write("=" * 60 + "\n")
-                            logger.info("Processed email UID %s.", uid)
-
-                        logger.info(
-                            "Sleeping for POLL_INTERVAL - %s seconds before next check.",
-                            POLL_INTERVAL,
-                        )
-                        time.sleep(POLL_INTERVAL)
-
-            except Exception as e:
-                self.stderr.write(self.style.ERROR(f"Error: {e}"))
-                logger.error("Exception in monitoring loop: %s", str(e))
-                logger.info(
-                    "Sleeping for POLL_INTERVAL - %s seconds after error.",
-                    POLL_INTERVAL,
-                )
-                time.sleep(POLL_INTERVAL)
+        mailboxes = [parse_mailbox(m) for m in options["mailbox"]] if options["mailbox"] else monitored_mailboxes()
+        self.stdout.write(self.style.SUCCESS(
+            "Starting mailbox monitor for " + ", ".join(f"{a}/{f}" for a, f in mailboxes)
+        ))
+
+        def report(processed):
+            for ticket, email_ticket in processed:
+                self.stdout.write(f"Processed email UID {email_ticket.uid} -> Ticket #{ticket.id}")
+
+        monitor = MailboxMonitor(
+            mailboxes,
+            use_idle=False if options["no_idle"] else None,
+            poll_interval=options["poll_interval"],
+            on_processed=report,
+        )
+        try:
+            monitor.run(status_interval=options["status_interval"])
+        except KeyboardInterrupt:
+            pass
+        status = monitor.status()
+        for key, mailbox in status["mailboxes"].items():
+            self.stdout.write(f"{key}: {mailbox}")
+        self.stdout.write(f"Pipeline stats: {status['pipeline']}")
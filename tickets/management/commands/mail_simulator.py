@@ -0,0 +1,64 @@
+import random
+import threading
+import time
+from email.message import EmailMessage
+from django.core.management.base import BaseCommand
+from tickets.utils.imapsimulator import ImapSimulator
+
+SAMPLE_SUBJECTS = [
+    "VPN keeps disconnecting",
+    "Cannot log in to my laptop",
+    "Printer on floor 3 is jammed",
+    "Outlook not syncing emails",
+    "Request access to the finance share",
+    "Server is down in the data center",
+]
+
+
+def sample_message(sender, recipient, number):
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = f"{random.choice(SAMPLE_SUBJECTS)} #{number}"
+    message.set_content(f"Hello support,\n\nGenerated test message {number}.\n")
+    return message.as_bytes()
+
+
+class Command(BaseCommand):
+    help = "Run a local in-memory IMAP server (with IDLE) for testing the mail monitor"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=1143)
+        parser.add_argument("--no-idle", action="store_true", help="Do not advertise the IDLE capability")
+        parser.add_argument("--user", action="append", default=None,
+                            help="Mailbox that receives generated mail; repeat for several (default support@example.com)")
+        parser.add_argument("--sender", default="user@example.com")
+        parser.add_argument("--rate", type=float, default=0.0, help="Generated messages per second per mailbox (0 = none)")
+
+    def handle(self, *args, **options):
+        server = ImapSimulator((options["host"], options["port"]), idle=not options["no_idle"])
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(
+            f"IMAP simulator listening on {host}:{port} "
+            f"(set EMAIL_IMAP_HOST={host} EMAIL_IMAP_PORT={port} EMAIL_IMAP_SSL=False)"
+        ))
+
+        if options["rate"]:
+            def generate(user):
+                number = 0
+                while True:
+                    number += 1
+                    server.deliver(user, sample_message(options["sender"], user, number))
+                    time.sleep(1 / options["rate"])
+
+            for user in options["user"] or ["support@example.com"]:
+                threading.Thread(target=generate, args=(user,), name=f"imap-sim-{user}", daemon=True).start()
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Simulator stats: {server.stats()}")
@@ -0,0 +1,36 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from tickets.utils.outbox import relay_ticket_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Relay the ticket outbox to Celery continuously (lower latency than the 5 second beat task)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0.5, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--batch-size", type=int, default=None, help="Outbox rows published per pass")
+        parser.add_argument("--once", action="store_true", help="Drain the outbox once and exit")
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Starting ticket outbox relay..."))
+        while True:
+            try:
+                relayed = relay_ticket_outbox(options["batch_size"])
+            except Exception as e:
+                # broker unavailable: rows stay in the outbox until the next pass
+                logger.error("Outbox relay failed: %s", str(e))
+                relayed = 0
+                if options["once"]:
+                    raise
+                time.sleep(max(options["interval"], 5))
+                continue
+
+            if relayed:
+                self.stdout.write(f"Relayed {relayed} outbox messages")
+            elif options["once"]:
+                break
+            else:
+                time.sleep(options["interval"])
@@ -1,9 +1,10 @@
+"""Models for IT Ticket Automation System"""
+
+import zlib
 from django.db import models
 from django.contrib.auth.models import User
 from servicenow.models import AssignmentGroup
 
-"""Models for IT Ticket Automation System"""
-
 # Ticket model to store IT ticket details
 class Ticket(models.Model):
     CATEGORY_CHOICES = [
@@ -23,10 +24,12 @@ class Ticket(models.Model):
         ("vendor","Vendor"),
     ]
     STATUS_CHOICES = [
+        ("triaging", "Triaging"),
         ("pending", "Pending"),
         ("created", "Created"),
         ("failed", "Failed"),
         ("retrying", "Retrying"),
+        ("dead_letter", "Dead Letter"),
     ]
     PRIORITY_CHOICES = [
         ("critical","Critical"),
@@ -64,14 +67,36 @@ class Ticket(models.Model):
     )  
     sync_attempts = models.IntegerField(default=0)
     last_sync_attempt = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # only the holder of an unexpired lease may call ServiceNow for this ticket
+    lease_token = models.CharField(max_length=32, blank=True, null=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True, null=True)
     request_type = models.CharField(
-        max_length=20, choices=[("web", "Web"), ("email", "Email")], default="web"
+        max_length=20, choices=[("web", "Web"), ("email", "Email"), ("loadtest", "Load test")], default="web"
     )
 
     def __str__(self):
         return f"Issue: {self.title} - Ticket: {self.servicenow_ticket_number} - Status: {self.ticket_creation_status} - Category:{self.category}"
 
+# Compressed RFC822 source of an ingested email, kept out of the EmailTicket table
+class RawEmail(models.Model):
+    data = models.BinaryField(help_text="zlib-compressed message")
+    size = models.PositiveIntegerField(help_text="Uncompressed size in bytes")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def compress(cls, raw):
+        # unsaved, so a batch of emails can be stored with one bulk_create
+        return cls(data=zlib.compress(raw), size=len(raw))
+
+    def raw_bytes(self):
+        return zlib.decompress(self.data)
+
+    def __str__(self):
+        return f"Raw email #{self.id} ({self.size} bytes)"
+
+
 # Email ticket model 
 class EmailTicket(models.Model):
     uid = models.CharField(
@@ -80,7 +105,16 @@ class EmailTicket(models.Model):
     sender = models.EmailField(blank=True, null=True)
     subject = models.CharField(max_length=255, blank=True, null=True)
     body = models.TextField(blank=True, null=True)
-    raw_email = models.TextField(blank=True, null=True)
+    raw_message = models.OneToOneField(
+        RawEmail,
+        on_delete=models.SET_NULL,
+        related_name="email_ticket",
+        null=True,
+        blank=True,
+        help_text="Original message, stored compressed",
+    )
+    # kept until email_backfill_raw has moved older messages to raw_message
+    raw_email = models.TextField(blank=True, null=True, help_text="Legacy uncompressed message")
     received_at = models.DateTimeField(auto_now_add=True)
     reply_sent = models.BooleanField(default=False)
 
@@ -103,4 +137,59 @@ class EmailTicket(models.Model):
     def __str__(self):
         # show subject or fallback to uid
         return f"{self.subject or self.uid} - {self.sender or '-'} "
-    
\ No newline at end of file
+    
+
+# Emails the ingest pipeline could not turn into a ticket; the watermark moves past them
+class DeadLetterEmail(models.Model):
+    uid = models.CharField(max_length=255, unique=True, help_text="Same key as EmailTicket.uid")
+    account_key = models.CharField(max_length=50)
+    folder = models.CharField(max_length=255, default="INBOX")
+    stage = models.CharField(max_length=20, help_text="Pipeline stage that failed")
+    error = models.TextField(blank=True)
+    raw_message = models.OneToOneField(
+        RawEmail,
+        on_delete=models.SET_NULL,
+        related_name="dead_letter",
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.uid} ({self.stage})"
+
+# Outbox of Celery dispatches, written in the same transaction as the ticket
+class TicketOutbox(models.Model):
+    TASK_CHOICES = [
+        ("create_incident", "Create Incident"),
+        ("triage", "Triage"),
+    ]
+
+    ticket = models.ForeignKey(
+        Ticket, on_delete=models.CASCADE, related_name="outbox_messages"
+    )
+    task = models.CharField(max_length=20, choices=TASK_CHOICES, default="create_incident")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # triage rows stay until the task commits its result and are re-sent if it never does
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} - Ticket #{self.ticket_id}"
+
+
+# Last ingested IMAP UID per mailbox folder; UIDs are only comparable within one UIDVALIDITY
+class MailboxWatermark(models.Model):
+    account_key = models.CharField(max_length=50)
+    folder = models.CharField(max_length=255, default="INBOX")
+    uidvalidity = models.BigIntegerField(null=True, blank=True)
+    last_uid = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("account_key", "folder")
+
+    def __str__(self):
+        return f"{self.account_key}/{self.folder} - UID {self.last_uid}"
@@ -1,3 +1,243 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from servicenow.utils.retry import mark_ticket_failed
+from tickets.management.commands.mail_simulator import sample_message
+from tickets.models import EmailTicket, MailboxWatermark, Ticket, TicketOutbox
+from tickets.utils.imapsimulator import ImapSimulator, Mailbox
+from tickets.utils.mailingest import get_watermark, ingest_new_messages
+from tickets.utils.mailwatch import connect_mailbox, watch_mailbox
+from tickets.utils.outbox import relay_ticket_outbox
+from tickets.utils.triage import triage_ticket_task
 
-# Create your tests here.
+PREDICTION = {"category": "network", "category_confidence": 0.9, "priority": "high", "priority_confidence": 0.8}
+
+
+def create_ticket(**fields):
+    return Ticket.objects.create(title="VPN down", description="d", category="network", priority="high", **fields)
+
+
+@mock.patch("tickets.utils.outbox.triage_ticket_task.delay")
+@mock.patch("tickets.utils.outbox.enqueue_ticket_creation")
+class OutboxRelayTests(TestCase):
+    def test_publishes_and_deletes_rows(self, enqueue, triage_delay):
+        first, second = create_ticket(), create_ticket(ticket_creation_status="triaging")
+        TicketOutbox.objects.create(ticket=first, task="create_incident")
+        TicketOutbox.objects.create(ticket=first, task="create_incident")
+        TicketOutbox.objects.create(ticket=second, task="triage")
+
+        self.assertEqual(relay_ticket_outbox(), 3)
+        enqueue.assert_called_once_with([first.id])
+        triage_delay.assert_called_once_with(second.id)
+        # the triage row waits for the task to commit
+        self.assertEqual(list(TicketOutbox.objects.values_list("task", flat=True)), ["triage"])
+        self.assertIsNotNone(TicketOutbox.objects.get().dispatched_at)
+
+    def test_respects_batch_size(self, enqueue, triage_delay):
+        tickets = [create_ticket() for _ in range(3)]
+        for ticket in tickets:
+            TicketOutbox.objects.create(ticket=ticket)
+
+        self.assertEqual(relay_ticket_outbox(batch_size=2), 2)
+        enqueue.assert_called_once_with([tickets[0].id, tickets[1].id])
+        self.assertEqual(list(TicketOutbox.objects.values_list("ticket_id", flat=True)), [tickets[2].id])
+
+    def test_keeps_rows_when_the_broker_is_down(self, enqueue, triage_delay):
+        enqueue.side_effect = ConnectionError("broker down")
+        TicketOutbox.objects.create(ticket=create_ticket())
+
+        with self.assertRaises(ConnectionError):
+            relay_ticket_outbox()
+        self.assertEqual(TicketOutbox.objects.count(), 1)
+
+
+@override_settings(TICKET_TRIAGE_TIMEOUT_SECONDS=300)
+@mock.patch("tickets.utils.outbox.enqueue_ticket_creation")
+class AsyncTriageTests(TestCase):
+    def setUp(self):
+        self.ticket = create_ticket(ticket_creation_status="triaging")
+        TicketOutbox.objects.create(ticket=self.ticket, task="triage")
+
+    def test_lost_triage_task_is_sent_again(self, enqueue):
+        with mock.patch("tickets.utils.outbox.triage_ticket_task.delay") as triage_delay:
+            self.assertEqual(relay_ticket_outbox(), 1)
+            self.assertEqual(relay_ticket_outbox(), 0)
+            TicketOutbox.objects.update(dispatched_at=timezone.now() - timedelta(seconds=301))
+            self.assertEqual(relay_ticket_outbox(), 1)
+        self.assertEqual(triage_delay.call_count, 2)
+
+    @mock.patch("tickets.utils.triage.triage", return_value=PREDICTION)
+    def test_task_commits_result_and_outbox_handover(self, triage, enqueue):
+        triage_ticket_task.run(self.ticket.id)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.ticket_creation_status, "pending")
+        self.assertEqual(list(TicketOutbox.objects.values_list("task", flat=True)), ["create_incident"])
+
+        # a redelivered task changes nothing
+        triage_ticket_task.run(self.ticket.id)
+        self.assertEqual(TicketOutbox.objects.count(), 1)
+
+    @mock.patch("tickets.utils.triage.triage", return_value=PREDICTION)
+    @mock.patch("tickets.utils.triage.get_group_resolver", side_effect=RuntimeError("database gone"))
+    def test_failed_triage_marks_the_ticket_failed(self, resolver, triage, enqueue):
+        triage_ticket_task.run(self.ticket.id)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.ticket_creation_status, "failed")
+        self.assertEqual(self.ticket.error_message, "database gone")
+        self.assertIsNotNone(self.ticket.next_attempt_at)
+        self.assertFalse(TicketOutbox.objects.exists())
+
+
+@override_settings(SERVICENOW_MAX_SYNC_ATTEMPTS=3)
+class RetryTicketViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("agent", "agent@example.com", "x")
+        self.client.force_login(self.user)
+
+    def test_retrying_a_dead_letter_ticket_gives_it_a_fresh_budget(self):
+        ticket = create_ticket(ticket_creation_status="dead_letter", sync_attempts=3, created_by=self.user)
+        self.client.get(reverse("tickets:retry_ticket", args=[ticket.id]))
+
+        ticket.refresh_from_db()
+        self.assertEqual((ticket.ticket_creation_status, ticket.sync_attempts), ("pending", 0))
+        self.assertTrue(TicketOutbox.objects.filter(ticket=ticket, task="create_incident").exists())
+
+        # the next failure backs off instead of dead-lettering again
+        mark_ticket_failed(ticket, "HTTP 503")
+        self.assertEqual(ticket.ticket_creation_status, "failed")
+        self.assertIsNotNone(ticket.next_attempt_at)
+
+
+class WatermarkTests(TestCase):
+    def test_uidvalidity_change_resets_the_watermark(self):
+        MailboxWatermark.objects.create(account_key="support", folder="INBOX", uidvalidity=1, last_uid=42)
+        self.assertEqual(get_watermark("support", "INBOX", 1).last_uid, 42)
+
+        watermark = get_watermark("support", "INBOX", 2)
+        self.assertEqual((watermark.uidvalidity, watermark.last_uid), (2, 0))
+        self.assertEqual(MailboxWatermark.objects.get().last_uid, 0)
+
+
+# the pipeline stores from its own threads, so the data has to be committed
+class SimulatedMailboxTestCase(TransactionTestCase):
+    idle = False
+
+    def setUp(self):
+        for patcher in (
+            mock.patch("tickets.views.send_email_replay_with_ticket"),
+            mock.patch("tickets.utils.mailpipeline.triage_batch", lambda texts: [PREDICTION for _ in texts]),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.simulator = ImapSimulator(("127.0.0.1", 0), idle=self.idle).start()
+        self.addCleanup(self.simulator.server_close)
+        self.addCleanup(self.simulator.shutdown)
+        settings = override_settings(
+            EMAIL_IMAP_HOST="127.0.0.1",
+            EMAIL_IMAP_PORT=self.simulator.server_address[1],
+            EMAIL_IMAP_SSL=False,
+            EMAIL_ACCOUNTS={"support": {"EMAIL_HOST_USER": "support", "EMAIL_HOST_PASSWORD": "x"}},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.imap = connect_mailbox("support")
+        self.addCleanup(self.imap.logout)
+
+    def deliver(self, count, start=0):
+        for number in range(start, start + count):
+            self.simulator.deliver("support", sample_message("user@example.com", "support", number))
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail(f"Timed out after {timeout}s")
+            time.sleep(0.05)
+
+    def watch(self, **options):
+        """
+        Run watch_mailbox in a thread. Returns what it stores and a function that
+        stops it; the database is only read once it has stopped.
+        """
+        stored, stop = [], threading.Event()
+        thread = threading.Thread(
+            target=watch_mailbox,
+            args=(self.imap,),
+            kwargs={"should_stop": stop.is_set, "on_processed": stored.extend, **options},
+            daemon=True,
+        )
+        thread.start()
+        self.addCleanup(stop.set)
+
+        def finish():
+            stop.set()
+            if self.idle:
+                # wake the connection so the watcher sees the stop request
+                self.deliver(1, start=1000)
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+        return stored, finish
+
+
+class MailIngestTests(SimulatedMailboxTestCase):
+
+    def test_watermark_advances_past_stored_messages(self):
+        self.deliver(3)
+        self.assertEqual(ingest_new_messages(self.imap, "support"), 3)
+        self.assertEqual(MailboxWatermark.objects.get().last_uid, 3)
+
+        self.deliver(2, start=3)
+        self.assertEqual(ingest_new_messages(self.imap, "support"), 2)
+        self.assertEqual(MailboxWatermark.objects.get().last_uid, 5)
+        self.assertEqual(EmailTicket.objects.count(), 5)
+
+        # nothing new: nothing fetched, marking mail unread does not re-ingest it
+        for message in self.simulator.mailbox("support").messages:
+            message.flags.discard(r"\Seen")
+        self.assertEqual(ingest_new_messages(self.imap, "support"), 0)
+        self.assertEqual(Ticket.objects.count(), 5)
+
+    def test_uidvalidity_reset_restarts_from_unseen_messages(self):
+        self.deliver(3)
+        ingest_new_messages(self.imap, "support")
+        old_uidvalidity = MailboxWatermark.objects.get().uidvalidity
+
+        rebuilt = Mailbox(uidvalidity=old_uidvalidity + 1)
+        for number in range(100, 103):
+            rebuilt.append(sample_message("user@example.com", "support", number))
+        rebuilt.messages[0].flags.add(r"\Seen")
+        self.simulator.mailboxes[("support", "INBOX")] = rebuilt
+
+        self.assertEqual(ingest_new_messages(self.imap, "support"), 2)
+        watermark = MailboxWatermark.objects.get()
+        self.assertEqual((watermark.uidvalidity, watermark.last_uid), (old_uidvalidity + 1, 3))
+        self.assertEqual(EmailTicket.objects.count(), 5)
+
+    def test_watch_polls_servers_without_idle(self):
+        stored, finish = self.watch(use_idle=True, poll_interval=1)
+        self.deliver(1)
+        self.wait_for(lambda: len(stored) == 1)
+        finish()
+        self.assertEqual(self.simulator.commands["IDLE"], 0)
+        self.assertEqual(EmailTicket.objects.count(), 1)
+
+
+class MailWatchTests(SimulatedMailboxTestCase):
+    idle = True
+
+    def test_idle_wakes_on_new_mail_without_polling(self):
+        sweeps = []
+        stored, finish = self.watch(use_idle=True, poll_interval=3600, idle_renew=3600, on_sweep=sweeps.append)
+        self.wait_for(lambda: self.simulator.commands["IDLE"] == 1)
+
+        # only the EXISTS pushed into IDLE can trigger the next sweep within the hour
+        self.deliver(1)
+        self.wait_for(lambda: len(stored) == 1)
+        finish()
+        self.assertEqual(sweeps[:2], [0, 1])
+        self.assertEqual(EmailTicket.objects.count(), 2)
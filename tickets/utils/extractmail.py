@@ -1,6 +1,8 @@
 import logging
 import re
+from email.feedparser import BytesFeedParser
 from email.header import decode_header
+from email.message import Message
 
 """Utility functions for extracting and decoding email content."""
 
@@ -35,6 +37,8 @@ def get_email_body(msg):
     if msg.is_multipart():
         for part in msg.walk():
             ctype = part.get_content_type()
+            if part.get_content_disposition() == "attachment":
+                continue
             if ctype == "text/plain":
                 return part.get_payload(decode=True).decode(errors="ignore")
             if ctype == "text/html":
@@ -44,3 +48,30 @@ def get_email_body(msg):
         return msg.get_payload(decode=True).decode(errors="ignore")
     logger.debug("Email body extracted.")
     return ""
+
+# Message class for the streaming parser that keeps only the parts get_email_body can use
+class BodyOnlyMessage(Message):
+    skipped_bytes = 0
+
+    def is_body_part(self):
+        return self.get_content_maintype() == "text" and self.get_content_disposition() != "attachment"
+
+    def set_payload(self, payload, charset=None):
+        # the parser sets a leaf part's payload once its headers are known:
+        # attachments are dropped here without being decoded
+        if isinstance(payload, str) and not self.is_body_part():
+            self.skipped_bytes = len(payload)
+            payload = ""
+        super().set_payload(payload, charset)
+
+
+# Parses raw email bytes incrementally, keeping headers and text bodies only.
+def parse_email_stream(raw, chunk_size=64 * 1024):
+    parser = BytesFeedParser(_factory=BodyOnlyMessage)
+    for start in range(0, len(raw), chunk_size):
+        parser.feed(raw[start:start + chunk_size])
+    msg = parser.close()
+    skipped = sum(part.skipped_bytes for part in msg.walk())
+    if skipped:
+        logger.debug(f"Skipped {skipped} bytes of attachments while parsing email.")
+    return msg
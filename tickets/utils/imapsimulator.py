@@ -0,0 +1,307 @@
+"""Minimal in-memory IMAP4rev1 server for exercising mail ingestion locally.
+
+Supports what IMAPClient needs for this project: LOGIN, CAPABILITY, SELECT/EXAMINE
+(with UIDVALIDITY/UIDNEXT), STATUS, SEARCH and FETCH/STORE by sequence number or UID
+(RFC822, BODY[]/BODY.PEEK[], FLAGS, UID), IDLE with live EXISTS notifications,
+NOOP and LOGOUT. Any password is accepted and each username gets its own INBOX.
+"""
+
+import logging
+import re
+import select
+import socket
+import socketserver
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(rb'"((?:[^"\\]|\\.)*)"|(\()|(\))|([^\s()]+)')
+
+
+def parse_sequence_set(value, maximum):
+    """
+    Expand an IMAP sequence set such as "1,3:5,7:*" into a set of numbers.
+    """
+    numbers = set()
+    for part in value.split(","):
+        start, _, end = part.partition(":")
+        start = maximum if start == "*" else int(start)
+        end = start if not end else (maximum if end == "*" else int(end))
+        low, high = sorted((start, end))
+        numbers.update(range(low, high + 1))
+    return numbers
+
+
+def tokenize(line):
+    """
+    Split a command line into atoms/strings, with parenthesised lists as nested lists.
+    """
+    stack = [[]]
+    for quoted, opening, closing, atom in TOKEN_RE.findall(line):
+        if opening:
+            stack.append([])
+        elif closing:
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif atom:
+            stack[-1].append(atom.decode())
+        else:
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", quoted).decode())
+    return stack[0]
+
+
+class Message:
+    def __init__(self, uid, raw, flags=()):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+
+
+class Mailbox:
+    def __init__(self, uidvalidity):
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.messages = []
+
+    def append(self, raw, flags=()):
+        message = Message(self.uidnext, raw, flags)
+        self.uidnext += 1
+        self.messages.append(message)
+        return message
+
+
+class ImapSimulatorHandler(socketserver.StreamRequestHandler):
+    def send(self, line):
+        if isinstance(line, str):
+            line = line.encode()
+        self.wfile.write(line + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        self.user = None
+        self.mailbox = None
+        self.readonly = False
+        self.announced = 0
+        self.send(f"* OK [CAPABILITY {self.server.capability_string}] IMAP simulator ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.rstrip(b"\r\n").split(b" ", 2)
+            if len(parts) < 2:
+                self.send(b"* BAD Invalid command")
+                continue
+            tag = parts[0].decode()
+            command = parts[1].decode().upper()
+            args = parts[2] if len(parts) > 2 else b""
+            use_uid = False
+            if command == "UID":
+                use_uid = True
+                command, _, rest = args.partition(b" ")
+                command = command.decode().upper()
+                args = rest
+            try:
+                if self.dispatch(tag, command, tokenize(args), use_uid) is False:
+                    return
+            except (socket.error, ConnectionError):
+                return
+            except Exception as e:
+                logger.exception("IMAP simulator command failed")
+                self.send(f"{tag} BAD {e}")
+
+    def dispatch(self, tag, command, args, use_uid):
+        server = self.server
+        with server.lock:
+            server.commands[f"UID {command}" if use_uid else command] += 1
+        if command == "CAPABILITY":
+            self.send(f"* CAPABILITY {server.capability_string}")
+        elif command == "LOGIN":
+            self.user = args[0]
+            self.send(f"{tag} OK [CAPABILITY {server.capability_string}] LOGIN completed")
+            return
+        elif command == "LOGOUT":
+            self.send("* BYE IMAP simulator logging out")
+            self.send(f"{tag} OK LOGOUT completed")
+            return False
+        elif command == "NOOP":
+            self.announce_new()
+        elif command in ("SELECT", "EXAMINE"):
+            self.mailbox = server.mailbox(self.user, args[0])
+            self.readonly = command == "EXAMINE"
+            with server.lock:
+                exists = len(self.mailbox.messages)
+                self.announced = exists
+                self.send(r"* FLAGS (\Answered \Flagged \Deleted \Seen \Draft)")
+                self.send(f"* {exists} EXISTS")
+                self.send("* 0 RECENT")
+                self.send(f"* OK [UIDVALIDITY {self.mailbox.uidvalidity}] UIDs valid")
+                self.send(f"* OK [UIDNEXT {self.mailbox.uidnext}] Predicted next UID")
+            mode = "READ-ONLY" if self.readonly else "READ-WRITE"
+            self.send(f"{tag} OK [{mode}] {command} completed")
+            return
+        elif command == "STATUS":
+            mailbox = server.mailbox(self.user, args[0])
+            with server.lock:
+                unseen = sum(1 for m in mailbox.messages if r"\Seen" not in m.flags)
+                items = {
+                    "MESSAGES": len(mailbox.messages),
+                    "RECENT": 0,
+                    "UIDNEXT": mailbox.uidnext,
+                    "UIDVALIDITY": mailbox.uidvalidity,
+                    "UNSEEN": unseen,
+                }
+            wanted = args[1] if isinstance(args[1], list) else [args[1]]
+            values = " ".join(f"{name.upper()} {items[name.upper()]}" for name in wanted)
+            self.send(f'* STATUS "{args[0]}" ({values})')
+        elif command == "IDLE":
+            if not server.idle:
+                self.send(f"{tag} BAD IDLE not supported")
+                return
+            self.idle()
+        elif command == "SEARCH":
+            self.search(args, use_uid)
+        elif command == "FETCH":
+            self.fetch(args, use_uid)
+        elif command == "STORE":
+            self.store(args, use_uid)
+        else:
+            self.send(f"{tag} BAD Unknown command {command}")
+            return
+        self.send(f"{tag} OK {command} completed")
+
+    def announce_new(self):
+        if self.mailbox is None:
+            return
+        with self.server.lock:
+            exists = len(self.mailbox.messages)
+        if exists != self.announced:
+            self.announced = exists
+            self.send(f"* {exists} EXISTS")
+
+    def idle(self):
+        self.send("+ idling")
+        # the client sends nothing but DONE while idling, so nothing is left in rfile's buffer
+        while True:
+            readable, _, _ = select.select([self.connection], [], [], 0.1)
+            if not readable:
+                self.announce_new()
+                continue
+            line = self.rfile.readline()
+            if not line or line.strip().upper() == b"DONE":
+                return
+
+    def select_messages(self, sequence, use_uid):
+        with self.server.lock:
+            messages = list(self.mailbox.messages)
+        if use_uid:
+            highest = messages[-1].uid if messages else 0
+            uids = parse_sequence_set(sequence, highest)
+            # "n:*" always matches the highest UID, even when it is below n
+            return [(i + 1, m) for i, m in enumerate(messages) if m.uid in uids]
+        numbers = parse_sequence_set(sequence, len(messages))
+        return [(i + 1, m) for i, m in enumerate(messages) if i + 1 in numbers]
+
+    def search(self, criteria, use_uid):
+        with self.server.lock:
+            matches = list(enumerate(self.mailbox.messages, 1))
+        criteria = [c.upper() if isinstance(c, str) else c for c in criteria]
+        i = 0
+        while i < len(criteria):
+            key = criteria[i]
+            if key == "UNSEEN":
+                matches = [(n, m) for n, m in matches if r"\Seen" not in m.flags]
+            elif key == "SEEN":
+                matches = [(n, m) for n, m in matches if r"\Seen" in m.flags]
+            elif key == "UID":
+                i += 1
+                wanted = {m.uid for _, m in self.select_messages(criteria[i], use_uid=True)}
+                matches = [(n, m) for n, m in matches if m.uid in wanted]
+            elif key not in ("ALL", "CHARSET") and not key.startswith("UTF"):
+                raise ValueError(f"Unsupported search key {key}")
+            i += 1
+        found = " ".join(str(m.uid if use_uid else n) for n, m in matches)
+        self.send(f"* SEARCH {found}".rstrip())
+
+    def fetch(self, args, use_uid):
+        sequence, items = args[0], args[1]
+        items = [items] if isinstance(items, str) else items
+        names = [i.upper() for i in items if isinstance(i, str)]
+        for seq, message in self.select_messages(sequence, use_uid):
+            parts = []
+            literal = None
+            if use_uid or "UID" in names:
+                parts.append(f"UID {message.uid}")
+            for name in names:
+                if name in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+                    if name != "BODY.PEEK[]" and not self.readonly:
+                        with self.server.lock:
+                            message.flags.add(r"\Seen")
+                    label = "RFC822" if name == "RFC822" else "BODY[]"
+                    literal = (label, message.raw)
+                elif name == "RFC822.SIZE":
+                    parts.append(f"RFC822.SIZE {len(message.raw)}")
+            if "FLAGS" in names:
+                parts.append(f"FLAGS ({' '.join(sorted(message.flags))})")
+            head = f"* {seq} FETCH ({' '.join(parts)}".encode()
+            if literal:
+                label, raw = literal
+                self.wfile.write(head + f" {label} {{{len(raw)}}}\r\n".encode() + raw + b")\r\n")
+                self.wfile.flush()
+            else:
+                self.send(head + b")")
+
+    def store(self, args, use_uid):
+        sequence, action, flags = args[0], args[1].upper(), args[2]
+        flags = [flags] if isinstance(flags, str) else flags
+        silent = action.endswith(".SILENT")
+        for seq, message in self.select_messages(sequence, use_uid):
+            with self.server.lock:
+                if action.startswith("+"):
+                    message.flags.update(flags)
+                elif action.startswith("-"):
+                    message.flags.difference_update(flags)
+                else:
+                    message.flags = set(flags)
+                current = " ".join(sorted(message.flags))
+            if not silent:
+                uid = f"UID {message.uid} " if use_uid else ""
+                self.send(f"* {seq} FETCH ({uid}FLAGS ({current}))")
+
+
+class ImapSimulator(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, idle=True):
+        super().__init__(address, ImapSimulatorHandler)
+        self.idle = idle
+        self.lock = threading.Lock()
+        self.mailboxes = {}
+        self.commands = Counter()
+        self.capability_string = "IMAP4rev1 UIDPLUS" + (" IDLE" if idle else "")
+
+    def mailbox(self, user, folder="INBOX"):
+        with self.lock:
+            key = (user, folder.upper())
+            if key not in self.mailboxes:
+                self.mailboxes[key] = Mailbox(uidvalidity=int(time.time()))
+            return self.mailboxes[key]
+
+    def deliver(self, user, raw, folder="INBOX"):
+        """Append a message; clients idling on the folder are told within ~100ms."""
+        mailbox = self.mailbox(user, folder)
+        with self.lock:
+            return mailbox.append(raw).uid
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="imap-simulator", daemon=True).start()
+        return self
+
+    def stats(self):
+        with self.lock:
+            return {
+                "commands": dict(self.commands),
+                "messages": {f"{user}/{folder}": len(box.messages) for (user, folder), box in self.mailboxes.items()},
+            }
@@ -0,0 +1,116 @@
+"""Shared inbox ingestion used by the email_monitoring task and the mail_monitor command.
+
+This is the fetch stage of the ingest pipeline (see mailpipeline); it is the
+only code that talks to the IMAP connection. Progress is tracked with a UID
+watermark per account and folder instead of the \\Seen flag, so someone
+reading the mailbox cannot hide or replay mail. Each sweep costs one SELECT
+(its UIDNEXT tells whether anything arrived), one UID SEARCH for the new UIDs,
+then one BODY.PEEK[] fetch per batch of EMAIL_FETCH_BATCH_SIZE messages and
+one STORE of \\Seen for the batches stored since the last sweep. When the
+folder has no watermark yet, or its UIDVALIDITY changed and the old UIDs mean
+nothing, the sweep starts from the unseen messages instead.
+"""
+
+import logging
+import time
+from django.conf import settings
+from tickets.models import MailboxWatermark
+from tickets.utils.mailpipeline import MailBatch, MailIngestPipeline
+
+logger = logging.getLogger(__name__)
+
+FETCH_ITEMS = ["BODY.PEEK[]"]
+
+
+def get_watermark(account_key, folder, uidvalidity):
+    watermark, _ = MailboxWatermark.objects.get_or_create(account_key=account_key, folder=folder)
+    if watermark.uidvalidity != uidvalidity:
+        if watermark.uidvalidity is not None:
+            logger.warning(
+                f"UIDVALIDITY of {account_key}/{folder} changed from {watermark.uidvalidity} "
+                f"to {uidvalidity}, restarting from unseen messages"
+            )
+        watermark.uidvalidity = uidvalidity
+        watermark.last_uid = 0
+        watermark.save(update_fields=["uidvalidity", "last_uid", "updated_at"])
+    return watermark
+
+
+def new_message_uids(client, last_uid):
+    """
+    UIDs to ingest, ascending: everything above last_uid, or the unseen messages
+    when the watermark was just (re)set.
+    """
+    if last_uid:
+        # "n:*" always matches the newest message, even when its UID is below n
+        uids = client.search(["UID", f"{last_uid + 1}:*"])
+        return sorted(uid for uid in uids if uid > last_uid)
+    return sorted(client.search(["UNSEEN"]))
+
+
+# Fetch one batch of raw messages with a single UID FETCH, leaving \Seen untouched
+def fetch_raw_messages(client, uids):
+    response = client.fetch(uids, FETCH_ITEMS)
+    # messages expunged between the search and the fetch are missing from the response
+    return [(uid, response[uid][b"BODY[]"]) for uid in uids if b"BODY[]" in response.get(uid, {})]
+
+
+def flag_stored_messages(client, pipeline, account_key, folder, uidvalidity):
+    uids = pipeline.take_committed(account_key, folder, uidvalidity)
+    if uids:
+        # \Seen is only for people reading the mailbox; the watermark is what counts
+        client.add_flags(uids, [r"\Seen"], silent=True)
+    return uids
+
+
+def current_uidvalidity(client, folder):
+    return client.folder_status(folder, [b"UIDVALIDITY"]).get(b"UIDVALIDITY")
+
+
+# Queue everything that arrived since the last sweep into the pipeline
+def ingest_new_messages(client, account_key, folder="INBOX", pipeline=None, batch_size=None):
+    """
+    Fetch new messages from `folder` into `pipeline` and return how many were queued.
+    Without a pipeline, a private one is run to completion before returning.
+    """
+    if pipeline is None:
+        pipeline = MailIngestPipeline().start()
+        try:
+            queued = ingest_new_messages(client, account_key, folder, pipeline, batch_size)
+        finally:
+            pipeline.close()
+        pipeline.raise_if_failed()
+        flag_stored_messages(client, pipeline, account_key, folder, current_uidvalidity(client, folder))
+        return queued
+
+    batch_size = batch_size or getattr(settings, "EMAIL_FETCH_BATCH_SIZE", 100)
+    # a failed batch leaves its messages behind the watermark: reconnect and fetch them again
+    pipeline.raise_if_failed(account_key, folder)
+    status = client.select_folder(folder, readonly=False)
+    uidvalidity = status.get(b"UIDVALIDITY")
+    uidnext = status.get(b"UIDNEXT")
+    flag_stored_messages(client, pipeline, account_key, folder, uidvalidity)
+
+    watermark = get_watermark(account_key, folder, uidvalidity)
+    last_uid = max(watermark.last_uid, pipeline.submitted_uid(account_key, folder, uidvalidity))
+    if last_uid and uidnext and uidnext <= last_uid + 1:
+        return 0
+
+    uids = new_message_uids(client, last_uid)
+    logger.debug(f"Found {len(uids)} new messages in {account_key}/{folder}")
+
+    queued = 0
+    for start in range(0, len(uids), batch_size):
+        batch = uids[start:start + batch_size]
+        started = time.monotonic()
+        messages = fetch_raw_messages(client, batch)
+        pipeline.counters["fetch"].record(len(messages), time.monotonic() - started)
+        # blocks while the later stages are behind
+        pipeline.submit(MailBatch(account_key, folder, uidvalidity, messages, batch[-1]))
+        queued += len(messages)
+
+    if uidnext and last_uid < uidnext - 1 and (not uids or uids[-1] < uidnext - 1):
+        # every UID below UIDNEXT was covered by the search (after a (re)set the
+        # already-read messages are skipped on purpose)
+        pipeline.submit(MailBatch(account_key, folder, uidvalidity, [], uidnext - 1))
+    return queued
@@ -0,0 +1,207 @@
+"""Concurrent monitoring of every mailbox in EMAIL_MONITORED_MAILBOXES.
+
+Each mailbox gets its own thread and persistent IMAP connection (IDLE or
+polling, see mailwatch), which reconnects after errors without affecting the
+others. All of them feed one MailIngestPipeline, whose round-robin stage queues keep
+a mailbox working through a backlog from starving the rest. Health and lag per
+mailbox are logged and published to the cache every EMAIL_MONITOR_STATUS_SECONDS
+so other processes can read them with mail_monitor_status().
+"""
+
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from tickets.utils.mailpipeline import MailIngestPipeline
+from tickets.utils.mailwatch import connect_mailbox, watch_mailbox
+
+logger = logging.getLogger(__name__)
+
+STATUS_KEY = "mail_monitor:status"
+
+
+def parse_mailbox(value):
+    """
+    "account:folder" (or just "account") -> (account, folder).
+    """
+    account_key, _, folder = value.partition(":")
+    return account_key.strip(), folder.strip() or "INBOX"
+
+
+def monitored_mailboxes():
+    return [parse_mailbox(m) for m in getattr(settings, "EMAIL_MONITORED_MAILBOXES", ["support:INBOX"])]
+
+
+class MailboxHealth:
+    def __init__(self, account_key, folder, stale_after):
+        self.account_key = account_key
+        self.folder = folder
+        self.stale_after = stale_after
+        self.lock = threading.Lock()
+        self.state = "starting"
+        self.connected_at = None
+        self.last_sweep_at = None
+        self.last_error = None
+        self.last_error_at = None
+        self.sweeps = 0
+        self.reconnects = 0
+        self.consecutive_failures = 0
+
+    def connected(self):
+        with self.lock:
+            if self.connected_at is not None:
+                self.reconnects += 1
+            self.state = "watching"
+            self.connected_at = time.time()
+
+    def swept(self, queued):
+        with self.lock:
+            self.sweeps += 1
+            self.last_sweep_at = time.time()
+            self.consecutive_failures = 0
+
+    def failed(self, error):
+        with self.lock:
+            self.state = "reconnecting"
+            self.last_error = str(error) or error.__class__.__name__
+            self.last_error_at = time.time()
+            self.consecutive_failures += 1
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            sweep_age = round(now - self.last_sweep_at, 1) if self.last_sweep_at else None
+            return {
+                "state": self.state,
+                # a watching connection sweeps at least once per IDLE renewal or poll
+                "healthy": self.state == "watching" and sweep_age is not None and sweep_age <= self.stale_after,
+                "seconds_since_sweep": sweep_age,
+                "sweeps": self.sweeps,
+                "reconnects": self.reconnects,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+                "last_error_at": self.last_error_at,
+            }
+
+
+class MailboxMonitor:
+    def __init__(self, mailboxes=None, use_idle=None, poll_interval=None, idle_renew=None, on_processed=None):
+        self.mailboxes = mailboxes or monitored_mailboxes()
+        if use_idle is None:
+            use_idle = getattr(settings, "EMAIL_IMAP_IDLE", True)
+        self.use_idle = use_idle
+        self.poll_interval = poll_interval or getattr(settings, "EMAIL_POLL_INTERVAL", 60)
+        self.idle_renew = idle_renew or getattr(settings, "EMAIL_IMAP_IDLE_RENEW_SECONDS", 540)
+        self.on_processed = on_processed
+        self.stop_event = threading.Event()
+        self.pipeline = None
+        self._pipeline_lock = threading.Lock()
+        self._threads = []
+
+        stale_after = (self.idle_renew if use_idle else self.poll_interval) + 60
+        self.health = {
+            f"{account_key}/{folder}": MailboxHealth(account_key, folder, stale_after)
+            for account_key, folder in self.mailboxes
+        }
+
+    def current_pipeline(self):
+        """
+        The pipeline shared by every mailbox. A failed batch only stops its own
+        mailbox, whose connection raises on its next sweep and reconnects.
+        """
+        with self._pipeline_lock:
+            if self.pipeline is None:
+                self.pipeline = MailIngestPipeline(on_persisted=self.on_processed).start()
+            return self.pipeline
+
+    def _watch(self, account_key, folder):
+        health = self.health[f"{account_key}/{folder}"]
+        while not self.stop_event.is_set():
+            try:
+                pipeline = self.current_pipeline()
+                with connect_mailbox(account_key) as client:
+                    health.connected()
+                    watch_mailbox(
+                        client,
+                        account_key=account_key,
+                        folder=folder,
+                        use_idle=self.use_idle,
+                        poll_interval=self.poll_interval,
+                        idle_renew=self.idle_renew,
+                        # leave IDLE when a batch failed, so the next sweep re-fetches it
+                        should_stop=lambda: self.stop_event.is_set() or pipeline.has_failed(account_key, folder),
+                        pipeline=pipeline,
+                        on_sweep=health.swept,
+                    )
+            except Exception as e:
+                health.failed(e)
+                logger.error(f"Mailbox {account_key}/{folder} failed, reconnecting in {self.poll_interval}s: {e}")
+                self.stop_event.wait(self.poll_interval)
+
+    def start(self):
+        self.current_pipeline()
+        for account_key, folder in self.mailboxes:
+            thread = threading.Thread(
+                target=self._watch,
+                args=(account_key, folder),
+                name=f"mail-watch-{account_key}-{folder}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        if self.pipeline is not None:
+            self.pipeline.close(timeout)
+        self.publish_status()
+
+    def status(self):
+        pipeline = self.pipeline
+        queue_stats = pipeline.mailbox_stats() if pipeline else {}
+        mailboxes = {}
+        for key, health in self.health.items():
+            mailboxes[key] = health.snapshot()
+            mailboxes[key].update(queue_stats.get(key, {}))
+        return {
+            "updated_at": time.time(),
+            "mailboxes": mailboxes,
+            "pipeline": pipeline.stats() if pipeline else {},
+        }
+
+    def publish_status(self):
+        status = self.status()
+        for key, mailbox in status["mailboxes"].items():
+            logger.info(
+                f"Mailbox {key}: {mailbox['state']}, healthy={mailbox['healthy']}, "
+                f"lag={mailbox.get('lag_seconds', 0.0)}s, stored={mailbox.get('stored', 0)}, "
+                f"reconnects={mailbox['reconnects']}"
+            )
+        try:
+            cache.set(STATUS_KEY, status, None)
+        except Exception:
+            logger.warning("Cache backend unavailable, mailbox status not published")
+        return status
+
+    def run(self, status_interval=None):
+        """
+        Start every mailbox and publish status until stop() is called or the process is interrupted.
+        """
+        status_interval = status_interval or getattr(settings, "EMAIL_MONITOR_STATUS_SECONDS", 60)
+        self.start()
+        try:
+            while not self.stop_event.wait(status_interval):
+                self.publish_status()
+        finally:
+            self.stop(timeout=5)
+
+
+def mail_monitor_status() -> dict:
+    """
+    Last status published by a running mail_monitor (empty without a shared cache or monitor).
+    """
+    return cache.get(STATUS_KEY) or {}
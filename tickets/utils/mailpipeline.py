@@ -0,0 +1,567 @@
+"""Staged email ingestion: fetch -> parse -> triage -> persist.
+
+The fetch stage runs in the thread that owns the IMAP connection and hands
+batches of raw messages to the pipeline. Parsing, triage and persisting each
+run in their own thread, linked by bounded queues. When a later stage falls
+behind, the queues fill up and submit() blocks once a mailbox has
+EMAIL_PIPELINE_QUEUE_SIZE batches or EMAIL_PIPELINE_QUEUE_BYTES of raw
+messages waiting, so the fetcher slows down instead of buffering whole
+mailboxes in memory. A slow model call no longer holds up the IMAP connection: the
+monitor goes back to IDLE as soon as its batches are queued. Every stage
+queue keeps one lane per mailbox and serves them round-robin, so a mailbox
+working through a backlog cannot starve the others.
+
+The triage stage calls the models on up to EMAIL_TRIAGE_BATCH_SIZE texts at a
+time. The persist stage bulk-creates each batch and then advances the
+folder's UID watermark. Batches reach it in fetch order, so the watermark
+never passes a message that is not stored yet.
+
+Errors are handled per message. A message that cannot be parsed, or that
+fails triage or storing while the rest of its batch goes through, is saved to
+DeadLetterEmail and the watermark moves past it. When a whole batch fails
+(the model or database is down) only its mailbox stops: its later batches are
+dropped, and its connection raises on the next sweep and fetches them again
+from the watermark. A message that keeps failing that way is dead-lettered
+after EMAIL_INGEST_MAX_ATTEMPTS sweeps.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from email.utils import parseaddr
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connection, transaction
+from django.db.models.functions import Lower
+from ai.views import triage_batch
+from account.utils.emailuser import get_or_create_user_by_email
+from tickets.models import DeadLetterEmail, EmailTicket, MailboxWatermark, RawEmail
+from tickets.utils.extractmail import decode_header_value, get_email_body, parse_email_stream
+from tickets.views import email_tickets_create_batch
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+STOP = object()
+
+
+class MailBatch:
+    """
+    Messages from one FETCH, plus the watermark to record once they are stored.
+    messages starts as [(uid, raw)] and is replaced with parsed dicts by the parse stage;
+    messages that fail on the way move to dead_letters.
+    """
+
+    def __init__(self, account_key, folder, uidvalidity, messages, last_uid):
+        self.account_key = account_key
+        self.folder = folder
+        self.uidvalidity = uidvalidity
+        self.messages = messages
+        self.last_uid = last_uid
+        self.uids = [uid for uid, _ in messages]
+        self.dead_letters = []
+        self.generation = 0
+
+
+class StageCounter:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    def record(self, items, seconds):
+        with self.lock:
+            self.batches += 1
+            self.items += items
+            self.busy += seconds
+
+    def error(self):
+        with self.lock:
+            self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started_at
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "errors": self.errors,
+                "busy_seconds": round(self.busy, 3),
+                # items per second of wall time, and while actually working
+                "rate": round(self.items / elapsed, 2) if elapsed else 0.0,
+                "busy_rate": round(self.items / self.busy, 2) if self.busy else 0.0,
+            }
+
+
+def parse_message(uid, raw, key):
+    """
+    Headers and body text of a raw message. Attachments are skipped by the
+    parser, and the raw bytes are only kept compressed for RawEmail.
+    """
+    msg = parse_email_stream(raw)
+    return {
+        "uid": uid,
+        "key": key,
+        "raw_email": RawEmail.compress(raw),
+        "subject": decode_header_value(msg["Subject"]),
+        "body": get_email_body(msg) or "",
+        "sender": parseaddr(msg["From"])[1],
+    }
+
+
+def triage_text(message):
+    return f"{message['subject'] or ''} {message['body'] or ''}"
+
+
+def email_key(account_key, folder, uidvalidity, uid):
+    """
+    EmailTicket.uid for a message. A bare IMAP UID repeats across accounts,
+    folders and UIDVALIDITY resets.
+    """
+    return f"{account_key}:{folder}:{uidvalidity}:{uid}"
+
+
+class FairQueue:
+    """
+    Bounded FIFO per mailbox, read round-robin across mailboxes. A mailbox is
+    full at maxsize items or, if max_bytes is set, once its items' sizes add up
+    to max_bytes (a lone item may be larger). put() only blocks on the caller's
+    own mailbox being full; get() returns STOP once the queue is closed and
+    empty. The queues of one pipeline share a condition so a stage can wait for
+    room downstream without holding a batch.
+    """
+
+    def __init__(self, maxsize, cond=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.cond = cond or threading.Condition()
+        self.pending = {}
+        self.bytes = {}
+        self.order = []
+        self.next = 0
+        self.closed = False
+
+    def _full(self, key, size=0):
+        items = self.pending.get(key, ())
+        if len(items) >= self.maxsize:
+            return True
+        return bool(items) and self.max_bytes is not None and self.bytes[key] + size > self.max_bytes
+
+    def put(self, key, item, size=0):
+        with self.cond:
+            if key not in self.pending:
+                self.pending[key] = deque()
+                self.bytes[key] = 0
+                self.order.append(key)
+            while self._full(key, size):
+                self.cond.wait()
+            self.pending[key].append((item, size))
+            self.bytes[key] += size
+            self.cond.notify_all()
+
+    def has_room(self, key):
+        return not self._full(key)
+
+    def _pop_next(self, ready):
+        # start after the mailbox served last
+        for offset in range(len(self.order)):
+            index = (self.next + offset) % len(self.order)
+            key = self.order[index]
+            items = self.pending[key]
+            if items and (ready is None or ready(key)):
+                self.next = index + 1
+                item, size = items.popleft()
+                self.bytes[key] -= size
+                return item
+        return None
+
+    def get(self, ready=None):
+        """
+        Next item round-robin, skipping mailboxes for which ready(key) is false.
+        """
+        with self.cond:
+            item = self._pop_next(ready)
+            while item is None:
+                if self.closed and not any(self.pending.values()):
+                    return STOP
+                self.cond.wait()
+                item = self._pop_next(ready)
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def sizes(self):
+        with self.cond:
+            return {key: len(items) for key, items in self.pending.items()}
+
+
+class MailIngestPipeline:
+    def __init__(self, queue_size=None, triage_batch_size=None, on_persisted=None):
+        queue_size = queue_size or getattr(settings, "EMAIL_PIPELINE_QUEUE_SIZE", 2)
+        self.queue_size = queue_size
+        self.queue_bytes = getattr(settings, "EMAIL_PIPELINE_QUEUE_BYTES", 32 * 1024 * 1024)
+        self.triage_batch_size = triage_batch_size or getattr(settings, "EMAIL_TRIAGE_BATCH_SIZE", 64)
+        self.max_attempts = getattr(settings, "EMAIL_INGEST_MAX_ATTEMPTS", 3)
+        self.on_persisted = on_persisted
+        # every stage reads its mailboxes round-robin and only takes a batch its
+        # downstream lane has room for, so a quiet mailbox's batch waits for the
+        # batch in progress at each stage, never for a backlog. Fetched batches
+        # are buffered at the first stage; between stages one batch per mailbox
+        # keeps them overlapping.
+        cond = threading.Condition()
+        self.queues = {
+            "parse": FairQueue(queue_size, cond, max_bytes=self.queue_bytes or None),
+            "triage": FairQueue(1, cond),
+            "persist": FairQueue(1, cond),
+        }
+        self.counters = {name: StageCounter(name) for name in ("fetch", "parse", "triage", "persist")}
+        self._committed = {}
+        self._submitted = {}
+        self._threads = []
+        # per (account, folder): the error that stopped it, and a generation
+        # bumped on every failure so its batches still in the queues are dropped
+        self.errors = {}
+        self._generations = {}
+        self._attempts = {}
+        self._mailboxes = {}
+        self._mailbox_lock = threading.Lock()
+
+    def start(self):
+        stages = [
+            ("parse", self._parse, "triage"),
+            ("triage", self._triage, "persist"),
+            ("persist", self._persist, None),
+        ]
+        for name, handler, downstream in stages:
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(name, handler, downstream),
+                name=f"mail-{name}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _run_stage(self, name, handler, downstream):
+        inbox = self.queues[name]
+        counter = self.counters[name]
+        ready = self.queues[downstream].has_room if downstream else None
+        try:
+            while True:
+                batch = inbox.get(ready)
+                if batch is STOP:
+                    break
+                if batch.generation != self._generations.get((batch.account_key, batch.folder), 0):
+                    # queued behind a failed batch of the same mailbox; the watermark
+                    # makes its connection fetch these messages again
+                    self._discard(batch)
+                    continue
+                started = time.monotonic()
+                try:
+                    batch = handler(batch)
+                except Exception as e:
+                    logger.exception(f"Mail pipeline {name} stage failed for {batch.account_key}/{batch.folder}")
+                    counter.error()
+                    self._fail_mailbox(batch, e)
+                    continue
+                counter.record(len(batch.messages), time.monotonic() - started)
+                if downstream:
+                    self.queues[downstream].put((batch.account_key, batch.folder), batch)
+        finally:
+            if downstream:
+                self.queues[downstream].close()
+            connection.close()
+
+    def _mailbox(self, account_key, folder):
+        key = f"{account_key}/{folder}"
+        if key not in self._mailboxes:
+            self._mailboxes[key] = {
+                "in_flight": deque(), "queued": 0, "stored": 0, "dead_lettered": 0, "last_stored_at": None,
+            }
+        return self._mailboxes[key]
+
+    def _discard(self, batch):
+        with self._mailbox_lock:
+            in_flight = self._mailbox(batch.account_key, batch.folder)["in_flight"]
+            if in_flight:
+                in_flight.popleft()
+
+    def _fail_mailbox(self, batch, error):
+        """
+        Stop a mailbox after one of its batches failed as a whole. The other
+        mailboxes carry on; this one's connection raises on its next sweep.
+        """
+        key = (batch.account_key, batch.folder)
+        with self._mailbox_lock:
+            if batch.generation == self._generations.get(key, 0):
+                self._generations[key] = batch.generation + 1
+                self.errors[key] = error
+                # the next sweep starts from the watermark again
+                for submitted in [k for k in self._submitted if k[:2] == key]:
+                    del self._submitted[submitted]
+        self._discard(batch)
+
+    def _dead_letter(self, batch, stage, message, error):
+        logger.error(f"Could not {stage} email {message['key']}, moving it to the dead letters: {error!r}")
+        self.counters[stage].error()
+        batch.dead_letters.append({
+            "key": message["key"],
+            "stage": stage,
+            "error": repr(error),
+            "raw_email": message.get("raw_email"),
+        })
+
+    def _count_attempt(self, key):
+        # shared through the cache when there is one, so Beat runs count too
+        cache_key = f"mail_ingest:attempts:{key}"
+        try:
+            cache.add(cache_key, 0, 86400)
+            return cache.incr(cache_key)
+        except Exception:
+            self._attempts[key] = self._attempts.get(key, 0) + 1
+            return self._attempts[key]
+
+    def _isolate(self, batch, stage, messages, handler):
+        """
+        Run handler(messages), falling back to one message at a time if it raises.
+        Returns the messages that went through and the concatenated results.
+        Messages that fail on their own while others succeed are dead-lettered.
+        If every message fails, the error is raised for the whole batch unless
+        they have all failed max_attempts times already.
+        """
+        try:
+            return messages, list(handler(messages))
+        except Exception as e:
+            error = e
+        passed, results, failures = [], [], []
+        if len(messages) == 1:
+            failures.append((messages[0], error))
+        else:
+            for message in messages:
+                try:
+                    results.extend(handler([message]))
+                    passed.append(message)
+                except Exception as e:
+                    failures.append((message, e))
+        if failures and not passed:
+            # nothing got through, which looks like the model or database being
+            # down rather than bad messages: retry them on the next sweep
+            if any(self._count_attempt(m["key"]) < self.max_attempts for m, _ in failures):
+                raise error
+        for message, e in failures:
+            self._dead_letter(batch, stage, message, e)
+        return passed, results
+
+    def _parse(self, batch):
+        parsed = []
+        for uid, raw in batch.messages:
+            key = email_key(batch.account_key, batch.folder, batch.uidvalidity, uid)
+            try:
+                parsed.append(parse_message(uid, raw, key))
+            except Exception as e:
+                # parsing only depends on the bytes, so a retry would fail the same way
+                self._dead_letter(batch, "parse", {"key": key, "raw_email": RawEmail.compress(raw)}, e)
+        batch.messages = parsed
+        return batch
+
+    def _triage(self, batch):
+        close_old_connections()
+        # emails already linked to a ticket do not need a model call
+        existing = set(
+            EmailTicket.objects.filter(
+                uid__in=[m["key"] for m in batch.messages], ticket__isnull=False
+            ).values_list("uid", flat=True)
+        )
+        batch.messages = [m for m in batch.messages if m["key"] not in existing]
+
+        triaged = []
+        for start in range(0, len(batch.messages), self.triage_batch_size):
+            chunk = batch.messages[start:start + self.triage_batch_size]
+            passed, predictions = self._isolate(
+                batch, "triage", chunk, lambda texts: triage_batch([triage_text(m) for m in texts])
+            )
+            for message, prediction in zip(passed, predictions):
+                message["prediction"] = prediction
+            triaged.extend(passed)
+        batch.messages = triaged
+        return batch
+
+    def _persist(self, batch):
+        close_old_connections()
+        if batch.messages:
+            batch.messages, processed = self._isolate(
+                batch, "persist", batch.messages, lambda messages: self._store(batch, messages)
+            )
+            logger.info(f"Stored {len(processed)} emails from {batch.account_key}/{batch.folder}")
+            if self.on_persisted and processed:
+                self.on_persisted(processed)
+        if batch.dead_letters:
+            self._store_dead_letters(batch)
+
+        if batch.last_uid:
+            MailboxWatermark.objects.filter(
+                account_key=batch.account_key,
+                folder=batch.folder,
+                uidvalidity=batch.uidvalidity,
+                last_uid__lt=batch.last_uid,
+            ).update(last_uid=batch.last_uid)
+        with self._mailbox_lock:
+            mailbox = self._mailbox(batch.account_key, batch.folder)
+            mailbox["in_flight"].popleft()
+            mailbox["stored"] += len(batch.messages)
+            mailbox["dead_lettered"] += len(batch.dead_letters)
+            mailbox["last_stored_at"] = time.time()
+            if batch.uids:
+                key = (batch.account_key, batch.folder, batch.uidvalidity)
+                self._committed.setdefault(key, []).extend(batch.uids)
+        return batch
+
+    def _store(self, batch, messages):
+        users = self._users_for([m["sender"] for m in messages], batch.account_key)
+        return email_tickets_create_batch(
+            [
+                {
+                    "key": m["key"],
+                    "sender": m["sender"],
+                    "subject": m["subject"],
+                    "body": m["body"],
+                    "raw_email": m["raw_email"],
+                    "user": users.get(m["sender"].lower()),
+                    "prediction": m["prediction"],
+                }
+                for m in messages
+            ]
+        )
+
+    def _store_dead_letters(self, batch):
+        # a refetch after a mailbox failure dead-letters the same messages again
+        existing = set(
+            DeadLetterEmail.objects.filter(
+                uid__in=[d["key"] for d in batch.dead_letters]
+            ).values_list("uid", flat=True)
+        )
+        dead_letters = [d for d in batch.dead_letters if d["key"] not in existing]
+        with transaction.atomic():
+            RawEmail.objects.bulk_create([d["raw_email"] for d in dead_letters if d["raw_email"] is not None])
+            DeadLetterEmail.objects.bulk_create(
+                [
+                    DeadLetterEmail(
+                        uid=d["key"],
+                        account_key=batch.account_key,
+                        folder=batch.folder,
+                        stage=d["stage"],
+                        error=d["error"],
+                        raw_message=d["raw_email"],
+                    )
+                    for d in dead_letters
+                ]
+            )
+
+    def _users_for(self, senders, account_key):
+        lowered = {s.lower() for s in senders if s}
+        users = {
+            u.email_lower: u
+            for u in User.objects.annotate(email_lower=Lower("email")).filter(email_lower__in=lowered)
+        }
+        for sender in lowered - users.keys():
+            get_or_create_user_by_email(sender, True, account_key)
+            users[sender] = User.objects.filter(email__iexact=sender).first()
+        return users
+
+    def has_failed(self, account_key, folder):
+        return (account_key, folder) in self.errors
+
+    def raise_if_failed(self, account_key=None, folder=None):
+        """
+        Raise the error that stopped a mailbox, once, so its connection can
+        reconnect and start again from the watermark. Without a mailbox, raise
+        if any mailbox failed (and keep the error).
+        """
+        with self._mailbox_lock:
+            if account_key is None:
+                error = next(iter(self.errors.values()), None)
+            else:
+                error = self.errors.pop((account_key, folder), None)
+        if error is not None:
+            raise error
+
+    def submit(self, batch):
+        """
+        Queue a fetched batch, blocking while its mailbox already has queue_size
+        batches or queue_bytes of raw messages waiting. Mailboxes are served round-robin, so a mailbox working
+        through a backlog only holds up its own fetcher.
+        """
+        self.raise_if_failed(batch.account_key, batch.folder)
+        with self._mailbox_lock:
+            batch.generation = self._generations.get((batch.account_key, batch.folder), 0)
+            mailbox = self._mailbox(batch.account_key, batch.folder)
+            mailbox["in_flight"].append(time.time())
+            mailbox["queued"] += len(batch.uids)
+            if batch.last_uid:
+                key = (batch.account_key, batch.folder, batch.uidvalidity)
+                self._submitted[key] = max(self._submitted.get(key, 0), batch.last_uid)
+        size = sum(len(raw or b"") for _, raw in batch.messages)
+        self.queues["parse"].put((batch.account_key, batch.folder), batch, size)
+
+    def submitted_uid(self, account_key, folder, uidvalidity):
+        """
+        Watermark the queued batches will leave behind for a folder (0 if none),
+        so a sweep does not fetch messages that are still in flight.
+        """
+        return self._submitted.get((account_key, folder, uidvalidity), 0)
+
+    def take_committed(self, account_key, folder, uidvalidity):
+        """
+        UIDs of a folder stored since the last call, for flagging \\Seen on its connection.
+        """
+        with self._mailbox_lock:
+            return self._committed.pop((account_key, folder, uidvalidity), [])
+
+    def close(self, timeout=None):
+        """
+        Let queued batches finish, then stop the stage threads.
+        Call raise_if_failed() afterwards to learn whether everything was stored.
+        """
+        self.queues["parse"].close()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        stats = {}
+        for name, counter in self.counters.items():
+            stats[name] = counter.snapshot()
+            if name in self.queues:
+                stats[name]["queued"] = sum(self.queues[name].sizes().values())
+        return stats
+
+    def mailbox_stats(self):
+        """
+        Per mailbox: messages queued, stored and dead-lettered, batches waiting to be parsed or in
+        flight, and lag_seconds, how long the oldest unstored batch has been waiting.
+        """
+        now = time.time()
+        waiting = {f"{a}/{f}": size for (a, f), size in self.queues["parse"].sizes().items()}
+        with self._mailbox_lock:
+            return {
+                key: {
+                    "queued": mailbox["queued"],
+                    "stored": mailbox["stored"],
+                    "dead_lettered": mailbox["dead_lettered"],
+                    "waiting_batches": waiting.get(key, 0),
+                    "in_flight_batches": len(mailbox["in_flight"]),
+                    "lag_seconds": round(now - mailbox["in_flight"][0], 3) if mailbox["in_flight"] else 0.0,
+                    "last_stored_at": mailbox["last_stored_at"],
+                }
+                for key, mailbox in self._mailboxes.items()
+            }
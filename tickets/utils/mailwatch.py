@@ -0,0 +1,112 @@
+"""Push-style mailbox watching with IMAP IDLE, falling back to polling.
+
+After catching up on anything that arrived while it was away, the watcher
+parks the connection in IDLE and ingests as soon as the server reports new
+mail (EXISTS/RECENT). IDLE is re-issued every EMAIL_IMAP_IDLE_RENEW_SECONDS,
+below the 29 minute limit of RFC 2177 and the shorter NAT/proxy timeouts, and
+servers without the IDLE capability are polled every EMAIL_POLL_INTERVAL seconds.
+"""
+
+import logging
+import time
+from django.conf import settings
+from imapclient import IMAPClient
+from tickets.utils.mailingest import current_uidvalidity, flag_stored_messages, ingest_new_messages
+from tickets.utils.mailpipeline import MailIngestPipeline
+
+logger = logging.getLogger(__name__)
+
+NEW_MAIL_RESPONSES = (b"EXISTS", b"RECENT")
+
+
+def connect_mailbox(account_key="support"):
+    """
+    Open and log in an IMAPClient for one of settings.EMAIL_ACCOUNTS.
+    """
+    config = settings.EMAIL_ACCOUNTS[account_key]
+    port = getattr(settings, "EMAIL_IMAP_PORT", None)
+    client = IMAPClient(
+        settings.EMAIL_IMAP_HOST,
+        port=int(port) if port else None,
+        ssl=getattr(settings, "EMAIL_IMAP_SSL", True),
+    )
+    try:
+        client.login(config["EMAIL_HOST_USER"], config["EMAIL_HOST_PASSWORD"])
+    except Exception:
+        client.shutdown()
+        raise
+    logger.info(f"Logged in to IMAP as {config['EMAIL_HOST_USER']}")
+    return client
+
+
+def wait_for_new_mail(client, renew_seconds, check_timeout=30, should_stop=None):
+    """
+    IDLE until the server announces new mail (True) or renew_seconds pass (False).
+    IDLE is always ended before returning, so the connection is usable for commands.
+    """
+    deadline = time.monotonic() + renew_seconds
+    client.idle()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (should_stop and should_stop()):
+                return False
+            responses = client.idle_check(timeout=min(check_timeout, remaining))
+            if any(len(r) > 1 and r[1] in NEW_MAIL_RESPONSES for r in responses):
+                return True
+    finally:
+        client.idle_done()
+
+
+def watch_mailbox(
+    client,
+    account_key="support",
+    folder="INBOX",
+    use_idle=None,
+    poll_interval=None,
+    idle_renew=None,
+    should_stop=None,
+    on_processed=None,
+    pipeline=None,
+    on_sweep=None,
+):
+    """
+    Ingest new mail from `folder` until should_stop() returns True (or forever).
+    Fetched messages go through `pipeline` (a new one unless given; on_processed
+    is called from its persist stage), and on_sweep(queued) after every sweep.
+    Connection and pipeline errors propagate so the caller can reconnect.
+    """
+    if use_idle is None:
+        use_idle = getattr(settings, "EMAIL_IMAP_IDLE", True)
+    poll_interval = poll_interval or getattr(settings, "EMAIL_POLL_INTERVAL", 60)
+    idle_renew = idle_renew or getattr(settings, "EMAIL_IMAP_IDLE_RENEW_SECONDS", 540)
+
+    if use_idle and b"IDLE" not in client.capabilities():
+        logger.warning(f"IMAP server does not support IDLE, polling every {poll_interval}s")
+        use_idle = False
+    logger.info(f"Watching {folder} for {account_key} with {'IDLE' if use_idle else 'polling'}")
+
+    owns_pipeline = pipeline is None
+    if owns_pipeline:
+        pipeline = MailIngestPipeline(on_persisted=on_processed).start()
+    try:
+        while True:
+            queued = ingest_new_messages(client, account_key, folder, pipeline)
+            if on_sweep:
+                on_sweep(queued)
+            if queued:
+                logger.debug(f"Mail pipeline after queueing {queued} emails: {pipeline.stats()}")
+            if should_stop and should_stop():
+                break
+
+            if use_idle:
+                if not wait_for_new_mail(client, idle_renew, should_stop=should_stop):
+                    logger.debug("IDLE renewed without new mail")
+            else:
+                logger.debug(f"Sleeping {poll_interval}s before next check")
+                time.sleep(poll_interval)
+    finally:
+        if owns_pipeline:
+            pipeline.close()
+    # flag what the pipeline stored after the last sweep
+    flag_stored_messages(client, pipeline, account_key, folder, current_uidvalidity(client, folder))
@@ -0,0 +1,59 @@
+"""Transactional outbox relay: publishes ticket dispatches to Celery after the ticket is committed."""
+
+import logging
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from tickets.models import TicketOutbox
+from tickets.utils.triage import triage_ticket_task
+from servicenow.utils.task import enqueue_ticket_creation
+
+logger = logging.getLogger(__name__)
+
+
+def relay_ticket_outbox(batch_size=None):
+    """
+    Publish up to batch_size outbox rows to Celery, oldest first.
+    Rows are only removed once publishing succeeded, so a broker outage delays
+    dispatch but never loses it. create_incident rows are deleted then; the
+    leased creation is retried by the ServiceNow sweep. Triage rows are only
+    marked dispatched: triage_ticket_task deletes them when it commits, and a
+    row still here after TICKET_TRIAGE_TIMEOUT_SECONDS is sent again, so a lost
+    task cannot leave a ticket triaging. Returns the number of rows relayed.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "TICKET_OUTBOX_BATCH_SIZE", 500)
+    now = timezone.now()
+    redispatch_before = now - timedelta(seconds=getattr(settings, "TICKET_TRIAGE_TIMEOUT_SECONDS", 300))
+
+    with transaction.atomic():
+        # skip rows another relay is publishing right now
+        messages = list(
+            TicketOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(dispatched_at__isnull=True) | Q(dispatched_at__lte=redispatch_before))
+            .order_by("id")[:batch_size]
+        )
+        if not messages:
+            return 0
+
+        create_ids = [m.ticket_id for m in messages if m.task == "create_incident"]
+        triage_ids = [m.ticket_id for m in messages if m.task == "triage"]
+        if create_ids:
+            enqueue_ticket_creation(list(dict.fromkeys(create_ids)))
+        for ticket_id in dict.fromkeys(triage_ids):
+            triage_ticket_task.delay(ticket_id)
+
+        TicketOutbox.objects.filter(id__in=[m.id for m in messages if m.task != "triage"]).delete()
+        TicketOutbox.objects.filter(id__in=[m.id for m in messages if m.task == "triage"]).update(dispatched_at=now)
+
+    logger.info(f"Relayed {len(messages)} outbox messages to Celery")
+    return len(messages)
+
+
+@shared_task
+def relay_ticket_outbox_task():
+    while relay_ticket_outbox() >= getattr(settings, "TICKET_OUTBOX_BATCH_SIZE", 500):
+        pass
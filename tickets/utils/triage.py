@@ -0,0 +1,74 @@
+"""Ticket classification shared by the synchronous web path and the async triage stage."""
+
+import logging
+from celery import shared_task
+from django.db import transaction
+from ai.views import triage
+from servicenow.utils.groupresolver import get_group_resolver
+from servicenow.utils.retry import mark_ticket_failed
+from tickets.models import Ticket, TicketOutbox
+
+logger = logging.getLogger(__name__)
+
+
+# Fill category, priority, confidences and assignment group on an unsaved or triaging ticket
+def apply_ticket_triage(ticket, prediction=None):
+    try:
+        if prediction is None:
+            prediction = triage(ticket.title + " " + ticket.description)
+        ticket.category = prediction["category"].strip().lower()
+        ticket.category_confidence = round(prediction["category_confidence"],4)*100
+        ticket.priority = prediction["priority"]
+        ticket.priority_confidence = round(prediction["priority_confidence"],4)*100
+        logger.info(f"Predicted category: {ticket.category}, Predicted category confidence: {ticket.category_confidence}, Predicted priority: {ticket.priority}, Predicted priority confidence: {ticket.priority_confidence}")
+    except Exception as e:
+        logger.error(f"ML prediction failed: {e}")
+        if not ticket.category:
+            ticket.category = "application"
+        if not ticket.priority:
+            ticket.priority = "high"
+
+    group = get_group_resolver().resolve(ticket.category)
+    if group:
+        ticket.assigned_team_id = group.id
+        ticket.assignment_group_id = group.servicenow_group_id
+    return ticket
+
+
+@shared_task(bind=True,)
+def triage_ticket_task(self, ticket_id):
+    """
+    Celery task that classifies a ticket saved in the triaging state, then
+    hands it over to the ServiceNow sync through the outbox, in the same
+    transaction as the triage result and the removal of its triage outbox row.
+    If triage fails the ticket is marked failed, so it leaves the triaging
+    state and the ServiceNow retry sweep creates it with default values.
+    """
+    ticket = Ticket.objects.filter(id=ticket_id).first()
+    if ticket is None or ticket.ticket_creation_status != "triaging":
+        logger.debug(f"Ticket #{ticket_id} already triaged")
+        TicketOutbox.objects.filter(ticket_id=ticket_id, task="triage").delete()
+        return
+
+    logger.info(f"Celery triaging ticket {ticket.id}")
+    fields = ["category", "category_confidence", "priority", "priority_confidence",
+              "assigned_team_id", "assignment_group_id"]
+    try:
+        apply_ticket_triage(ticket)
+        ticket.ticket_creation_status = "pending"
+        fields.append("ticket_creation_status")
+    except Exception as e:
+        logger.exception(f"Triage of ticket #{ticket.id} failed")
+        ticket.category = ticket.category or "application"
+        ticket.priority = ticket.priority or "high"
+        mark_ticket_failed(ticket, e)
+        fields += ["ticket_creation_status", "sync_attempts", "last_sync_attempt", "next_attempt_at", "error_message"]
+
+    with transaction.atomic():
+        # a redelivered task finds the ticket no longer triaging and stops above
+        updated = Ticket.objects.filter(id=ticket.id, ticket_creation_status="triaging").update(
+            **{field: getattr(ticket, field) for field in fields}
+        )
+        TicketOutbox.objects.filter(ticket_id=ticket.id, task="triage").delete()
+        if updated and ticket.ticket_creation_status == "pending":
+            TicketOutbox.objects.create(ticket_id=ticket.id, task="create_incident")
@@ -2,7 +2,7 @@ import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Ticket, EmailTicket
+from .models import Ticket, EmailTicket, RawEmail, TicketOutbox
 from django.core.paginator import Paginator
 from django.utils import timezone
 from django.db.models import Q
@@ -14,9 +14,9 @@ from django.core.exceptions import PermissionDenied
 from django.views.decorators.http import require_POST
 from django.core.exceptions import ValidationError
 from tickets.utils.task  import send_email_replay_with_ticket
-from ai.views import predict_category, predict_category_confidence, predict_priority, predict_priority_confidence
-from servicenow.utils.task import process_ticket_task
+from tickets.utils.triage import apply_ticket_triage
 from servicenow.models import AssignmentGroup
+from servicenow.utils.groupresolver import get_group_resolver
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -30,40 +30,26 @@ def ticket_create(request):
         form = TicketForm(request.POST)
         if form.is_valid():
             ticket = form.save(commit=False)
-            # Predict category
-            try:
-                ai_input_txt = ticket.title + " " + ticket.description
-                ticket.category = predict_category(ai_input_txt).strip().lower()
-                predict_category_confidence_value = predict_category_confidence(ai_input_txt)
-                if predict_category_confidence_value is not None:
-                    ticket.category_confidence = round(predict_category_confidence_value,4)*100
-                ticket.priority = predict_priority(ai_input_txt)
-                predict_priority_confidence_value =predict_priority_confidence(ai_input_txt)
-                if predict_priority_confidence_value is not None:
-                    ticket.priority_confidence = round(predict_priority_confidence_value,4)*100
-                logger.info(f"Predicted category: {ticket.category}, Predicted category confidence: {ticket.category_confidence}, Predicted priority: {ticket.priority}, Predicted priority confidence: {ticket.priority_confidence}")
-            except Exception as e:
-                logger.error(f"ML prediction failed: {e}")
-                if not ticket.category:
-                    ticket.category = "application"
-                if not ticket.priority:
-                    ticket.priority = "high"
-
-            group = AssignmentGroup.objects.filter(category=ticket.category.lower()).first()
-            if group:
-                ticket.assigned_team = group
-            ticket.assignment_group_id = group.servicenow_group_id
-            ticket.ticket_creation_status = "pending"
             ticket.created_by = request.user
-            ticket.save()
 
-            logger.info(f"Ticket #{ticket.id} created")
+            # classify in the background and let the processing page poll for the result
+            # the outbox row commits with the ticket; the relay hands it to Celery
+            if getattr(settings, "TICKET_ASYNC_TRIAGE", False):
+                ticket.ticket_creation_status = "triaging"
+                with transaction.atomic():
+                    ticket.save()
+                    TicketOutbox.objects.create(ticket=ticket, task="triage")
+                logger.info(f"Ticket #{ticket.id} created, triage queued")
+                return redirect("tickets:ticket_processing", ticket_id=ticket.id)
+
+            # Predict category and priority
+            apply_ticket_triage(ticket)
+            ticket.ticket_creation_status = "pending"
+            with transaction.atomic():
+                ticket.save()
+                TicketOutbox.objects.create(ticket=ticket, task="create_incident")
 
-            try:
-                process_ticket_task.delay(ticket.id)
-            except Exception: 
-                error = ticket.error_message
-                logger.error(f"ServiceNow Error: {error}")
+            logger.info(f"Ticket #{ticket.id} created")
 
             # Redirect to waiting page that will poll for status
             return redirect("tickets:ticket_processing", ticket_id=ticket.id)
@@ -74,76 +60,80 @@ def ticket_create(request):
 
     return render(request, "tickets/submit_issues.html", {"form": form})
 
-# create ticket from email
-def email_ticket_create(email_uid, sender, subject, body, raw_email, user, account_key):
-    logger.info("Email ticket view accessed.")
-
-    # check if email ticket with uid already exists
-    email_ticket = EmailTicket.objects.filter(uid=email_uid).first()
-    if email_ticket and email_ticket.ticket:
-        logger.debug(f"Email ticket with UID {email_uid} already exists.")
-        return email_ticket.ticket, email_ticket
-
-    # create the ticket if not exists
-    ai_input_txt = subject + " " + body
-    predicted_category = predict_category(ai_input_txt).strip().lower()
-    predicted_category_confidence_value = predict_category_confidence(ai_input_txt)
-    if predicted_category_confidence_value is not None:
-        predicted_category_confidence=round(predicted_category_confidence_value,4)*100
-    predicted_priority = predict_priority(ai_input_txt)
-    predicted_priority_confidence_value = predict_priority_confidence(ai_input_txt)
-    if predicted_priority_confidence_value is not None:
-        predicted_priority_confidence=round(predicted_priority_confidence_value,4)*100
+# build an unsaved ticket for an email from its triage prediction
+def build_email_ticket(subject, body, user, prediction):
+    predicted_category = prediction["category"].strip().lower()
+    predicted_category_confidence = round(prediction["category_confidence"],4)*100
+    predicted_priority = prediction["priority"]
+    predicted_priority_confidence = round(prediction["priority_confidence"],4)*100
     logger.info(f"Predicted category: {predicted_category}, Predicted category confidence: {predicted_category_confidence}, Predicted priority: {predicted_priority}, Predicted priority confidence: {predicted_priority_confidence}")
 
-    group = AssignmentGroup.objects.filter(category=predicted_category.lower()).first()
-    if group:
-        assigned_team = group
+    group = get_group_resolver().resolve(predicted_category)
+    return Ticket(
+        title=subject[:200] if subject else "No subject",
+        description=body or "",
+        category=predicted_category or "Application",
+        category_confidence=predicted_category_confidence,
+        priority=predicted_priority,
+        priority_confidence=predicted_priority_confidence,
+        assigned_team_id = group.id if group else None,
+        assignment_group_id = group.servicenow_group_id if group else None,
+        created_by=user,
+        request_type="email",
+        ticket_creation_status = "pending",
+    )
 
-    logger.debug(f"Creating ticket for email UID {email_uid} from sender {sender}")
-    with transaction.atomic():
-        ticket = Ticket.objects.create(
-            title=subject[:200] if subject else "No subject",
-            description=body or "",
-            category=predicted_category or "Application",
-            category_confidence=predicted_category_confidence,
-            priority=predicted_priority,
-            priority_confidence=predicted_priority_confidence,
-            assigned_team = assigned_team,
-            assignment_group_id = group.servicenow_group_id,
-            created_by=user,  
-            request_type="email",
-            ticket_creation_status = "pending",
-        )
-    logger.debug(f"Ticket #{ticket.id} created for email UID {email_uid}")
-
-    logger.debug(f"Creating EmailTicket for UID {email_uid}")
-    email_ticket, created = EmailTicket.objects.get_or_create(
-        uid=email_uid,
-        defaults={
-            "sender": sender,
-            "subject": subject,
-            "body": body,
-            "raw_email": raw_email,
-            "ticket": ticket,
-            "received_at": timezone.now(),
-        },
+# create tickets for a batch of triaged emails with one INSERT per table
+def email_tickets_create_batch(emails):
+    """
+    emails: dicts with key, sender, subject, body, raw_email (an unsaved RawEmail
+    or None), user and prediction.
+    Emails whose key is already linked to a ticket are skipped.
+    Returns [(ticket, email_ticket)] for the new ones.
+    """
+    existing = set(
+        EmailTicket.objects.filter(
+            uid__in=[e["key"] for e in emails], ticket__isnull=False
+        ).values_list("uid", flat=True)
     )
-    logger.debug(f"EmailTicket for UID {email_uid} created.")
+    emails = [e for e in emails if e["key"] not in existing]
+    if not emails:
+        return []
 
-    logger.debug(f"Linking EmailTicket UID {email_uid} to Ticket #{ticket.id}")
-    if not created and email_ticket.ticket is None:
-        email_ticket.ticket = ticket
-        email_ticket.save(update_fields=["ticket"])
-        logger.debug(f"Linked EmailTicket UID {email_uid} to Ticket #{ticket.id}")
+    with transaction.atomic():
+        # replace unlinked EmailTicket rows left behind by an interrupted run
+        leftovers = EmailTicket.objects.filter(uid__in=[e["key"] for e in emails], ticket__isnull=True)
+        RawEmail.objects.filter(email_ticket__in=leftovers).delete()
+        leftovers.delete()
+        tickets = Ticket.objects.bulk_create(
+            [build_email_ticket(e["subject"], e["body"], e["user"], e["prediction"]) for e in emails]
+        )
+        TicketOutbox.objects.bulk_create(
+            [TicketOutbox(ticket=ticket, task="create_incident") for ticket in tickets]
+        )
+        # compressed sources go to their own table; the email rows only reference them
+        RawEmail.objects.bulk_create([e["raw_email"] for e in emails if e["raw_email"] is not None])
+        email_tickets = EmailTicket.objects.bulk_create(
+            [
+                EmailTicket(
+                    uid=e["key"],
+                    sender=e["sender"],
+                    subject=e["subject"],
+                    body=e["body"],
+                    raw_message=e["raw_email"],
+                    ticket=ticket,
+                    received_at=timezone.now(),
+                )
+                for e, ticket in zip(emails, tickets)
+            ]
+        )
+    logger.debug(f"Created {len(tickets)} tickets from emails")
 
     try:
-        process_ticket_task.delay(ticket.id)
         send_email_replay_with_ticket.delay()
-    except Exception: 
-        error = ticket.error_message
-        logger.error(f"Error: {error}")
-    return ticket, email_ticket
+    except Exception as e:
+        logger.error(f"Error: {e}")
+    return list(zip(tickets, email_tickets))
 
 # Ticket processing view - shows status while syncing
 @login_required
@@ -153,7 +143,7 @@ def ticket_processing(request, ticket_id):
     # If already processed, redirect to appropriate page
     if ticket.ticket_creation_status == "created":
         return redirect("tickets:ticket_success", ticket_id=ticket.id)
-    elif ticket.ticket_creation_status == "failed":
+    elif ticket.ticket_creation_status in ["failed", "dead_letter"]:
         return redirect("tickets:ticket_error", ticket_id=ticket.id)
 
     context = {"ticket": ticket, "ticket_number": ticket.servicenow_ticket_number}
@@ -204,16 +194,21 @@ def check_ticket_status_api(request, ticket_id):
 def retry_ticket(request, ticket_id):
     ticket = get_object_or_404(Ticket, id=ticket_id)
 
-    if ticket.ticket_creation_status in ["failed", "pending"]:
-        ticket.sync_attempts +=1
+    if ticket.ticket_creation_status in ["failed", "pending", "dead_letter"]:
+        if ticket.ticket_creation_status == "dead_letter":
+            # a fresh attempt budget, or the next failure would dead-letter it again without backoff
+            ticket.sync_attempts = 0
+            ticket.lease_token = None
+            ticket.lease_expires_at = None
+        else:
+            ticket.sync_attempts +=1
         ticket.ticket_creation_status = "pending"
-        ticket.save()
-
-        try:
-            process_ticket_task.delay(ticket.id)
-        except Exception: 
-            error = ticket.error_message
-            logger.error(f"ServiceNow Error: {error}")
+        ticket.next_attempt_at = None
+        with transaction.atomic():
+            ticket.save(update_fields=[
+                "sync_attempts", "ticket_creation_status", "next_attempt_at", "lease_token", "lease_expires_at",
+            ])
+            TicketOutbox.objects.create(ticket=ticket, task="create_incident")
         return redirect("tickets:ticket_processing", ticket_id=ticket_id)
     else:
         messages.info(